@@ -0,0 +1,97 @@
+"""
+Benchmark of the journaled job database.
+
+Submits jobs and status changes from several threads, then reports the
+throughput, the number of fsyncs, the write amplification (bytes written
+to the disk per journaled byte, from /proc/self/io) and the time needed to
+replay the journal on startup.
+
+Usage: python benchmark/journal.py [--jobs 2000] [--updates 4]
+[--threads 16]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+
+from packages.File import File  # noqa: E402
+from utils.database import Database  # noqa: E402
+
+
+def disk_write_bytes() -> int:
+    """
+    Returns the bytes this process caused to be written to the disk
+    :return: The bytes or 0 if not available
+    """
+    try:
+        with open("/proc/self/io", "r") as file:
+            for line in file:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--updates", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for folder in ["moduleDatabase", "jobDatabase", "audioInput"]:
+            os.makedirs(os.path.join("data", folder))
+        # Keep everything in the journal to measure the replay
+        os.environ["journal_compact_size"] = str(2 ** 40)
+        os.environ["journal_compact_interval"] = str(2 ** 40)
+        database = Database()
+        module = File()
+        database.add_module(module)
+
+        def submit(index: int):
+            uid = f"job-{index}"
+            database.add_job(File.Entry(module, uid, 1, time=time.time()))
+            for update in range(args.updates):
+                # Downloading, Ready, Prepared, Processed
+                database.change_job_entry(uid, "status",
+                                          [6, 7, 1, 2][update % 4])
+
+        written = disk_write_bytes()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            list(executor.map(submit, range(args.jobs)))
+        database.journal.sync()
+        elapsed = time.perf_counter() - start
+        written = disk_write_bytes() - written
+        records = args.jobs * (args.updates + 1)
+        journal_bytes = database.journal.bytes_written
+
+        start = time.perf_counter()
+        recovered = Database()
+        recovery = time.perf_counter() - start
+        assert recovered.queue.qsize() == args.jobs
+
+        start = time.perf_counter()
+        recovered.compact()
+        compaction = time.perf_counter() - start
+
+    print(f"records:             {records}")
+    print(f"throughput:          {records / elapsed:.0f} records/s")
+    print(f"fsyncs:              {database.journal.syncs}")
+    print(f"journal bytes:       {journal_bytes}")
+    if written:
+        print(f"write amplification: {written / journal_bytes:.2f}")
+    print(f"recovery time:       {recovery * 1000:.1f} ms")
+    print(f"compaction time:     {compaction * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Load test of the whole service with a stand-in Whisper model.
+
+Replaces the Whisper model of pywhispercpp with a fake that sleeps in
+proportion to the audio length and returns synthetic segments, and ffmpeg
+with a reader for the generated WAV files, so it runs without network, model
+or ffmpeg. Stores finished jobs first and measures the startup time, then
+drives the Flask app with concurrent clients that submit a file, poll its
+status and fetch the captions. Reports the throughput, p50/p99 latency of
+each endpoint, queue wait, dispatch latency and memory growth.
+
+Usage: python benchmark/load_test.py [--jobs 200] [--clients 16]
+[--workers 4] [--audio 60] [--rtf 0.01] [--stored 10000] [--poll 0.05]
+"""
+import argparse
+import base64
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import numpy as np
+import psutil
+import pywhispercpp.model
+import pywhispercpp.utils
+from pywhispercpp.model import Segment
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src"))
+
+SAMPLE_RATE = 16000
+
+
+class FakeModel:
+    """
+    Stand-in for pywhispercpp.model.Model. Sleeps rtf seconds per second of
+    audio and returns one segment per segment_length seconds
+    """
+    rtf: float = 0.01
+    segment_length: float = 5
+
+    def __init__(self, model: str, models_dir: str | None = None,
+                 **params):
+        self.model: str = model
+
+    def auto_detect_language(self, samples: np.ndarray, offset_ms: int = 0,
+                             n_threads: int = 4):
+        time.sleep(min(len(samples) / SAMPLE_RATE, 30) * FakeModel.rtf)
+        return ("en", 0.99), {"en": 0.99}
+
+    def transcribe(self, media: np.ndarray, n_processors: int | None = None,
+                   new_segment_callback: Callable | None = None,
+                   **params) -> List[Segment]:
+        end = len(media) * 100 // SAMPLE_RATE
+        step = int(FakeModel.segment_length * 100)
+        segments = []
+        for t0 in range(0, end, step):
+            t1 = min(t0 + step, end)
+            time.sleep((t1 - t0) / 100 * FakeModel.rtf)
+            segment = Segment(t0, t1, f" Segment {len(segments) + 1}.")
+            segments.append(segment)
+            if new_segment_callback is not None:
+                new_segment_callback(segment)
+        return segments
+
+
+def extract_wav(input_path: str, output_path: str) -> None:
+    """
+    Stand-in for audio.extract_audio that copies the samples of the 16 kHz
+    mono WAV files of the load test
+    :param input_path: The path of the WAV file
+    :param output_path: The path of the PCM file to create
+    :return: Nothing
+    """
+    with wave.open(input_path, "rb") as wav:
+        frames = wav.readframes(wav.getnframes())
+    with open(output_path + ".tmp", "wb") as file:
+        file.write(frames)
+    os.replace(output_path + ".tmp", output_path)
+
+
+def make_wav(seconds: float, seed: int) -> bytes:
+    """
+    Creates a WAV file of noise, different for each seed so the jobs are
+    not deduplicated
+    :param seconds: The length of the audio
+    :param seed: The seed of the noise
+    :return: The WAV file
+    """
+    samples = np.random.default_rng(seed).integers(
+        -1000, 1000, int(seconds * SAMPLE_RATE), dtype=np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def store_jobs(count: int, seconds: float) -> None:
+    """
+    Stores finished jobs with transcripts, as left by earlier operation
+    :param count: The number of jobs
+    :param seconds: The audio length of each job
+    :return: Nothing
+    """
+    from packages.File import File
+    from utils.database import Database
+    from utils.transcript import Transcript
+
+    database = Database()
+    module = File(module_uid="DefaultFileModule")
+    database.add_module(module)
+    transcript = Transcript.from_segments(
+        Segment(t0, t0 + 500, " Stored segment.")
+        for t0 in range(0, int(seconds * 100), 500))
+    for start in range(0, count, 1000):
+        database.add_jobs([
+            File.Entry(module, f"stored-{index}", 1, status=3,
+                       whisper_result=transcript, whisper_model="fake",
+                       duration=seconds, finished=time.time())
+            for index in range(start, min(start + 1000, count))])
+        database.module_entrys.clear()
+    database.compact()
+    database.journal.close()
+
+
+def percentiles(values: List[float]) -> str:
+    """
+    Formats the p50, p99 and maximum of durations in milliseconds
+    :param values: The durations in seconds
+    :return: The formatted values
+    """
+    if not values:
+        return "-"
+    p50, p99 = np.percentile(values, [50, 99]) * 1000
+    return f"p50 {p50:8.1f} ms  p99 {p99:8.1f} ms  max " \
+           f"{max(values) * 1000:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--audio", type=float, default=60,
+                        help="average audio length in seconds")
+    parser.add_argument("--rtf", type=float, default=0.01,
+                        help="seconds of fake transcription per second of "
+                             "audio")
+    parser.add_argument("--stored", type=int, default=10000,
+                        help="finished jobs stored before the startup")
+    parser.add_argument("--poll", type=float, default=0.05,
+                        help="seconds between two status requests")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+    for folder in ["moduleDatabase", "jobDatabase", "audioInput", "models"]:
+        os.makedirs(os.path.join("data", folder))
+    # Registered like a local ggml model, loaded by the FakeModel
+    open(os.path.join("data", "models", "ggml-fake.bin"), "wb").close()
+    os.environ.update({
+        "whisper_model": "fake",
+        "parallel_workers": str(args.workers),
+        "model_pool_size": str(args.workers),
+        "worker_backend": "thread",
+        "login_username": "benchmark",
+        "login_password": "benchmark",
+        "max_queue_length": str(args.jobs + 1),
+        "max_cpu_usage": str(100 * (os.cpu_count() or 1) + 1),
+        "max_ram_usage": "100",
+        "max_storage_usage": "100",
+    })
+    FakeModel.rtf = args.rtf
+    pywhispercpp.model.Model = FakeModel
+    pywhispercpp.utils.download_model = lambda *args, **kwargs: None
+
+    from utils import audio
+    audio.extract_audio = extract_wav
+    # Everything but the service itself is imported before the startup
+    import flask  # noqa: F401
+    import core.TsApi  # noqa: F401
+
+    store_jobs(args.stored, args.audio)
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    start = time.perf_counter()
+    import app
+    startup = time.perf_counter() - start
+    rss_started = process.memory_info().rss
+    ts_api = app.ts_api
+
+    headers = {"Authorization": "Basic " + base64.b64encode(
+        b"benchmark:benchmark").decode()}
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: List[str] = []
+
+    def request(name: str, method: Callable, url: str, **kwargs):
+        begin = time.perf_counter()
+        response = method(url, headers={**headers,
+                                        **kwargs.pop("headers", {})},
+                          **kwargs)
+        latencies[name].append(time.perf_counter() - begin)
+        return response
+
+    def client(index: int) -> str | None:
+        test_client = app.app.test_client()
+        seconds = args.audio * (0.5 + np.random.default_rng(index).random())
+        response = request("POST /transcribe", test_client.post,
+                           "/transcribe", data={
+                               "priority": "1",
+                               "file": (io.BytesIO(make_wav(seconds, index)),
+                                        "audio.wav")})
+        if response.status_code != 201:
+            errors.append(f"submit {response.status_code}: {response.json}")
+            return None
+        uid = response.json["jobId"]
+        while True:
+            status = request("GET /status", test_client.get,
+                             "/status?id=" + uid).json["status"]
+            if status in ("Whispered", "Failed", "Canceled"):
+                break
+            time.sleep(args.poll)
+        if status != "Whispered":
+            errors.append(f"job {uid}: {status}")
+            return uid
+        response = request("GET /transcribe", test_client.get,
+                           f"/transcribe?id={uid}&format=vtt")
+        request("GET /transcribe (304)", test_client.get,
+                f"/transcribe?id={uid}&format=vtt",
+                headers={"If-None-Match": response.headers["ETag"]})
+        return uid
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        uids = [uid for uid in executor.map(client, range(args.jobs))
+                if uid is not None]
+    elapsed = time.perf_counter() - start
+    test_client = app.app.test_client()
+    request("GET /metrics", test_client.get, "/metrics")
+    request("POST /status/batch", test_client.post, "/status/batch",
+            json={"ids": uids})
+    rss_finished = process.memory_info().rss
+
+    queue_waits = []
+    turnarounds = []
+    audio_seconds = 0
+    for uid in uids:
+        module_entry = ts_api.database.load_job(uid)
+        timings = module_entry.timings
+        if "enqueued" in timings and "dispatched" in timings:
+            queue_waits.append(timings["dispatched"] - timings["enqueued"])
+        if "enqueued" in timings and module_entry.finished:
+            turnarounds.append(module_entry.finished - timings["enqueued"])
+        audio_seconds = audio_seconds + (module_entry.duration or 0)
+
+    print(f"stored jobs:         {args.stored}")
+    print(f"startup time:        {startup * 1000:.1f} ms")
+    print(f"jobs:                {len(uids)} ({len(errors)} errors)")
+    print(f"throughput:          {len(uids) / elapsed:.2f} jobs/s, "
+          f"{audio_seconds / elapsed:.1f} audio s/s")
+    for name, values in sorted(latencies.items()):
+        print(f"{name:21s}{len(values):6d}  {percentiles(values)}")
+    print(f"queue wait:          {percentiles(queue_waits)}")
+    print(f"turnaround:          {percentiles(turnarounds)}")
+    dispatch = ts_api.dispatch_latency()
+    print(f"dispatch latency:    avg {dispatch['avg'] * 1000:.1f} ms, "
+          f"max {dispatch['max'] * 1000:.1f} ms")
+    print(f"memory:              {rss_before / 1000000:.1f} MB before, "
+          f"+{(rss_started - rss_before) / 1000000:.1f} MB startup, "
+          f"+{(rss_finished - rss_started) / 1000000:.1f} MB load")
+    for error in errors[:10]:
+        print("error: " + error)
+    sys.stdout.flush()
+
+    # The scheduler thread is not a daemon
+    ts_api.running = False
+    with ts_api.scheduler:
+        ts_api.scheduler.notify_all()
+    os.chdir("/")
+    shutil.rmtree(directory, ignore_errors=True)
+    os._exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    threading.current_thread().name = "load-test"
+    main()
@@ -1,18 +1,17 @@
+import json
 import logging
 import os
 import uuid
-import tempfile
-import psutil
 
-from flask import Flask, request, send_file
+from flask import Flask, Response, request, stream_with_context
 from werkzeug.datastructures import FileStorage, Authorization
-from pywhispercpp.utils import output_vtt, output_csv, output_srt, output_txt
 
 from packages.File import File
 from packages.Opencast import Opencast
 from packages.Default import Default
-from utils import util
+from utils import captions, metrics, util
 from core.TsApi import TsApi
+from core.UploadManager import UploadNotFound, UploadOffsetMismatch
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -52,6 +51,8 @@ def transcribe_post():
     module_id: str = request.form.get("module_id")
     link: str = request.form.get("link")
     title: str = request.form.get("title") if "title" in request.form else None
+    callback_url: str = request.form.get("callback_url") or None
+    model: str = request.form.get("model") or None
 
     if ('file' not in request.files) and (not (module and module_id and link)):
         return {"error": "No file or link with module and module id"}, 415
@@ -59,23 +60,17 @@ def transcribe_post():
     if not priority or not priority.isnumeric():
         return {"error": "Priority nan"}, 400
 
-    # Self-care system
-    ram_usage = round(psutil.virtual_memory().percent, 1)
-    cpu_usage = round(psutil.cpu_percent(interval=0.5))
-    storage_total = round(psutil.disk_usage('./').total / 1000000000, 1)
-    storage_usage = round(psutil.disk_usage('./').used / 1000000000, 1)
-
-    if 100 / storage_total * storage_usage > 90:
-        return {"error": "Not enough storage"}, 507
-
-    if ram_usage > 90:
-        return {"error": "Not enough ram"}, 507
+    if callback_url and not util.is_http_url(callback_url):
+        return {"error": "Callback url must be http or https"}, 400
 
-    if cpu_usage > 400:
-        return {"error": "Not enough cpu"}, 507
+    if model and model not in ts_api.model_router.allowed:
+        return {"error": "Model not allowed"}, 400
 
-    if ts_api.database.queue.qsize() > 50:
-        return {"error": "The queue is full"}, 507
+    # Self-care system
+    error = ts_api.resource_monitor.admission()
+    if error:
+        return {"error": error}, 507, {
+            "Retry-After": str(ts_api.resource_monitor.retry_after())}
 
     # Old File.py upload
     if 'file' in request.files:
@@ -84,11 +79,13 @@ def transcribe_post():
             File.Entry(ts_api.file_module,
                        uid,
                        int(priority),
-                       initial_prompt=title
+                       initial_prompt=title,
+                       callback_url=callback_url,
+                       whisper_model=model
                        )
         )
         module_entry.queuing(ts_api, file)
-        return {"jobId": uid}, 201
+        return {"jobId": uid, "eta": job_eta(uid)}, 201
     # Insert modules here
     elif module and module_id:
         if module == "opencast" and link:
@@ -99,19 +96,232 @@ def transcribe_post():
                                    uid,
                                    link,
                                    int(priority),
-                                   initial_prompt=title
+                                   initial_prompt=title,
+                                   callback_url=callback_url,
+                                   whisper_model=model
                                    )
                 )
                 if module_entry.queuing(ts_api):
-                    return {"jobId": uid}, 201
+                    return {"jobId": uid, "eta": job_eta(uid)}, 201
                 else:
-                    return {"error": "Max Opencast Queue length reached"}, 429
+                    return ({"error": "Max Opencast Queue length reached"},
+                            429, {"Retry-After": module_retry_after()})
             else:
                 return {"error": "Module ID not found"}, 400
         else:
             return {"error": "Module not found"}, 400
 
 
+def job_eta(uid: str) -> int | None:
+    """
+    Predicts the seconds until a job is finished
+    :param uid: The uid of the job
+    :return: The seconds or None if the job is not queued or running
+    """
+    eta = ts_api.estimator.eta(uid)
+    return round(eta) if eta is not None else None
+
+
+def module_retry_after() -> str:
+    """
+    Predicts the seconds until a module has room for another job
+    :return: The value of the Retry-After header
+    """
+    return str(max(int(ts_api.estimator.next_finish() + 0.999), 1))
+
+
+@app.route("/transcribe/batch", methods=['POST'])
+def transcribe_batch_post():
+    """
+    Endpoint to accept many links of a module in one request. The jobs are
+    accepted or rejected together
+    :return: HttpResponse
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("items"), list):
+        return {"error": "No JSON object with items"}, 415
+    items: list = data["items"]
+    max_size = int(os.environ.get("batch_max_size", 1000))
+    if not items:
+        return {"error": "No items"}, 400
+    if len(items) > max_size:
+        return {"error": f"More than {max_size} items"}, 413
+    if data.get("module") != "opencast":
+        return {"error": "Module not found"}, 400
+    module = ts_api.database.modules.get(data.get("module_id"))
+    if not isinstance(module, Opencast):
+        return {"error": "Module ID not found"}, 400
+
+    module_entries: list[Opencast.Entry] = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("link"):
+            return {"error": f"Item {index}: No link"}, 400
+        for field in ("link", "title", "callback_url", "model"):
+            if item.get(field) is not None and not isinstance(item[field],
+                                                              str):
+                return {"error": f"Item {index}: {field} must be a "
+                                 f"string"}, 400
+        priority = str(item.get("priority", ""))
+        if not priority.isnumeric():
+            return {"error": f"Item {index}: Priority nan"}, 400
+        callback_url = item.get("callback_url") or None
+        if callback_url and not util.is_http_url(callback_url):
+            return {"error": f"Item {index}: Callback url must be http or "
+                             f"https"}, 400
+        model = item.get("model") or None
+        if model and model not in ts_api.model_router.allowed:
+            return {"error": f"Item {index}: Model not allowed"}, 400
+        module_entries.append(Opencast.Entry(module,
+                                             str(uuid.uuid4()),
+                                             item["link"],
+                                             int(priority),
+                                             initial_prompt=item.get("title"),
+                                             callback_url=callback_url,
+                                             whisper_model=model))
+
+    # Self-care system
+    error = ts_api.resource_monitor.admission(len(module_entries))
+    if error:
+        return {"error": error}, 507, {
+            "Retry-After": str(ts_api.resource_monitor.retry_after())}
+    if not module.queuing_batch(ts_api, module_entries):
+        return ({"error": "Max Opencast Queue length reached"}, 429,
+                {"Retry-After": module_retry_after()})
+    return {"jobIds": [module_entry.uid
+                       for module_entry in module_entries]}, 201
+
+
+@app.route("/transcribe/upload", methods=['POST'])
+def transcribe_upload_post():
+    """
+    Endpoint to start a resumable upload of a file to whisper
+    :return: HttpResponse
+    """
+    uid: str = str(uuid.uuid4())
+    priority: str = request.form.get("priority")
+    title: str = request.form.get("title") if "title" in request.form else None
+    callback_url: str = request.form.get("callback_url") or None
+    length: str = request.form.get("length")
+    model: str = request.form.get("model") or None
+
+    if not priority or not priority.isnumeric():
+        return {"error": "Priority nan"}, 400
+
+    if length is not None and not length.isnumeric():
+        return {"error": "Length nan"}, 400
+
+    if callback_url and not util.is_http_url(callback_url):
+        return {"error": "Callback url must be http or https"}, 400
+
+    if model and model not in ts_api.model_router.allowed:
+        return {"error": "Model not allowed"}, 400
+
+    # Self-care system
+    error = ts_api.resource_monitor.admission()
+    if error:
+        return {"error": error}, 507, {
+            "Retry-After": str(ts_api.resource_monitor.retry_after())}
+
+    try:
+        ts_api.uploads.create(uid,
+                              {"priority": int(priority),
+                               "title": title,
+                               "callback_url": callback_url,
+                               "model": model},
+                              int(length) if length is not None else None)
+    except ValueError as e:
+        return {"error": str(e)}, 413
+    return {"uploadId": uid, "offset": 0}, 201, {"Upload-Offset": "0"}
+
+
+@app.route("/transcribe/upload", methods=['PATCH'])
+def transcribe_upload_patch():
+    """
+    Endpoint to append the raw request body to an upload at the offset
+    given in the Upload-Offset header
+    :return: HttpResponse
+    """
+    upload = ts_api.uploads.get(request.args.get("id", ""))
+    if upload is None:
+        return {"error": "Upload not found"}, 404
+    offset: str = request.headers.get("Upload-Offset", "")
+    if not offset.isnumeric():
+        return {"error": "Upload-Offset nan"}, 400
+    try:
+        offset = ts_api.uploads.append(upload, int(offset), request.stream)
+    except UploadOffsetMismatch as e:
+        return ({"error": str(e), "offset": e.offset}, 409,
+                {"Upload-Offset": str(e.offset)})
+    except ValueError as e:
+        return ({"error": str(e), "offset": upload.offset}, 413,
+                {"Upload-Offset": str(upload.offset)})
+    return "", 204, {"Upload-Offset": str(offset)}
+
+
+@app.route("/transcribe/upload", methods=['GET'])
+def transcribe_upload_get():
+    """
+    Endpoint to get the bytes received of an upload, to resume it
+    :return: HttpResponse
+    """
+    upload = ts_api.uploads.get(request.args.get("id", ""))
+    if upload is None:
+        return {"error": "Upload not found"}, 404
+    return ({"uploadId": upload.uid, "offset": upload.offset,
+             "length": upload.length}, 200,
+            {"Upload-Offset": str(upload.offset)})
+
+
+@app.route("/transcribe/upload", methods=['DELETE'])
+def transcribe_upload_delete():
+    """
+    Endpoint to abort an upload
+    :return: HttpResponse
+    """
+    upload = ts_api.uploads.get(request.args.get("id", ""))
+    if upload is None:
+        return {"error": "Upload not found"}, 404
+    ts_api.uploads.abort(upload)
+    return "OK", 200
+
+
+@app.route("/transcribe/upload/finalize", methods=['POST'])
+def transcribe_upload_finalize():
+    """
+    Endpoint to queue the job of a complete upload
+    :return: HttpResponse
+    """
+    upload = ts_api.uploads.get(request.args.get("id", ""))
+    if upload is None:
+        return {"error": "Upload not found"}, 404
+
+    # Self-care system, the upload is kept to finalize it later
+    error = ts_api.resource_monitor.admission()
+    if error:
+        return {"error": error}, 507, {
+            "Retry-After": str(ts_api.resource_monitor.retry_after())}
+
+    try:
+        metadata, media_hash = ts_api.uploads.finish(upload)
+    except UploadNotFound:
+        return {"error": "Upload not found"}, 404
+    except ValueError as e:
+        return ({"error": str(e), "offset": upload.offset}, 409,
+                {"Upload-Offset": str(upload.offset)})
+    module_entry: File.Entry = (
+        File.Entry(ts_api.file_module,
+                   upload.uid,
+                   metadata["priority"],
+                   initial_prompt=metadata["title"],
+                   callback_url=metadata["callback_url"],
+                   whisper_model=metadata.get("model"),
+                   media_hash=media_hash
+                   )
+    )
+    module_entry.queuing(ts_api)
+    return {"jobId": upload.uid, "eta": job_eta(upload.uid)}, 201
+
+
 @app.route("/transcribe", methods=['GET'])
 def transcribe_get():
     """
@@ -120,29 +330,21 @@ def transcribe_get():
     """
     req_id = request.args.get("id")
     output_format = request.args.get("format")
-    output_formats = ["vtt", "srt", "txt", "csv"]
     if ts_api.database.exists_job(req_id):
         job_data: Default.Entry = ts_api.database.load_job(req_id)
-        if job_data.status >= 2:  # Whispered
-            if output_format in output_formats:
-                writers = {
-                    "vtt": output_vtt,
-                    "srt": output_srt,
-                    "txt": output_txt,
-                    "csv": output_csv,
-                }
+        if 2 <= job_data.status <= 5:  # Processed to Canceled
+            if output_format in captions.MIMETYPES:
                 try:
-                    with (tempfile.NamedTemporaryFile(suffix="."
-                          + output_format) as
-                          tmp):
-                        tmp_path = tmp.name
-                        writers[output_format](
-                            job_data.whisper_result, tmp_path)
-                        return send_file(tmp_path, mimetype="text/vtt")
+                    caption = ts_api.captions.get(req_id, output_format,
+                                                  ts_api.database)
                 except Exception as e:
                     logging.debug(e)
                     return {"error": "Error while generating File: "
                                      + str(e)}, 500
+                if caption is None:
+                    return {"error": "Job not whispered yet"}, 200
+                ts_api.database.touch(req_id)
+                return caption_response(caption, output_format)
             else:
                 return {"error": "Output format not supported"}, 200
         else:
@@ -151,6 +353,34 @@ def transcribe_get():
         return {"error": "Job not found"}, 404
 
 
+def caption_response(caption: captions.Caption,
+                     output_format: str) -> Response:
+    """
+    Creates the response for rendered captions. Clients that already have
+    them get 304 Not Modified, gzip is used if the client accepts it
+    :param caption: The rendered captions
+    :param output_format: The format of the captions
+    :return: HttpResponse
+    """
+    use_gzip = (os.environ.get("caption_gzip", "true").lower() == "true"
+                and "gzip" in request.headers.get("Accept-Encoding", ""))
+    etag = caption.etag[:-1] + "-gzip\"" if use_gzip else caption.etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache",
+               "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("If-None-Match", "")
+    if if_none_match.strip() == "*" or etag in [
+            tag.strip().removeprefix("W/")
+            for tag in if_none_match.split(",")]:
+        return Response(status=304, headers=headers)
+    body = caption.body
+    if use_gzip:
+        body = ts_api.captions.compressed(caption)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, status=200, headers=headers,
+                    content_type=captions.MIMETYPES[output_format]
+                    + "; charset=utf-8")
+
+
 @app.route("/transcribe", methods=['DELETE'])
 def transcribe_delete():
     """
@@ -161,7 +391,7 @@ def transcribe_delete():
     if ts_api.database.exists_job(req_id):
         job_data: Default.Entry = ts_api.database.load_job(req_id)
         if job_data.status != 2:
-            ts_api.database.delete_job(req_id)
+            ts_api.delete_job(req_id)
             return "OK", 200
         else:
             return {"error": "Job currently processing"}, 200
@@ -169,6 +399,29 @@ def transcribe_delete():
         return {"error": "Job not found"}, 404
 
 
+@app.route("/transcribe/stream", methods=['GET'])
+def transcribe_stream():
+    """
+    Endpoint to follow the segments of a job as Server-Sent Events
+    :return: HttpResponse
+    """
+    req_id = request.args.get("id")
+    if not req_id or not ts_api.database.exists_job(req_id):
+        return {"error": "Job not found"}, 404
+
+    def events():
+        for event in ts_api.live_segments.events(req_id):
+            if event is None:
+                yield ": heartbeat\n\n"
+            else:
+                yield f"event: {event[0]}\ndata: {json.dumps(event[1])}\n\n"
+
+    return Response(stream_with_context(events()),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache",
+                             "X-Accel-Buffering": "no"})
+
+
 # Add Module Routes here
 @app.route("/module/opencast", methods=['POST'])
 def module_opencast_post():
@@ -179,8 +432,26 @@ def module_opencast_post():
     max_queue_length: str = request.form.get("max_queue_length")
     if not max_queue_length:
         return {"error": "No max queue length specified"}, 400
-    module: Opencast = Opencast(max_queue_length=int(max_queue_length))
-    ts_api.database.modules[module.module_uid] = module
+    weight: str = request.form.get("weight", "1")
+    try:
+        if float(weight) <= 0:
+            raise ValueError()
+    except ValueError:
+        return {"error": "Weight must be a positive number"}, 400
+    callback_url: str = request.form.get("callback_url") or None
+    if callback_url and not util.is_http_url(callback_url):
+        return {"error": "Callback url must be http or https"}, 400
+    retention_ttl: str = request.form.get("retention_ttl")
+    try:
+        if retention_ttl is not None and float(retention_ttl) < 0:
+            raise ValueError()
+    except ValueError:
+        return {"error": "Retention ttl must be a non-negative number"}, 400
+    module: Opencast = Opencast(max_queue_length=int(max_queue_length),
+                                weight=float(weight),
+                                callback_url=callback_url,
+                                retention_ttl=retention_ttl)
+    ts_api.database.add_module(module)
     return {"moduleId": module.module_uid}, 201
 
 
@@ -195,33 +466,96 @@ def status():
     if ts_api.database.exists_job(req_id):
         job_data: Default.Entry = ts_api.database.load_job(req_id)
         return {"jobId": req_id,
-                "status": util.get_status(job_data.status)}, 200
+                "status": util.get_status(job_data.status),
+                "eta": job_eta(req_id)}, 200
     else:
         return {"error": "Job not found"}, 404
 
 
+@app.route("/status/batch", methods=['POST'])
+def status_batch():
+    """
+    Endpoint to return the status of many videos in one request
+    :return: HttpResponse
+    """
+    data = request.get_json(silent=True)
+    ids = data.get("ids") if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(req_id, str)
+                                            for req_id in ids):
+        return {"error": "No JSON object with ids"}, 415
+    max_size = int(os.environ.get("batch_max_size", 1000))
+    if len(ids) > max_size:
+        return {"error": f"More than {max_size} ids"}, 413
+    statuses = ts_api.database.job_statuses(ids)
+    return {"jobs": [{"jobId": req_id,
+                      "status": util.get_status(statuses[req_id])}
+                     if req_id in statuses
+                     else {"jobId": req_id, "error": "Job not found"}
+                     for req_id in ids]}, 200
+
+
 @app.route("/status/system", methods=['GET'])
 def system_status():
     """
     Endpoint to return status of system
     :return: HttpResponse
     """
+    snapshot = ts_api.resource_monitor.snapshot
     return {
-        "cpu_usage": round(psutil.cpu_percent(interval=0.5)
-                           * 100 / psutil.cpu_count(), 1),
-        "cpu_cores": psutil.cpu_count(),
-        "ram_usage": round(psutil.virtual_memory().percent, 1),
-        "ram_free": round(psutil.virtual_memory().available
-                          * 100 / psutil.virtual_memory().total, 1),
-        "storage_total": round(psutil.disk_usage('./').total / 1000000000, 1),
-        "storage_usage": round(psutil.disk_usage('./').used / 1000000000, 1),
-        "storage_free": round(psutil.disk_usage('./').free / 1000000000, 1),
-        "swap_usage": round(psutil.swap_memory().percent, 1),
-        "swap_free": round(psutil.swap_memory().free
-                           * 100 / psutil.swap_memory().total, 1),
+        "cpu_usage": round(snapshot["cpu_usage"]
+                           * 100 / snapshot["cpu_cores"], 1),
+        "cpu_cores": snapshot["cpu_cores"],
+        "ram_usage": round(snapshot["ram_usage"], 1),
+        "ram_free": round(snapshot["ram_free"], 1),
+        "storage_total": round(snapshot["storage_total"], 1),
+        "storage_usage": round(snapshot["storage_usage"], 1),
+        "storage_free": round(snapshot["storage_free"], 1),
+        "swap_usage": round(snapshot["swap_usage"], 1),
+        "swap_free": round(snapshot["swap_free"], 1),
         "queue_length": ts_api.database.queue.qsize(),
+        "running_downloads": len(ts_api.prefetcher.downloading),
         "running_jobs": len(ts_api.running_jobs),
-        "parallel_jobs": int(os.environ.get("parallel_workers"))
+        "parallel_jobs": int(os.environ.get("parallel_workers")),
+        "dispatch_latency": ts_api.dispatch_latency(),
+        "workers": ts_api.worker_pool.status() if ts_api.worker_pool
+        else [],
+        "modules": ts_api.module_status(),
+        "deduplicated_jobs": ts_api.deduplicator.hits,
+        "retention": {"expired_jobs": ts_api.janitor.expired,
+                      "evicted_jobs": ts_api.janitor.evicted,
+                      "orphaned_files": ts_api.janitor.orphans,
+                      "abandoned_uploads": ts_api.janitor.uploads}
+    }, 200
+
+
+@app.route("/metrics", methods=['GET'])
+def metrics_get():
+    """
+    Endpoint to return the job metrics in the Prometheus text format
+    :return: HttpResponse
+    """
+    gauges = ts_api.metrics.gauges
+    gauges.set(ts_api.database.queue.qsize(), state="queued")
+    gauges.set(len(ts_api.running_jobs), state="running")
+    gauges.set(len(ts_api.prefetcher.downloading), state="downloading")
+    return Response(ts_api.metrics.render(), status=200,
+                    content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/models", methods=['GET'])
+def models_get():
+    """
+    Endpoint to list the local Whisper models and the model routing
+    :return: HttpResponse
+    """
+    router = ts_api.model_router
+    return {
+        "default": router.default,
+        "allowed": sorted(router.allowed),
+        "routing": [str(rule) for rule in router.rules],
+        # Files not hashed yet are listed without checksum
+        "models": [model.to_dict()
+                   for model in ts_api.models.scan(hashing=False).values()]
     }, 200
 
 
@@ -0,0 +1,139 @@
+import heapq
+import logging
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import requests
+
+from packages.Default import Default
+from utils import util
+
+
+class CallbackDispatcher:
+    def __init__(self, ts_api, workers: int = 4, retries: int = 5,
+                 timeout: float = 10):
+        """
+        Creates the dispatcher that POSTs the final status of jobs to their
+        callback url, so clients do not have to poll
+        :param ts_api: The main ts_api object
+        :param workers: The number of callbacks sent at the same time
+        :param retries: The number of retries of a failed callback
+        :param timeout: Seconds to wait for the client
+        """
+        self.ts_api = ts_api
+        self.workers: int = workers
+        self.retries: int = retries
+        self.timeout: float = timeout
+        self.session = requests.Session()
+        self.condition = threading.Condition()
+        # (due time, sequence, url, payload, attempt)
+        self.pending: List[Tuple[float, int, str, Dict, int]] = []
+        self.sequence: int = 0
+        self.delivered: int = 0
+        self.failed: int = 0
+
+    def start_thread(self):
+        """
+        Starts the threads that send the callbacks
+        :return: Nothing
+        """
+        for _ in range(self.workers):
+            callback_thread = threading.Thread(target=self.callback_thread,
+                                               daemon=True)
+            callback_thread.start()
+
+    def notify(self, module_entry: Default.Entry) -> bool:
+        """
+        Schedules the callback of a finished job. The url of the job takes
+        precedence over the default url of its module
+        :param module_entry: The module_entry of the finished job
+        :return: True if a callback was scheduled
+        """
+        url = (getattr(module_entry, "callback_url", None)
+               or getattr(module_entry.module, "callback_url", None))
+        if not url:
+            return False
+        payload = {
+            "jobId": module_entry.uid,
+            "status": util.get_status(module_entry.status),
+            "language": module_entry.whisper_language,
+        }
+        self.schedule(url, payload, 0, time.monotonic())
+        return True
+
+    def schedule(self, url: str, payload: Dict, attempt: int,
+                 due: float) -> None:
+        """
+        Adds a callback to the pending callbacks
+        :param url: The url to POST to
+        :param payload: The JSON body
+        :param attempt: The number of failed attempts so far
+        :param due: The monotonic time to send the callback at
+        :return: Nothing
+        """
+        with self.condition:
+            self.sequence = self.sequence + 1
+            heapq.heappush(self.pending,
+                           (due, self.sequence, url, payload, attempt))
+            self.condition.notify()
+
+    def next_callback(self) -> Tuple[str, Dict, int] | None:
+        """
+        Waits until a pending callback is due
+        :return: The url, payload and attempt or None when stopping
+        """
+        with self.condition:
+            while self.ts_api.running:
+                if not self.pending:
+                    self.condition.wait()
+                    continue
+                delay = self.pending[0][0] - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                _, _, url, payload, attempt = heapq.heappop(self.pending)
+                return url, payload, attempt
+        return None
+
+    def callback_thread(self):
+        """
+        The thread to send the due callbacks
+        :return: Nothing
+        """
+        while self.ts_api.running:
+            callback = self.next_callback()
+            if callback is None:
+                break
+            self.send(*callback)
+
+    def send(self, url: str, payload: Dict, attempt: int) -> bool:
+        """
+        POSTs a callback once and schedules a retry with exponential backoff
+        if the client does not accept it
+        :param url: The url to POST to
+        :param payload: The JSON body
+        :param attempt: The number of failed attempts so far
+        :return: True if the client accepted the callback
+        """
+        try:
+            response = self.session.post(url, json=payload,
+                                         timeout=self.timeout)
+            if response.status_code < 300:
+                with self.condition:
+                    self.delivered = self.delivered + 1
+                return True
+            error = "HTTP " + str(response.status_code)
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        if attempt >= self.retries:
+            logging.error(f"Giving up callback of job with id "
+                          f"{payload['jobId']}: {error}")
+            with self.condition:
+                self.failed = self.failed + 1
+            return False
+        logging.warning(f"Callback of job with id {payload['jobId']} failed,"
+                        f" retrying ({attempt + 1}/{self.retries}): {error}")
+        self.schedule(url, payload, attempt + 1,
+                      time.monotonic() + min(2 ** attempt, 300))
+        return False
@@ -0,0 +1,150 @@
+import threading
+import time
+from typing import List, Tuple
+
+from packages.Default import Default
+
+
+class CompletionEstimator:
+    def __init__(self, ts_api, workers: int = 1, default_speed: float = 1,
+                 default_duration: float = 3600, smoothing: float = 0.1):
+        """
+        Creates the estimator of the backlog in seconds of audio and of the
+        completion time of jobs, based on the observed speed of the workers
+        :param ts_api: The main ts_api object with the queue and running jobs
+        :param workers: The number of jobs transcribed at the same time
+        :param default_speed: Seconds of audio one worker transcribes per
+        second until the first job finished
+        :param default_duration: Seconds of audio assumed for jobs that are
+        not downloaded yet, until the first job finished
+        :param smoothing: Weight of the last job in the moving averages
+        """
+        self.ts_api = ts_api
+        self.workers: int = max(workers, 1)
+        self.speed: float = default_speed
+        self.duration: float = default_duration
+        self.smoothing: float = smoothing
+        self.observed: int = 0
+        self.lock = threading.Lock()
+
+    def record(self, module_entry: Default.Entry) -> None:
+        """
+        Updates the speed and the average duration with a whispered job
+        :param module_entry: The module_entry of the whispered job
+        :return: Nothing
+        """
+        dispatched = module_entry.timings.get("dispatched")
+        if (not module_entry.duration or dispatched is None
+                or module_entry.finished is None
+                or module_entry.finished <= dispatched):
+            return
+        speed = module_entry.duration / (module_entry.finished - dispatched)
+        with self.lock:
+            # The first job replaces the defaults
+            weight = self.smoothing if self.observed else 1
+            self.speed = self.speed + weight * (speed - self.speed)
+            self.duration = self.duration + weight * (
+                module_entry.duration - self.duration)
+            self.observed = self.observed + 1
+
+    def throughput(self) -> float:
+        """
+        Returns the seconds of audio transcribed per second by all workers
+        :return: The throughput
+        """
+        with self.lock:
+            return self.speed * self.workers
+
+    def audio(self, module_entry: Default.Entry, now: float) -> float:
+        """
+        Returns the seconds of audio of a job that are not transcribed yet
+        :param module_entry: The module_entry of a queued or running job
+        :param now: The current time
+        :return: The remaining seconds of audio
+        """
+        duration = module_entry.duration or self.duration
+        dispatched = module_entry.timings.get("dispatched")
+        if module_entry.status in (1, 2) and dispatched is not None:
+            # Prepared or Processed
+            with self.lock:
+                speed = self.speed
+            return max(duration - (now - dispatched) * speed, 0)
+        return duration
+
+    def backlog(self) -> List[Tuple[Default.Entry, float]]:
+        """
+        Returns the queued and running jobs with their remaining audio
+        :return: The jobs and the remaining seconds of audio
+        """
+        now = time.time()
+        queue = self.ts_api.database.queue
+        module_entries = (queue.peek(queue.qsize())
+                          + list(self.ts_api.running_jobs))
+        return [(module_entry, self.audio(module_entry, now))
+                for module_entry in module_entries]
+
+    def wait(self, audio: float = 0) -> float:
+        """
+        Predicts the seconds until the backlog and a new job are finished
+        :param audio: The seconds of audio of the new job, 0 for the wait
+        until it starts
+        :return: The predicted seconds
+        """
+        backlog = sum(remaining for _, remaining in self.backlog())
+        return (backlog + audio) / self.throughput()
+
+    def next_finish(self) -> float:
+        """
+        Predicts the seconds until a running job is finished and frees its
+        place in the queue of its module
+        :return: The predicted seconds
+        """
+        now = time.time()
+        running = [self.audio(module_entry, now)
+                   for module_entry in list(self.ts_api.running_jobs)]
+        with self.lock:
+            if not running:
+                return self.duration / self.speed
+            return min(running) / self.speed
+
+    def eta(self, uid: str) -> float | None:
+        """
+        Predicts the seconds until a queued or running job is finished. The
+        jobs started before it are the running jobs, the downloading and
+        ready jobs of at least its priority and the queued jobs before it
+        in the order the prefetcher prepares them
+        :param uid: The uid of the job
+        :return: The predicted seconds or None if the job is not waiting or
+        running
+        """
+        backlog = self.backlog()
+        job = next((item for item in backlog if item[0].uid == uid), None)
+        if job is None:
+            return None
+        module_entry, remaining = job
+        if module_entry.status in (1, 2):  # Prepared or Processed
+            with self.lock:
+                return remaining / self.speed
+        now = time.time()
+        policy = self.ts_api.scheduling_policy
+        if module_entry.status in (6, 7):  # Downloading or Ready
+            key = policy.key(module_entry, now)
+            ahead = sum(audio for entry, audio in backlog
+                        if entry.status in (1, 2)
+                        or (entry.uid != uid and entry.status in (6, 7)
+                            and policy.key(entry, now) < key))
+            return (ahead + remaining) / self.throughput()
+        queue = self.ts_api.database.queue
+        with self.lock:
+            duration = self.duration
+        order = [entry.uid for entry in queue.order(
+            lambda entry: entry.status == 0,  # Queued
+            queue.qsize(), key=lambda entry: policy.key(entry, now),
+            fair=True, default_duration=duration)]
+        before = set(order[:order.index(uid)] if uid in order else order)
+        ahead = sum(audio for entry, audio in backlog
+                    if entry.status in (1, 2)
+                    or (entry.status in (6, 7)
+                        and entry.priority <= module_entry.priority)
+                    or entry.uid in before)
+        return (ahead + remaining) / self.throughput()
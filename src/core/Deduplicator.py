@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict, List
+
+from packages.Default import Default
+from utils import audio
+
+
+class Deduplicator:
+    def __init__(self, ts_api):
+        """
+        Creates the deduplication of jobs with identical media, model and
+        prompt. Duplicates of finished jobs get the cached result, duplicates
+        of running jobs wait for their result instead of being transcribed
+        :param ts_api: The main ts_api object with the database and queue
+        """
+        self.ts_api = ts_api
+        self.lock = threading.RLock()
+        # Key of the media, model and prompt -> uid of the transcribing job
+        self.in_flight: Dict[str, str] = {}
+        self.keys: Dict[str, str] = {}
+        self.followers: Dict[str, List[Default.Entry]] = {}
+        self.hits: int = 0
+
+    def key(self, module_entry: Default.Entry) -> str:
+        """
+        Returns the key of the work of a job
+        :param module_entry: The module_entry of the job with a media hash
+        :return: The SHA-256 of the media hash, model and prompt
+        """
+        return hashlib.sha256("\0".join([
+            module_entry.media_hash,
+            self.ts_api.model_router.signature(module_entry),
+            module_entry.initial_prompt or ""]).encode()).hexdigest()
+
+    def resolve(self, module_entry: Default.Entry) -> bool:
+        """
+        Checks a counted job whose media hash is known. A duplicate is taken
+        out of the queue and either finished with the cached result or
+        attached to the identical running job
+        :param module_entry: The module_entry of the job
+        :return: True if the job needs no transcription
+        """
+        if os.environ.get("deduplication", "true").lower() != "true":
+            return False
+        key = self.key(module_entry)
+        database = self.ts_api.database
+        with self.lock:
+            source_uid = database.find_result_index(key)
+            if source_uid is not None and source_uid != module_entry.uid:
+                whisper_result = database.load_result(source_uid)
+                if whisper_result is not None:
+                    self.hits = self.hits + 1
+                    logging.info(f"Job with id {module_entry.uid} reuses the "
+                                 f"result of job with id {source_uid}.")
+                    self.detach(module_entry)
+                    self.complete(module_entry,
+                                  database.load_job(source_uid),
+                                  whisper_result)
+                    return True
+            leader_uid = self.in_flight.get(key)
+            if leader_uid is not None and leader_uid != module_entry.uid:
+                self.hits = self.hits + 1
+                logging.info(f"Job with id {module_entry.uid} waits for the "
+                             f"identical job with id {leader_uid}.")
+                self.detach(module_entry)
+                self.followers.setdefault(leader_uid, []).append(
+                    module_entry)
+                return True
+            self.in_flight[key] = module_entry.uid
+            self.keys[module_entry.uid] = key
+            return False
+
+    def detach(self, module_entry: Default.Entry) -> None:
+        """
+        Stores a duplicate as queued job outside of the queue
+        :param module_entry: The module_entry of the duplicate
+        :return: Nothing
+        """
+        database = self.ts_api.database
+        database.queue.remove(module_entry.uid)
+        if not database.exists_job(module_entry.uid):
+            database.add_job(module_entry)
+        database.change_job_entry(module_entry.uid, "status", 0)  # Queued
+
+    def complete(self, module_entry: Default.Entry, source: Default.Entry,
+                 whisper_result) -> None:
+        """
+        Finishes a duplicate with the result of the identical job
+        :param module_entry: The module_entry of the duplicate
+        :param source: The module_entry of the identical job
+        :param whisper_result: The result of the identical job
+        :return: Nothing
+        """
+        database = self.ts_api.database
+        for entry in ("whisper_model", "whisper_language", "duration"):
+            database.change_job_entry(module_entry.uid, entry,
+                                      getattr(source, entry))
+        database.change_job_entry(module_entry.uid, "whisper_result",
+                                  whisper_result)
+        database.change_job_entry(module_entry.uid, "status",
+                                  3)  # Whispered
+        module_entry.module.release_slot()
+        self.ts_api.callbacks.notify(module_entry)
+        file_path = "./data/audioInput/" + module_entry.uid
+        for path in (file_path, audio.pcm_path(module_entry.uid)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def remove(self, uid: str) -> Default.Entry | None:
+        """
+        Stops a deleted duplicate from waiting for its identical job
+        :param uid: The uid of the deleted job
+        :return: The module_entry of the duplicate or None if it was not
+        waiting
+        """
+        with self.lock:
+            for followers in self.followers.values():
+                for follower in followers:
+                    if follower.uid == uid:
+                        followers.remove(follower)
+                        return follower
+        return None
+
+    def finish(self, module_entry: Default.Entry) -> None:
+        """
+        Passes the result of a finished job to the waiting duplicates and
+        remembers it for later ones. If the job failed, was canceled or was
+        deleted, the duplicates are queued again and the first of them to
+        be prepared takes over the work
+        :param module_entry: The module_entry of the finished job
+        :return: Nothing
+        """
+        with self.lock:
+            key = self.keys.pop(module_entry.uid, None)
+            if key is None:
+                return
+            self.in_flight.pop(key, None)
+            followers = self.followers.pop(module_entry.uid, [])
+            if module_entry.status == 3:  # Whispered
+                self.ts_api.database.add_result_index(key, module_entry.uid)
+        database = self.ts_api.database
+        if module_entry.status == 3:  # Whispered
+            whisper_result = (module_entry.whisper_result
+                              or database.load_result(module_entry.uid))
+            for follower in followers:
+                self.complete(follower, module_entry, whisper_result)
+        else:
+            for follower in followers:
+                self.ts_api.add_to_queue(follower.priority, follower)
@@ -0,0 +1,129 @@
+import threading
+from typing import Dict, Iterator, List, Tuple
+
+from utils import util
+
+
+class Stream:
+    def __init__(self):
+        """
+        Creates the segments of one running job
+        """
+        self.segments: List[Tuple[float, float, str]] = []
+        self.progress: float = 0
+        self.status: int | None = None
+
+
+class LiveSegments:
+    def __init__(self, database, heartbeat: float = 15):
+        """
+        Creates the store of the segments of running jobs, so clients can
+        follow a transcription while it is produced
+        :param database: The database to read finished jobs from
+        :param heartbeat: Seconds without events after which a heartbeat is
+        sent
+        """
+        self.database = database
+        self.heartbeat: float = heartbeat
+        self.condition = threading.Condition()
+        self.streams: Dict[str, Stream] = {}
+
+    def open(self, uid: str) -> None:
+        """
+        Starts collecting the segments of a job
+        :param uid: The uid of the job
+        :return: Nothing
+        """
+        with self.condition:
+            self.streams[uid] = Stream()
+            self.condition.notify_all()
+
+    def publish(self, uid: str, t0: float, t1: float, text: str,
+                progress: float) -> None:
+        """
+        Adds a new segment of a running job
+        :param uid: The uid of the job
+        :param t0: The start of the segment in seconds
+        :param t1: The end of the segment in seconds
+        :param text: The text of the segment
+        :param progress: The transcribed part of the audio in percent
+        :return: Nothing
+        """
+        with self.condition:
+            stream = self.streams.get(uid)
+            if stream is None:
+                return
+            stream.segments.append((t0, t1, text))
+            stream.progress = max(stream.progress, progress)
+            self.condition.notify_all()
+
+    def close(self, uid: str, status: int) -> None:
+        """
+        Ends the stream of a job. Clients still following it receive the
+        remaining segments
+        :param uid: The uid of the job
+        :param status: The final status of the job
+        :return: Nothing
+        """
+        with self.condition:
+            stream = self.streams.pop(uid, None)
+            if stream is not None:
+                stream.status = status
+            self.condition.notify_all()
+
+    def events(self, uid: str) -> Iterator[Tuple[str, Dict] | None]:
+        """
+        Follows the segments of a job. Segments produced before are sent
+        first, a job that is already finished sends its stored result
+        :param uid: The uid of the job
+        :return: ("segment", data) per segment, ("done", data) at the end,
+        also if the job is deleted, and None as heartbeat
+        """
+        stream: Stream | None = None
+        index = 0
+        while True:
+            with self.condition:
+                if stream is None:
+                    stream = self.streams.get(uid)
+                if stream is not None:
+                    self.condition.wait_for(
+                        lambda: (len(stream.segments) > index
+                                 or stream.status is not None),
+                        timeout=self.heartbeat)
+                    segments = stream.segments[index:]
+                    index = index + len(segments)
+                    progress = stream.progress
+                    status = stream.status
+            if stream is None:
+                try:
+                    module_entry = self.database.load_job(uid)
+                except KeyError:
+                    # Deleted while it was followed
+                    yield "done", {"status": util.get_status(None),
+                                   "error": "Job not found"}
+                    return
+                if module_entry.status in (3, 4, 5):
+                    # Finished before or without a stream
+                    whisper_result = self.database.load_result(uid) or []
+                    for segment in whisper_result:
+                        yield "segment", {"start": segment.t0 / 100,
+                                          "end": segment.t1 / 100,
+                                          "text": segment.text,
+                                          "progress": 100}
+                    yield "done", {"status": util.get_status(
+                        module_entry.status)}
+                    return
+                with self.condition:
+                    started = self.condition.wait_for(
+                        lambda: uid in self.streams, timeout=self.heartbeat)
+                if not started:
+                    yield None
+                continue
+            for t0, t1, text in segments:
+                yield "segment", {"start": t0, "end": t1, "text": text,
+                                  "progress": round(progress, 1)}
+            if status is not None and index == len(stream.segments):
+                yield "done", {"status": util.get_status(status)}
+                return
+            if not segments:
+                yield None
@@ -0,0 +1,152 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import psutil
+from pywhispercpp.model import Model
+
+
+class ModelPool:
+    """
+    Keeps whisper.cpp models resident between jobs.
+
+    Models are loaded lazily on first use (or via ``preload``) and handed out
+    to transcribers with ``checkout``. Idle models are evicted least recently
+    used first once the RAM usage exceeds ``max_ram_usage``.
+    """
+
+    def __init__(self,
+                 models_dir: str = "./data/models",
+                 n_threads: int = 4,
+                 max_instances: int = 1,
+                 max_ram_usage: float = 90,
+                 loader: Callable[[str], object] | None = None):
+        """
+        Creates an empty model pool
+        :param models_dir: The directory the ggml models are stored in
+        :param n_threads: The number of threads whisper.cpp should use
+        :param max_instances: The maximum number of loaded instances per model
+        :param max_ram_usage: RAM usage in percent above which idle models
+        are evicted
+        :param loader: Optional function to load a model by name
+        """
+        self.models_dir: str = models_dir
+        self.n_threads: int = n_threads
+        self.max_instances: int = max_instances
+        self.max_ram_usage: float = max_ram_usage
+        self.loader: Callable[[str], object] = loader or self._load_model
+        self.condition = threading.Condition()
+        # Loading is serialized to avoid RAM spikes on concurrent job starts
+        self.load_lock = threading.Lock()
+        self.idle: Dict[str, List[Tuple[float, object]]] = {}
+        self.busy: Dict[str, int] = {}
+
+    def _load_model(self, model_name: str) -> Model:
+        """
+        Loads a whisper.cpp model from its file in the models directory. The
+        file is passed as path, so the one verified by the model registry is
+        loaded instead of a download by pywhispercpp
+        :param model_name: The name of the model
+        :return: The loaded model
+        """
+        return Model(os.path.join(self.models_dir, f"ggml-{model_name}.bin"),
+                     n_threads=self.n_threads)
+
+    def instances(self, model_name: str) -> int:
+        """
+        Returns the number of loaded or loading instances of a model
+        :param model_name: The name of the model
+        :return: The number of instances
+        """
+        return (len(self.idle.get(model_name, []))
+                + self.busy.get(model_name, 0))
+
+    def acquire(self, model_name: str, blocking: bool = True) -> object:
+        """
+        Checks out an instance of a model, loading it if necessary
+        :param model_name: The name of the model
+        :param blocking: Wait for a free instance if the pool is exhausted
+        :return: The model or None if not blocking and none is available
+        """
+        with self.condition:
+            while (not self.idle.get(model_name)
+                   and self.instances(model_name) >= self.max_instances):
+                if not blocking:
+                    return None
+                self.condition.wait()
+            self.busy[model_name] = self.busy.get(model_name, 0) + 1
+            if self.idle.get(model_name):
+                return self.idle[model_name].pop()[1]
+        try:
+            with self.load_lock:
+                self.evict()
+                logging.info(f"Loading Whisper model \"{model_name}\"...")
+                model = self.loader(model_name)
+                logging.info(f"Whisper model \"{model_name}\" loaded!")
+            return model
+        except Exception:
+            with self.condition:
+                self.busy[model_name] -= 1
+                self.condition.notify_all()
+            raise
+
+    def release(self, model_name: str, model: object) -> None:
+        """
+        Returns a checked out model to the pool
+        :param model_name: The name of the model
+        :param model: The model to return
+        :return: Nothing
+        """
+        with self.condition:
+            self.busy[model_name] -= 1
+            self.idle.setdefault(model_name, []).append((time.time(), model))
+            self.condition.notify_all()
+        self.evict()
+
+    @contextmanager
+    def checkout(self, model_name: str) -> Iterator[object]:
+        """
+        Context manager to use a model of the pool
+        :param model_name: The name of the model
+        :return: The model
+        """
+        model = self.acquire(model_name)
+        try:
+            yield model
+        finally:
+            self.release(model_name, model)
+
+    def preload(self, model_name: str) -> None:
+        """
+        Loads an instance of a model without using it
+        :param model_name: The name of the model
+        :return: Nothing
+        """
+        with self.checkout(model_name):
+            pass
+
+    def evict(self, force: bool = False) -> int:
+        """
+        Evicts idle models, least recently used first, while the RAM usage
+        is above the limit
+        :param force: Evict all idle models regardless of the RAM usage
+        :return: The number of evicted models
+        """
+        evicted = 0
+        with self.condition:
+            while force or (psutil.virtual_memory().percent
+                            > self.max_ram_usage):
+                candidates = [(models[0][0], name)
+                              for name, models in self.idle.items() if models]
+                if not candidates:
+                    break
+                _, model_name = min(candidates)
+                self.idle[model_name].pop(0)
+                evicted = evicted + 1
+                logging.info(f"Evicted idle Whisper model \"{model_name}\".")
+            if evicted:
+                self.condition.notify_all()
+        return evicted
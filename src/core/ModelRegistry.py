@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict
+
+from pywhispercpp.constants import AVAILABLE_MODELS
+from pywhispercpp.utils import download_model
+
+from utils import util
+
+MODEL_FILE = re.compile(r"^ggml-(.+)\.bin$")
+QUANTIZATION = re.compile(r"-(q\d+_\d+)$")
+
+
+class ModelFile:
+    def __init__(self, name: str, path: str, size: int, mtime: float,
+                 sha256: str | None = None, verified: bool | None = None):
+        """
+        Creates the inventory entry of a ggml model file
+        :param name: The name of the model, e.g. "large-v3-turbo-q5_0"
+        :param path: The path of the file
+        :param size: The size of the file in bytes
+        :param mtime: The modification time of the file
+        :param sha256: The SHA-256 of the file or None if not hashed yet
+        :param verified: True if the SHA-256 matches the expected checksum,
+        False if it does not and None if no checksum is known
+        """
+        self.name: str = name
+        self.path: str = path
+        self.size: int = size
+        self.mtime: float = mtime
+        self.sha256: str | None = sha256
+        self.verified: bool | None = verified
+
+    @property
+    def quantization(self) -> str:
+        """
+        Returns the quantization of the model from its name
+        :return: The quantization, e.g. "q5_0", or "f16" for full models
+        """
+        match = QUANTIZATION.search(self.name)
+        return match.group(1) if match else "f16"
+
+    def to_dict(self) -> Dict:
+        """
+        Returns the inventory entry for the status endpoints
+        :return: The entry as dict
+        """
+        return {"name": self.name, "size": self.size, "sha256": self.sha256,
+                "quantization": self.quantization, "verified": self.verified}
+
+
+class ModelRegistry:
+    def __init__(self, models_dir: str = "./data/models",
+                 checksums: str = "SHA256SUMS",
+                 cache: str = "checksums.json"):
+        """
+        Creates the inventory of the ggml models in the models directory.
+        The SHA-256 of a file is computed once and kept in a cache file
+        until its size or modification time changes
+        :param models_dir: The directory the ggml models are stored in
+        :param checksums: Optional file in the models directory with the
+        expected checksums in the format of sha256sum
+        :param cache: The file in the models directory with the computed
+        checksums
+        """
+        self.models_dir: str = models_dir
+        self.checksums_path: str = os.path.join(models_dir, checksums)
+        self.cache_path: str = os.path.join(models_dir, cache)
+        self.lock = threading.Lock()
+        self.models: Dict[str, ModelFile] = {}
+        self.cache: Dict[str, Dict] = {}
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, "r", encoding="utf-8") as file:
+                    self.cache = json.load(file)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring model checksum cache: {e}")
+
+    def expected(self) -> Dict[str, str]:
+        """
+        Reads the expected checksums
+        :return: The expected SHA-256 by file name
+        """
+        if not os.path.exists(self.checksums_path):
+            return {}
+        checksums = {}
+        with open(self.checksums_path, "r", encoding="utf-8") as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) == 2:
+                    checksums[parts[1].lstrip("*")] = parts[0].lower()
+        return checksums
+
+    def scan(self, hashing: bool = True) -> Dict[str, ModelFile]:
+        """
+        Inventories the ggml models of the models directory
+        :param hashing: Computes the SHA-256 of files not in the cache
+        :return: The models by name
+        """
+        with self.lock:
+            models = {}
+            for file_name in sorted(os.listdir(self.models_dir)):
+                match = MODEL_FILE.match(file_name)
+                if match:
+                    models[match.group(1)] = self.inspect(match.group(1),
+                                                          hashing)
+            self.models = models
+            self.save_cache()
+            return dict(models)
+
+    def inspect(self, name: str, hashing: bool = True) -> ModelFile:
+        """
+        Creates the inventory entry of a model file and verifies it
+        :param name: The name of the model
+        :param hashing: Computes the SHA-256 if it is not in the cache
+        :return: The entry
+        """
+        file_name = f"ggml-{name}.bin"
+        path = os.path.join(self.models_dir, file_name)
+        stat = os.stat(path)
+        model = ModelFile(name, path, stat.st_size, stat.st_mtime)
+        cached = self.cache.get(file_name)
+        if (cached and cached["size"] == stat.st_size
+                and cached["mtime"] == stat.st_mtime):
+            model.sha256 = cached["sha256"]
+        elif hashing:
+            logging.info(f"Hashing Whisper model \"{name}\"...")
+            model.sha256 = util.hash_file(path).hexdigest()
+            self.cache[file_name] = {"size": stat.st_size,
+                                     "mtime": stat.st_mtime,
+                                     "sha256": model.sha256}
+        expected = self.expected().get(file_name)
+        if expected is not None and model.sha256 is not None:
+            model.verified = expected == model.sha256
+            if not model.verified:
+                logging.error(f"Checksum mismatch of Whisper model "
+                              f"\"{name}\"!")
+        return model
+
+    def save_cache(self) -> None:
+        """
+        Writes the computed checksums to the cache file
+        :return: Nothing
+        """
+        try:
+            with open(self.cache_path, "w", encoding="utf-8") as file:
+                json.dump(self.cache, file)
+        except OSError as e:
+            logging.warning(f"Error writing model checksum cache: {e}")
+
+    def ensure(self, name: str) -> ModelFile:
+        """
+        Returns a verified local model, downloading it if it is missing
+        :param name: The name of the model
+        :return: The inventory entry of the model
+        :raises ValueError: If the model is unknown or its checksum does
+        not match
+        """
+        with self.lock:
+            model = self.models.get(name)
+            path = os.path.join(self.models_dir, f"ggml-{name}.bin")
+            if (model is None or model.sha256 is None
+                    or not os.path.exists(path)):
+                if not os.path.exists(path):
+                    if name not in AVAILABLE_MODELS:
+                        raise ValueError(f"Unknown Whisper model {name}")
+                    logging.info(f"Downloading Whisper model \"{name}\"...")
+                    download_model(name, download_dir=self.models_dir)
+                model = self.inspect(name)
+                self.models[name] = model
+                self.save_cache()
+        if model.verified is False:
+            raise ValueError(f"Checksum mismatch of Whisper model {name}")
+        return model
@@ -0,0 +1,127 @@
+import hashlib
+import operator
+import re
+from typing import Callable, Dict, Iterable, List, Set
+
+from packages.Default import Default
+
+OPERATORS: Dict[str, Callable[[float, float], bool]] = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+    "=": operator.eq,
+}
+RULE = re.compile(r"^\s*(priority|duration)\s*(<=|>=|<|>|=)\s*"
+                  r"([0-9.]+)\s*:\s*(\S+)\s*$")
+
+
+class RoutingRule:
+    def __init__(self, field: str, op: str, value: float, model: str):
+        """
+        Creates a rule that routes matching jobs to a model
+        :param field: "priority" or "duration" in seconds
+        :param op: One of <=, >=, <, >, =
+        :param value: The value the field is compared with
+        :param model: The name of the model for matching jobs
+        """
+        self.field: str = field
+        self.op: str = op
+        self.value: float = value
+        self.model: str = model
+
+    def matches(self, module_entry: Default.Entry) -> bool:
+        """
+        Checks whether a job matches the rule. Jobs with an unknown
+        duration match no duration rule
+        :param module_entry: The module_entry of the job
+        :return: True if the rule applies
+        """
+        value = getattr(module_entry, self.field)
+        return value is not None and OPERATORS[self.op](value, self.value)
+
+    def __str__(self) -> str:
+        """
+        Returns the rule in the format of its configuration
+        :return: The rule, e.g. "priority<=1:large-v3"
+        """
+        return f"{self.field}{self.op}{self.value:g}:{self.model}"
+
+
+class ModelRouter:
+    """
+    Picks the Whisper model of a job. A model requested with the job is
+    used as is, otherwise the first matching rule decides, otherwise the
+    default model
+    """
+
+    def __init__(self, default: str, rules: List[RoutingRule] | None = None,
+                 allowed: Iterable[str] = ()):
+        """
+        Creates the router
+        :param default: The model of jobs no rule matches
+        :param rules: The rules in order of precedence
+        :param allowed: Further models jobs may request
+        """
+        self.default: str = default
+        self.rules: List[RoutingRule] = rules or []
+        self.allowed: Set[str] = ({default, *allowed}
+                                  | {rule.model for rule in self.rules})
+        # Changes of the configuration change the signature of jobs
+        self.digest: str = hashlib.sha256(",".join(
+            [default, *map(str, self.rules)]).encode()).hexdigest()[:16]
+
+    def route(self, module_entry: Default.Entry) -> str:
+        """
+        Returns the model of a job
+        :param module_entry: The module_entry of the job
+        :return: The name of the model
+        """
+        if module_entry.whisper_model:
+            return module_entry.whisper_model
+        for rule in self.rules:
+            if rule.matches(module_entry):
+                return rule.model
+        return self.default
+
+    def signature(self, module_entry: Default.Entry) -> str:
+        """
+        Returns what the model of a job depends on besides its media. Jobs
+        with the same media and signature are routed to the same model,
+        even before the duration is known. That is the model the priority
+        rules pick, the position of the picking rule, as duration rules
+        before it may still take precedence, and the routing configuration
+        :param module_entry: The module_entry of the job
+        :return: The signature
+        """
+        if module_entry.whisper_model:
+            return module_entry.whisper_model
+        model, position = self.default, len(self.rules)
+        for index, rule in enumerate(self.rules):
+            if rule.field == "priority" and rule.matches(module_entry):
+                model, position = rule.model, index
+                break
+        return f"{model}#{position}@{self.digest}"
+
+
+def create_router(default: str, rules: str = "",
+                  allowed: str = "") -> ModelRouter:
+    """
+    Creates a model router from its configuration
+    :param default: The model of jobs no rule matches
+    :param rules: Comma separated rules, e.g.
+    "priority<=1:large-v3,duration>=7200:large-v3-turbo-q5_0"
+    :param allowed: Comma separated further models jobs may request
+    :return: The router
+    :raises ValueError: If a rule cannot be parsed
+    """
+    parsed = []
+    for text in filter(None, (part.strip() for part in rules.split(","))):
+        match = RULE.match(text)
+        if not match:
+            raise ValueError(f"Invalid model routing rule {text}")
+        field, op, value, model = match.groups()
+        parsed.append(RoutingRule(field, op, float(value), model))
+    return ModelRouter(default, parsed,
+                       filter(None, (model.strip()
+                                     for model in allowed.split(","))))
@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+import time
+from typing import List
+
+from packages.Default import Default
+from utils import audio
+
+
+class Prefetcher:
+    def __init__(self, ts_api, parallel_downloads: int = 2,
+                 prefetch_depth: int = 2):
+        """
+        Creates the download stage that prepares queued jobs ahead of free
+        worker slots
+        :param ts_api: The main ts_api object to call back
+        :param parallel_downloads: The maximum number of concurrent downloads
+        :param prefetch_depth: How many queued jobs are prepared ahead
+        """
+        self.ts_api = ts_api
+        self.parallel_downloads: int = parallel_downloads
+        self.prefetch_depth: int = prefetch_depth
+        self.downloading: List[Default.Entry] = []
+
+    def start_thread(self):
+        """
+        Starts the thread that hands queued jobs to download threads
+        :return: Nothing
+        """
+        prefetcher_thread = threading.Thread(target=self.prefetcher_thread,
+                                             daemon=True)
+        prefetcher_thread.start()
+
+    def next_entries(self) -> List[Default.Entry]:
+        """
+        Returns the queued jobs that should be downloaded next. They are
+        chosen in the order the scheduler starts jobs, so the jobs of all
+        modules reach the ready jobs it chooses from
+        :return: The entries by dispatch order
+        """
+        slots = self.parallel_downloads - len(self.downloading)
+        database = self.ts_api.database
+        queue = database.queue
+        prepared = sum(1 for module_entry in queue.peek(queue.qsize())
+                       if module_entry.status in (6, 7))  # Downloading, Ready
+        slots = min(slots, self.prefetch_depth - prepared)
+        if slots <= 0:
+            return []
+        while True:
+            entries = self.ts_api.dispatch_order(
+                lambda module_entry: module_entry.status == 0,  # Queued
+                slots)
+            deleted = [module_entry for module_entry in entries
+                       if not database.exists_job(module_entry.uid)]
+            if not deleted:
+                return entries
+            for module_entry in deleted:
+                if queue.remove(module_entry.uid):
+                    # Deleted without leaving the queue
+                    self.ts_api.discard_job(module_entry)
+
+    def prefetcher_thread(self):
+        """
+        The thread to start downloads of the next queued jobs. Wakes up
+        whenever the queue or a download changes
+        :return: Nothing
+        """
+        while self.ts_api.running:
+            with self.ts_api.scheduler:
+                module_entries = self.next_entries()
+                while self.ts_api.running and not module_entries:
+                    self.ts_api.scheduler.wait()
+                    module_entries = self.next_entries()
+                for module_entry in module_entries:
+                    self.ts_api.database.change_job_entry(
+                        module_entry.uid, "status", 6)  # Downloading
+                    self.downloading.append(module_entry)
+            for module_entry in module_entries:
+                download_thread = threading.Thread(target=self.download,
+                                                   args=(module_entry,),
+                                                   daemon=True)
+                download_thread.start()
+
+    def download(self, module_entry: Default.Entry):
+        """
+        Runs the preprocessing of a job, decodes its audio and marks it as
+        ready
+        :param module_entry: The module_entry of the job to download
+        :return: Nothing
+        """
+        try:
+            logging.info(f"Started preparing job with id {module_entry.uid}.")
+            module_entry.mark("download_start")
+            if not os.path.exists(audio.pcm_path(module_entry.uid)):
+                # Duplicates keep their media while waiting for another job
+                if (module_entry.media_hash is None or not os.path.exists(
+                        "./data/audioInput/" + module_entry.uid)):
+                    module_entry.preprocessing()
+                if (module_entry.media_hash is not None
+                        and self.ts_api.deduplicator.resolve(module_entry)):
+                    return
+                self.ingest(module_entry)
+            module_entry.mark("download_end")
+            if not self.ts_api.database.exists_job(module_entry.uid):
+                # Deleted while downloading, already out of the queue
+                self.ts_api.deduplicator.finish(module_entry)
+                audio.remove_files(module_entry.uid)
+                return
+            logging.info(f"Finished preparing job with id {module_entry.uid}.")
+            # Probed once, used by the scheduling policy
+            self.ts_api.database.change_job_entry(
+                module_entry.uid, "duration",
+                audio.duration(audio.pcm_path(module_entry.uid)))
+            with self.ts_api.scheduler:
+                self.ts_api.database.change_job_entry(module_entry.uid,
+                                                      "status", 7)  # Ready
+                self.ts_api.ready_times[module_entry.uid] = time.monotonic()
+        except Exception as e:
+            logging.error(f"Error preparing job {module_entry.uid}: {e}")
+            # A deleted job was already taken out of the queue and released
+            if self.ts_api.database.queue.remove(module_entry.uid):
+                self.ts_api.database.change_job_entry(module_entry.uid,
+                                                      "status", 5)  # Canceled
+                self.ts_api.unregister_job(module_entry)
+            else:
+                self.ts_api.deduplicator.finish(module_entry)
+                audio.remove_files(module_entry.uid)
+        finally:
+            with self.ts_api.scheduler:
+                self.downloading.remove(module_entry)
+                self.ts_api.scheduler.notify_all()
+
+    def ingest(self, module_entry: Default.Entry):
+        """
+        Decodes the media of a job once to 16 kHz mono PCM and deletes the
+        original file, so the transcriber does not have to decode it again
+        :param module_entry: The module_entry of the job
+        :return: Nothing
+        """
+        file_path = "./data/audioInput/" + module_entry.uid
+        audio.extract_audio(file_path, audio.pcm_path(module_entry.uid))
+        os.remove(file_path)
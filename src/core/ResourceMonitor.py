@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict
+
+import psutil
+
+
+class ResourceMonitor:
+    def __init__(self, ts_api, interval: float = 1, window: int = 10,
+                 max_storage_usage: float = 90, max_ram_usage: float = 90,
+                 max_cpu_usage: float = 400, max_queue_length: int = 50,
+                 max_wait: float = 0):
+        """
+        Creates the sampler that keeps a rolling window of the system
+        resources, so requests can read them without blocking
+        :param ts_api: The main ts_api object to read the queue from
+        :param interval: Seconds between two samples
+        :param window: Number of samples to average
+        :param max_storage_usage: Storage usage in percent above which new
+        jobs are rejected
+        :param max_ram_usage: Average RAM usage in percent above which new
+        jobs are rejected
+        :param max_cpu_usage: Average CPU usage in percent above which new
+        jobs are rejected
+        :param max_queue_length: Queue length above which new jobs are
+        rejected
+        :param max_wait: Predicted seconds a new job waits for the backlog
+        above which new jobs are rejected, 0 for no limit
+        """
+        self.ts_api = ts_api
+        self.interval: float = interval
+        self.max_storage_usage: float = max_storage_usage
+        self.max_ram_usage: float = max_ram_usage
+        self.max_cpu_usage: float = max_cpu_usage
+        self.max_queue_length: int = max_queue_length
+        self.max_wait: float = max_wait
+        self.samples: Deque[Dict] = deque(maxlen=window)
+        self.snapshot: Dict = self.sample()
+        self.samples.append(self.snapshot)
+
+    def start_thread(self):
+        """
+        Starts the thread that samples the resources
+        :return: Nothing
+        """
+        monitor_thread = threading.Thread(target=self.monitor_thread,
+                                          daemon=True)
+        monitor_thread.start()
+
+    def monitor_thread(self):
+        """
+        The thread to sample the resources every interval
+        :return: Nothing
+        """
+        while self.ts_api.running:
+            try:
+                snapshot = self.sample()
+                self.samples.append(snapshot)
+                self.snapshot = snapshot
+            except Exception as e:
+                logging.error(f"Error sampling resources: {e}")
+            time.sleep(self.interval)
+
+    def sample(self) -> Dict:
+        """
+        Measures the system resources once. The CPU usage is the average
+        since the previous sample
+        :return: The measured values
+        """
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage('./')
+        swap = psutil.swap_memory()
+        return {
+            "time": time.time(),
+            "cpu_usage": psutil.cpu_percent(interval=None),
+            "cpu_cores": psutil.cpu_count(),
+            "ram_usage": memory.percent,
+            "ram_free": memory.available * 100 / memory.total,
+            "storage_total": disk.total / 1000000000,
+            "storage_usage": disk.used / 1000000000,
+            "storage_free": disk.free / 1000000000,
+            "swap_usage": swap.percent,
+            "swap_free": (swap.free * 100 / swap.total) if swap.total else 0,
+            "queue_length": self.ts_api.database.queue.qsize()
+        }
+
+    def average(self, key: str) -> float:
+        """
+        Returns the average of a value over the window
+        :param key: The name of the value
+        :return: The average
+        """
+        samples = list(self.samples)
+        return sum(sample[key] for sample in samples) / len(samples)
+
+    def admission(self, jobs: int = 1) -> str | None:
+        """
+        Decides with the cached samples whether new jobs are accepted
+        :param jobs: The number of new jobs, accepted or rejected together
+        :return: The reason for the rejection or None if accepted
+        """
+        snapshot = self.snapshot
+        if (100 / snapshot["storage_total"] * snapshot["storage_usage"]
+                > self.max_storage_usage):
+            return "Not enough storage"
+        if self.average("ram_usage") > self.max_ram_usage:
+            return "Not enough ram"
+        if self.average("cpu_usage") > self.max_cpu_usage:
+            return "Not enough cpu"
+        if (self.ts_api.database.queue.qsize() + jobs - 1
+                > self.max_queue_length):
+            return "The queue is full"
+        if self.max_wait > 0 and (self.ts_api.estimator.wait()
+                                  > self.max_wait):
+            return "The predicted wait is too long"
+        return None
+
+    def retry_after(self) -> int:
+        """
+        Estimates when a rejected job would be accepted, from the backlog
+        and the throughput. Rejections because of the resources are retried
+        after the sampling window
+        :return: The seconds to wait before submitting again
+        """
+        estimator = self.ts_api.estimator
+        delay = self.interval * len(self.samples)
+        excess = self.ts_api.database.queue.qsize() - self.max_queue_length
+        if excess >= 0:
+            # Until enough average jobs are finished
+            delay = max(delay, (excess + 1) * estimator.duration
+                        / estimator.throughput())
+        if self.max_wait > 0:
+            delay = max(delay, estimator.wait() - self.max_wait)
+        return max(int(delay + 0.999), 1)
@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+
+class RetentionJanitor:
+    def __init__(self, ts_api, interval: float = 300,
+                 ttl: Dict[int, float] | None = None, max_bytes: int = 0,
+                 orphan_age: float = 3600,
+                 audio_dir: str = "./data/audioInput",
+                 upload_expiry: float = 86400):
+        """
+        Creates the janitor that removes finished jobs nobody deleted and
+        files left behind in the audio spool, so the storage of a long
+        running instance stays bounded
+        :param ts_api: The main ts_api object with the database
+        :param interval: Seconds between two sweeps
+        :param ttl: Seconds a finished job is kept by status, 0 keeps it
+        forever. The retention_ttl of a module takes precedence
+        :param max_bytes: Maximum size of all stored results, the least
+        recently used jobs above it are removed. 0 for no limit
+        :param orphan_age: Seconds after which a file in the audio spool
+        that belongs to no unfinished job is removed
+        :param audio_dir: The audio spool
+        :param upload_expiry: Seconds without data after which an
+        unfinished upload is removed
+        """
+        self.ts_api = ts_api
+        self.interval: float = interval
+        self.ttl: Dict[int, float] = ttl if ttl is not None else {}
+        self.max_bytes: int = max_bytes
+        self.orphan_age: float = orphan_age
+        self.audio_dir: str = audio_dir
+        self.upload_expiry: float = upload_expiry
+        self.lock = threading.Lock()
+        self.expired: int = 0
+        self.evicted: int = 0
+        self.orphans: int = 0
+        self.uploads: int = 0
+
+    def start_thread(self):
+        """
+        Starts the thread that sweeps every interval
+        :return: Nothing
+        """
+        janitor_thread = threading.Thread(target=self.janitor_thread,
+                                          daemon=True)
+        janitor_thread.start()
+
+    def janitor_thread(self):
+        """
+        The thread to sweep every interval
+        :return: Nothing
+        """
+        while self.ts_api.running:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Error sweeping finished jobs: {e}")
+
+    def sweep(self, now: float | None = None) -> Dict[str, int]:
+        """
+        Removes expired jobs, then the least recently used jobs above the
+        size limit, then the orphaned files and the abandoned uploads
+        :param now: The current time, for tests
+        :return: The number of removed jobs, files and uploads of this sweep
+        """
+        now = now if now is not None else time.time()
+        with self.lock:
+            jobs = self.ts_api.database.finished_jobs()
+            expired = self.expire(jobs, now)
+            removed = set(expired)
+            jobs = [job for job in jobs if job[0] not in removed]
+            evicted = self.evict(jobs)
+            orphans = self.sweep_orphans(now)
+            uploads = self.ts_api.uploads.expire(self.upload_expiry, now)
+            self.expired = self.expired + len(expired)
+            self.evicted = self.evicted + len(evicted)
+            self.orphans = self.orphans + orphans
+            self.uploads = self.uploads + uploads
+        if expired or evicted or orphans or uploads:
+            logging.info(f"Removed {len(expired)} expired and "
+                         f"{len(evicted)} evicted jobs, {orphans} "
+                         f"orphaned files and {uploads} abandoned uploads.")
+        return {"expired": len(expired), "evicted": len(evicted),
+                "orphans": orphans, "uploads": uploads}
+
+    def expire(self, jobs: List[Tuple[str, str, int, float, float, int]],
+               now: float) -> List[str]:
+        """
+        Removes the jobs that finished longer ago than their TTL
+        :param jobs: The finished jobs of the database
+        :param now: The current time
+        :return: The uids of the removed jobs
+        """
+        modules = self.ts_api.database.modules
+        expired = []
+        for uid, module_uid, status, finished, _, _ in jobs:
+            module = modules.get(module_uid)
+            ttl = getattr(module, "retention_ttl", None)
+            if ttl is None:
+                ttl = self.ttl.get(status, 0)
+            if ttl > 0 and now - finished > ttl:
+                self.ts_api.database.delete_job(uid)
+                expired.append(uid)
+        return expired
+
+    def evict(self, jobs: List[Tuple[str, str, int, float, float, int]]
+              ) -> List[str]:
+        """
+        Removes the least recently used jobs until their results fit into
+        the size limit
+        :param jobs: The finished jobs of the database
+        :return: The uids of the removed jobs
+        """
+        if self.max_bytes <= 0:
+            return []
+        total = sum(job[5] for job in jobs)
+        evicted = []
+        for uid, _, _, _, _, size in sorted(jobs, key=lambda job: job[4]):
+            if total <= self.max_bytes:
+                break
+            self.ts_api.database.delete_job(uid)
+            evicted.append(uid)
+            total = total - size
+        return evicted
+
+    def sweep_orphans(self, now: float) -> int:
+        """
+        Removes media, PCM and partial files that belong to no unfinished
+        job
+        :param now: The current time
+        :return: The number of removed files
+        """
+        if not os.path.isdir(self.audio_dir):
+            return 0
+        database = self.ts_api.database
+        with database.lock:
+            active = set(database.module_entrys)
+        removed = 0
+        for file_name in os.listdir(self.audio_dir):
+            # <uid>, <uid>.pcm and the .part and .tmp files written to them
+            if file_name.split(".", 1)[0] in active:
+                continue
+            path = os.path.join(self.audio_dir, file_name)
+            try:
+                if (os.path.isfile(path)
+                        and now - os.path.getmtime(path) > self.orphan_age):
+                    os.remove(path)
+                    removed = removed + 1
+            except OSError as e:
+                logging.warning(f"Error removing orphaned file {path}: {e}")
+        return removed
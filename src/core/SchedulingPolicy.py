@@ -0,0 +1,67 @@
+from typing import Dict, Tuple, Type
+
+from packages.Default import Default
+
+
+class SchedulingPolicy:
+    """
+    Decides which ready job is started next. Jobs with a smaller key are
+    started first
+    """
+
+    def key(self, module_entry: Default.Entry, now: float) -> Tuple:
+        """
+        Returns the sort key of a job
+        :param module_entry: The module_entry of the job
+        :param now: The current time as returned by time.time()
+        :return: The key
+        """
+        return module_entry.priority, module_entry.time
+
+
+class FifoPolicy(SchedulingPolicy):
+    """
+    Starts the jobs by priority and then in order of arrival
+    """
+    pass
+
+
+class SjfPolicy(SchedulingPolicy):
+    """
+    Starts the shortest job first within a priority. The waiting time is
+    credited against the duration, so long jobs cannot starve
+    """
+
+    def __init__(self, aging: float = 1.0):
+        """
+        Creates the policy
+        :param aging: Seconds of audio credited per second of waiting
+        """
+        self.aging: float = aging
+
+    def key(self, module_entry: Default.Entry, now: float) -> Tuple:
+        duration = module_entry.duration or 0
+        waited = max(now - module_entry.time, 0)
+        return (module_entry.priority, duration - self.aging * waited,
+                module_entry.time)
+
+
+POLICIES: Dict[str, Type[SchedulingPolicy]] = {
+    "fifo": FifoPolicy,
+    "sjf": SjfPolicy,
+}
+
+
+def create_policy(name: str, aging: float = 1.0) -> SchedulingPolicy:
+    """
+    Creates a scheduling policy by name
+    :param name: "fifo" or "sjf"
+    :param aging: Seconds of audio credited per second of waiting (sjf)
+    :return: The policy
+    :raises ValueError: If the policy does not exist
+    """
+    if name not in POLICIES:
+        raise ValueError(f"Unknown scheduling policy {name}")
+    if name == "sjf":
+        return SjfPolicy(aging=aging)
+    return POLICIES[name]()
@@ -1,10 +1,16 @@
 import logging
+import queue
 import threading
 import os
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Callable, List, Tuple
 
+import numpy as np
 
 from packages.Default import Default
-from pywhispercpp.model import Model
+from utils import audio
+from utils.transcript import Transcript
 
 
 class Transcriber:
@@ -18,8 +24,12 @@ class Transcriber:
         self.whisper_result = None
         self.whisper_language = None
         self.file_path: str = "./data/audioInput/" + module_entry.uid
+        self.audio_path: str = audio.pcm_path(module_entry.uid)
         self.ts_api = ts_api
+        self.model_pool = ts_api.model_pool if ts_api else None
         self.module_entry: Default.Entry = module_entry
+        # Transcribed samples per chunk for the progress
+        self.covered: List[int] = []
 
     def start_thread(self):
         """
@@ -35,56 +45,216 @@ class Transcriber:
         The thread to whisper an audio
         :return: Nothing
         """
+        self.ts_api.live_segments.open(self.module_entry.uid)
         try:
-            logging.info("Starting processing for job with id "
-                         + self.module_entry.uid + "...")
-            # Whisper model
-            model_size = os.environ.get("whisper_model")
-            model = Model(model_size,
-                          models_dir="./data/models",
-                          n_threads=int(os.environ.get("whisper_cpu_threads")))
-            self.ts_api.database.change_job_entry(self.module_entry.uid,
-                                                  "whisper_model",
-                                                  model_size)
-            # Detect language
-            most_likely, probs = model.auto_detect_language(
-                self.file_path, offset_ms=5000)
-            self.whisper_language = most_likely[0]
-            self.ts_api.database.change_job_entry(self.module_entry.uid,
-                                                  "whisper_language",
-                                                  self.whisper_language)
-            self.ts_api.database.change_job_entry(self.module_entry.uid,
-                                                  "status",
-                                                  2)  # processed
-
-            logging.info("Finished processing for job with id "
-                         + self.module_entry.uid + "!")
-
-            logging.info("Starting Whisper for job with id "
-                         + self.module_entry.uid + "...")
-            # params
-            kwargs = {
-                "language": self.whisper_language,
-            }
-            if (hasattr(self.module_entry, "initial_prompt")
-                    and self.module_entry.initial_prompt):
-                kwargs["initial_prompt"] = self.module_entry.initial_prompt
-
-            # Translate audio
-            result = model.transcribe(self.file_path, **kwargs)
-            # Store results
-            self.whisper_result = result
-            self.ts_api.database.change_job_entry(self.module_entry.uid,
-                                                  "whisper_result", result)
-            self.ts_api.database.change_job_entry(self.module_entry.uid,
-                                                  "status",
-                                                  3)  # Whispered
-            os.remove(self.file_path)
+            # Whisper model of the job, verified before loading
+            model_size = self.ts_api.model_router.route(self.module_entry)
+            self.ts_api.models.ensure(model_size)
+            if self.ts_api.worker_pool is not None:
+                # Crash isolated in a worker process
+                self.ts_api.worker_pool.run(self, model_size)
+            else:
+                with self.model_pool.checkout(model_size) as model:
+                    self.whisper(model, model_size)
+            os.remove(self.audio_path)
             logging.debug("Finished Whisper for job with id "
                           + self.module_entry.uid + "!")
+            self.ts_api.live_segments.close(self.module_entry.uid, 3)
             self.ts_api.unregister_job(self.module_entry)
         except Exception as e:
             logging.error(e)
             self.ts_api.database.change_job_entry(self.module_entry.uid,
                                                   "status", 4)  # Failed
+            self.ts_api.live_segments.close(self.module_entry.uid, 4)
             self.ts_api.unregister_job(self.module_entry)
+
+    def whisper(self, model, model_size: str):
+        """
+        Detects the language and transcribes the audio with a checked out
+        model of the model pool
+        :param model: The Whisper model to use
+        :param model_size: The name of the Whisper model
+        :return: Nothing
+        """
+        logging.info("Starting processing for job with id "
+                     + self.module_entry.uid + "...")
+        self.set_entry("whisper_model", model_size)
+        # Decoded once at ingestion, shared by detection and transcription
+        samples = audio.load_audio(self.audio_path)
+        # Detect language
+        self.mark("detect_start")
+        most_likely, probs = model.auto_detect_language(
+            samples, offset_ms=5000)
+        self.mark("detected")
+        self.whisper_language = most_likely[0]
+        self.set_entry("whisper_language", self.whisper_language)
+        self.set_entry("status", 2)  # processed
+
+        logging.info("Finished processing for job with id "
+                     + self.module_entry.uid + "!")
+
+        logging.info("Starting Whisper for job with id "
+                     + self.module_entry.uid + "...")
+        # params
+        kwargs = {
+            "language": self.whisper_language,
+            # Pooled models keep their params, so always reset the prompt
+            "initial_prompt": "",
+        }
+        if (hasattr(self.module_entry, "initial_prompt")
+                and self.module_entry.initial_prompt):
+            kwargs["initial_prompt"] = self.module_entry.initial_prompt
+
+        # Translate audio
+        self.mark("transcribe_start")
+        if os.environ.get("vad", "false").lower() == "true":
+            # Only transcribe the regions with speech
+            regions = audio.speech_regions(
+                samples, min_silence=float(os.environ.get("vad_min_silence",
+                                                          2)))
+            speech, time_map = audio.compact(samples, regions)
+            skipped = 1 - len(speech) / max(len(samples), 1)
+            logging.info(f"Skipping {skipped:.0%} silence of job with id "
+                         f"{self.module_entry.uid}.")
+            result = []
+            if len(speech) > 0:
+                result = audio.remap(self.transcribe(model, model_size,
+                                                     speech, time_map,
+                                                     **kwargs),
+                                     time_map)
+        else:
+            result = self.transcribe(model, model_size, samples, **kwargs)
+        self.mark("transcribe_end")
+        # Store results
+        self.set_entry("whisper_result", Transcript.from_segments(result))
+        self.set_entry("status", 3)  # Whispered
+
+    def set_entry(self, entry: str, value):
+        """
+        Stores a value of the job
+        :param entry: The name of the value
+        :param value: The value
+        :return: Nothing
+        """
+        if entry == "whisper_result":
+            self.whisper_result = value
+        self.ts_api.database.change_job_entry(self.module_entry.uid, entry,
+                                              value)
+
+    def mark(self, stage: str) -> None:
+        """
+        Records that the job reached a stage now. The time is stored with
+        the next value of the job
+        :param stage: The name of the stage
+        :return: Nothing
+        """
+        self.module_entry.mark(stage)
+
+    def publish(self, t0: float, t1: float, text: str,
+                progress: float) -> None:
+        """
+        Passes a new segment to the clients following the job
+        :param t0: The start of the segment in seconds
+        :param t1: The end of the segment in seconds
+        :param text: The text of the segment
+        :param progress: The transcribed part of the audio in percent
+        :return: Nothing
+        """
+        self.ts_api.live_segments.publish(self.module_entry.uid, t0, t1,
+                                          text, progress)
+
+    def segment_callback(self, samples: np.ndarray,
+                         chunks: List[Tuple[int, int]], index: int,
+                         time_map: List[Tuple[int, int]] | None
+                         ) -> Callable:
+        """
+        Creates the callback for the segments whisper.cpp produces while
+        transcribing a chunk
+        :param samples: The audio samples
+        :param chunks: The (start, end) sample indices of all chunks
+        :param index: The index of the chunk
+        :param time_map: The time map of the skipped silence or None
+        :return: The callback
+        """
+        start, end = chunks[index]
+        offset = start * 100 // audio.SAMPLE_RATE
+
+        def callback(segment):
+            # Timestamps are in 10 ms steps
+            self.covered[index] = min(
+                segment.t1 * audio.SAMPLE_RATE // 100, end - start)
+            live_segment = SimpleNamespace(t0=segment.t0 + offset,
+                                           t1=segment.t1 + offset)
+            if time_map:
+                audio.remap([live_segment], time_map)
+            self.publish(live_segment.t0 / 100, live_segment.t1 / 100,
+                         segment.text,
+                         100 * sum(self.covered) / max(len(samples), 1))
+
+        return callback
+
+    def transcribe(self, model, model_size: str, samples: np.ndarray,
+                   time_map: List[Tuple[int, int]] | None = None,
+                   **kwargs) -> List:
+        """
+        Transcribes the samples. Long recordings are split at silence and
+        the chunks are transcribed in parallel on idle instances of the
+        model pool, if chunked transcription is enabled. New segments are
+        published while they are produced
+        :param model: The checked out Whisper model
+        :param model_size: The name of the Whisper model
+        :param samples: The audio samples
+        :param time_map: The time map of the skipped silence or None
+        :param kwargs: The params for Whisper
+        :return: The segments with timestamps relative to the whole audio
+        """
+        chunk_length = float(os.environ.get("chunk_length", 600))
+        if (os.environ.get("chunked_transcription", "false").lower() != "true"
+                or len(samples) < 2 * chunk_length * audio.SAMPLE_RATE):
+            self.covered = [0]
+            return model.transcribe(
+                samples, new_segment_callback=self.segment_callback(
+                    samples, [(0, len(samples))], 0, time_map),
+                **kwargs)
+        points = audio.split_points(samples, chunk_length)
+        chunks = list(zip(points[:-1], points[1:]))
+        self.covered = [0] * len(chunks)
+        models = [model]
+        while len(models) < len(chunks):
+            idle_model = self.model_pool.acquire(model_size, blocking=False)
+            if idle_model is None:
+                break
+            models.append(idle_model)
+        logging.info(f"Transcribing {len(chunks)} chunks of job with id "
+                     f"{self.module_entry.uid} on {len(models)} models.")
+        pending = queue.SimpleQueue()
+        for index in range(len(chunks)):
+            pending.put(index)
+        results: List[List] = [[] for _ in chunks]
+
+        def chunk_worker(chunk_model):
+            while True:
+                try:
+                    index = pending.get_nowait()
+                except queue.Empty:
+                    return
+                start, end = chunks[index]
+                segments = chunk_model.transcribe(
+                    samples[start:end],
+                    new_segment_callback=self.segment_callback(
+                        samples, chunks, index, time_map),
+                    **kwargs)
+                # Timestamps are in 10 ms steps
+                offset = start * 100 // audio.SAMPLE_RATE
+                for segment in segments:
+                    segment.t0 = segment.t0 + offset
+                    segment.t1 = segment.t1 + offset
+                results[index] = segments
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(models)) as executor:
+                list(executor.map(chunk_worker, models))
+        finally:
+            for idle_model in models[1:]:
+                self.model_pool.release(model_size, idle_model)
+        return [segment for segments in results for segment in segments]
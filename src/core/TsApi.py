@@ -4,14 +4,29 @@ import signal
 import sys
 import threading
 import time
-from typing import List
-
-from pywhispercpp.utils import download_model
+from collections import Counter, deque
+from typing import Callable, Deque, Dict, List, Tuple
 
 from packages.File import File
+from core.CallbackDispatcher import CallbackDispatcher
+from core.CompletionEstimator import CompletionEstimator
+from core.Deduplicator import Deduplicator
+from core.LiveSegments import LiveSegments
+from core.ModelPool import ModelPool
+from core.ModelRegistry import ModelRegistry
+from core.ModelRouter import ModelRouter, create_router
+from core.Prefetcher import Prefetcher
+from core.ResourceMonitor import ResourceMonitor
+from core.RetentionJanitor import RetentionJanitor
+from core.SchedulingPolicy import SchedulingPolicy, create_policy
 from core.Transcriber import Transcriber
+from core.UploadManager import UploadManager
+from core.WorkerPool import WorkerPool
 from packages.Default import Default
+from utils import audio
+from utils.captions import CaptionCache
 from utils.database import Database
+from utils.metrics import JobMetrics
 
 
 class TsApi:
@@ -31,18 +46,105 @@ class TsApi:
         self.database = Database()
         # Queue and Running Jobs
         self.running_jobs: List[Default.Entry] = []
+        # Scheduler wakes up on new jobs and finished jobs
+        self.scheduler = threading.Condition()
+        self.ready_times: Dict[str, float] = {}
+        self.slot_freed_time: float = time.monotonic()
+        self.dispatch_latencies: Deque[float] = deque(maxlen=100)
+        # Finish time and audio duration of the last jobs per module
+        self.completed: Dict[str, Deque[Tuple[float, float]]] = {}
+        # Order in which ready jobs are started
+        self.scheduling_policy: SchedulingPolicy = create_policy(
+            os.environ.get("scheduling_policy", "sjf").lower(),
+            aging=float(os.environ.get("scheduling_aging", 1)))
+        # Notification of clients about finished jobs
+        self.callbacks: CallbackDispatcher = CallbackDispatcher(
+            self,
+            workers=int(os.environ.get("callback_workers", 4)),
+            retries=int(os.environ.get("callback_retries", 5)),
+            timeout=float(os.environ.get("callback_timeout", 10)))
+        # Rendered captions, dropped when the result of a job changes
+        self.captions: CaptionCache = CaptionCache(
+            max_bytes=int(os.environ.get("caption_cache_size", 64000000)))
+        self.database.result_listeners.append(self.captions.invalidate)
+        # Segments of running jobs for clients following them
+        self.live_segments: LiveSegments = LiveSegments(
+            self.database,
+            heartbeat=float(os.environ.get("stream_heartbeat", 15)))
+        # Stage timings and counters of the finished jobs for /metrics
+        self.metrics: JobMetrics = JobMetrics()
+        # Jobs with identical media share one transcription
+        self.deduplicator: Deduplicator = Deduplicator(self)
         # Load & Create Module
         if "DefaultFileModule" not in self.database.modules:
             self.file_module = File(module_uid="DefaultFileModule")
-            self.database.modules["DefaultFileModule"] = self.file_module
+            self.database.add_module(self.file_module)
         else:
             self.file_module = self.database.modules["DefaultFileModule"]
-        # Load Whisper Model
+        # Download stage ahead of the worker slots
+        self.prefetcher: Prefetcher = Prefetcher(
+            self,
+            parallel_downloads=int(os.environ.get("parallel_downloads", 2)),
+            prefetch_depth=int(os.environ.get("prefetch_depth", 2)))
+        # Verified ggml models and the model of each job
         model_size = os.environ.get("whisper_model")
-        if not os.path.exists("./data/models/" + model_size + ".pt"):
-            logging.info("Downloading Whisper model...")
-            download_model(model_size, download_dir="./data/models")
+        self.models: ModelRegistry = ModelRegistry("./data/models")
+        self.models.ensure(model_size)
+        self.model_router: ModelRouter = create_router(
+            model_size,
+            rules=os.environ.get("model_routing", ""),
+            allowed=os.environ.get("whisper_models", ""))
         logging.info(f"Whisper model \"{model_size}\" loaded!")
+        # Resident Whisper models shared by the transcribers
+        self.model_pool: ModelPool = ModelPool(
+            models_dir="./data/models",
+            n_threads=int(os.environ.get("whisper_cpu_threads", 4)),
+            max_instances=int(os.environ.get(
+                "model_pool_size", os.environ.get("parallel_workers", 1))),
+            max_ram_usage=float(os.environ.get("model_pool_max_ram", 90)))
+        # Optional worker processes that isolate crashes of whisper.cpp
+        self.worker_pool: WorkerPool | None = None
+        if os.environ.get("worker_backend", "thread").lower() == "process":
+            self.worker_pool = WorkerPool(
+                size=int(os.environ.get("parallel_workers", 1)),
+                models_dir="./data/models",
+                n_threads=int(os.environ.get("whisper_cpu_threads", 4)),
+                preload=model_size if os.environ.get(
+                    "whisper_preload", "true").lower() == "true" else None,
+                max_runtime=float(os.environ.get("worker_max_runtime", 0)),
+                max_memory=float(os.environ.get("worker_max_memory", 0)))
+        # Backlog in seconds of audio and observed speed for the ETAs
+        self.estimator: CompletionEstimator = CompletionEstimator(
+            self,
+            workers=int(os.environ.get("parallel_workers", 1)),
+            default_speed=float(os.environ.get("eta_default_speed", 1)),
+            default_duration=float(os.environ.get("eta_default_duration",
+                                                  3600)))
+        # Background sampling of the system resources for admission control
+        self.resource_monitor: ResourceMonitor = ResourceMonitor(
+            self,
+            interval=float(os.environ.get("monitor_interval", 1)),
+            window=int(os.environ.get("monitor_window", 10)),
+            max_storage_usage=float(os.environ.get("max_storage_usage", 90)),
+            max_ram_usage=float(os.environ.get("max_ram_usage", 90)),
+            max_cpu_usage=float(os.environ.get("max_cpu_usage", 400)),
+            max_queue_length=int(os.environ.get("max_queue_length", 50)),
+            max_wait=float(os.environ.get("max_wait", 0)))
+        # Resumable uploads written directly into the audio spool
+        self.uploads: UploadManager = UploadManager(
+            max_size=int(os.environ.get("upload_max_size", 0)))
+        # Removal of finished jobs and orphaned files
+        self.janitor: RetentionJanitor = RetentionJanitor(
+            self,
+            interval=float(os.environ.get("retention_interval", 300)),
+            ttl={3: float(os.environ.get("retention_ttl_whispered",
+                                         2592000)),
+                 4: float(os.environ.get("retention_ttl_failed", 604800)),
+                 5: float(os.environ.get("retention_ttl_canceled",
+                                         604800))},
+            max_bytes=int(os.environ.get("retention_max_bytes", 0)),
+            orphan_age=float(os.environ.get("retention_orphan_age", 3600)),
+            upload_expiry=float(os.environ.get("upload_expiry", 86400)))
         logging.info("TsAPI started!")
         self.running: bool = True
 
@@ -55,6 +157,8 @@ class TsApi:
         """
         logging.info("Stopping TsAPI...")
         self.running = False
+        with self.scheduler:
+            self.scheduler.notify_all()
         for module_entry in self.running_jobs:
             logging.info(f"Requeue job with id {module_entry.uid}"
                          + " because of shutdown.")
@@ -62,7 +166,10 @@ class TsApi:
                                            0)  # Queued
             module_entry.priority = 0
             self.database.queue.put((module_entry.priority, module_entry))
+        if self.worker_pool is not None:
+            self.worker_pool.stop()
         self.database.save_database()
+        self.database.close()
         logging.info("TsAPI stopped!")
         sys.exit(0)
 
@@ -76,12 +183,39 @@ class TsApi:
         """
         logging.info(f"Adding job with id {module_entry.uid} to queue.")
         try:
+            module_entry.mark("enqueued")
             self.database.add_job(module_entry)
             self.database.change_job_entry(module_entry.uid, "status", 0)
-            self.database.queue.put((priority, module_entry))
+            with self.scheduler:
+                self.database.queue.put((priority, module_entry))
+                self.scheduler.notify_all()
         except Exception as e:
             logging.error(f"Error adding job {module_entry.uid} to queue: {e}")
 
+    def add_batch_to_queue(self, module_entries: List[Default.Entry]) -> None:
+        """
+        Fügt mehrere Jobs gemeinsam zur Warteschlange hinzu.
+
+        Die Jobs werden mit einem Warten auf das Journal gespeichert und
+        der Scheduler wird einmal geweckt.
+
+        :param module_entries: Die Einträge, die zur Warteschlange
+        hinzugefügt werden sollen.
+        """
+        logging.info(f"Adding {len(module_entries)} jobs to queue.")
+        try:
+            for module_entry in module_entries:
+                module_entry.mark("enqueued")
+                module_entry.status = 0  # Queued
+            self.database.add_jobs(module_entries)
+            with self.scheduler:
+                for module_entry in module_entries:
+                    self.database.queue.put((module_entry.priority,
+                                             module_entry))
+                self.scheduler.notify_all()
+        except Exception as e:
+            logging.error(f"Error adding jobs to queue: {e}")
+
     # Track running jobs
     def register_job(self, entry: Default.Entry) -> Transcriber:
         """
@@ -101,9 +235,59 @@ class TsApi:
         :param entry: Der Eintrag des abgeschlossenen Jobs.
         """
         logging.info(f"Finished job with id {entry.uid}.")
-        entry.module.queued_or_active = entry.module.queued_or_active - 1
-        # ERROR!?
-        self.running_jobs.remove(entry)
+        entry.module.release_slot()
+        self.deduplicator.finish(entry)
+        if entry.status in (3, 4, 5):  # Whispered, Failed, Canceled
+            self.callbacks.notify(entry)
+            self.metrics.observe(entry)
+        with self.scheduler:
+            if entry in self.running_jobs:
+                self.running_jobs.remove(entry)
+            if entry.status == 3:  # Whispered
+                self.estimator.record(entry)
+                self.completed.setdefault(
+                    entry.module.module_uid, deque(maxlen=1000)).append(
+                    (time.monotonic(), entry.duration or 0))
+            self.slot_freed_time = time.monotonic()
+            self.scheduler.notify_all()
+
+    def delete_job(self, uid: str) -> bool:
+        """
+        Löscht einen Job, der nicht gerade transkribiert wird.
+
+        Wartende, herunterladende und bereite Jobs werden aus der
+        Warteschlange genommen und freigegeben.
+
+        :param uid: Die ID des Jobs.
+        :return: `True`, wenn der Job existiert hat.
+        """
+        with self.scheduler:
+            exists = self.database.delete_job(uid)
+            item = self.database.queue.take(
+                lambda module_entry: module_entry.uid == uid)
+            self.scheduler.notify_all()
+        if item is not None:
+            self.discard_job(item[1])
+        else:
+            # Duplicates wait outside of the queue
+            follower = self.deduplicator.remove(uid)
+            if follower is not None:
+                self.discard_job(follower)
+        return exists
+
+    def discard_job(self, module_entry: Default.Entry) -> None:
+        """
+        Gibt einen gelöschten Job frei, der aus der Warteschlange genommen
+        wurde oder auf ein Duplikat gewartet hat, und löscht seine
+        Audiodateien.
+
+        :param module_entry: Der Eintrag des gelöschten Jobs.
+        """
+        logging.info(f"Discarding deleted job with id {module_entry.uid}.")
+        module_entry.module.release_slot()
+        # Duplicates waiting for the deleted job are queued again
+        self.deduplicator.finish(module_entry)
+        audio.remove_files(module_entry.uid)
 
     # Thread to manage queue
     def start_thread(self) -> None:
@@ -112,36 +296,180 @@ class TsApi:
         """
         ts_api_thread = threading.Thread(target=self.ts_api_thread)
         ts_api_thread.start()
+        self.prefetcher.start_thread()
+        self.resource_monitor.start_thread()
+        self.callbacks.start_thread()
+        self.janitor.start_thread()
+        hash_thread = threading.Thread(target=self.hash_models, daemon=True)
+        hash_thread.start()
+        if self.worker_pool is not None:
+            # The worker processes preload their own models
+            self.worker_pool.start()
+        elif os.environ.get("whisper_preload", "true").lower() == "true":
+            preload_thread = threading.Thread(target=self.preload_model,
+                                              daemon=True)
+            preload_thread.start()
+
+    def preload_model(self) -> None:
+        """
+        Lädt das konfigurierte Whisper-Modell vorab in den Modell-Pool.
+        """
+        model_size = os.environ.get("whisper_model")
+        try:
+            self.model_pool.preload(model_size)
+        except Exception as e:
+            logging.error(f"Error preloading Whisper model {model_size}: {e}")
+
+    def hash_models(self) -> None:
+        """
+        Berechnet die Prüfsummen der lokalen Whisper-Modelle im Hintergrund,
+        damit /models sie nicht während einer Anfrage berechnen muss.
+        """
+        try:
+            self.models.scan()
+        except Exception as e:
+            logging.error(f"Error hashing Whisper models: {e}")
+
+    def free_slots(self) -> int:
+        """
+        Gibt die Anzahl freier Worker-Slots zurück.
+
+        :return: Anzahl der Jobs, die zusätzlich gestartet werden können.
+        """
+        parallel_worker = int(os.environ.get("parallel_workers", 1))
+        return parallel_worker - len(self.running_jobs)
+
+    def dispatch_latency(self) -> Dict[str, float]:
+        """
+        Gibt die Dispatch-Latenz der letzten Jobs zurück.
+
+        Die Latenz ist die Zeit zwischen dem Moment, in dem ein Job hätte
+        starten können (Job heruntergeladen und Slot frei), und seinem Start.
+
+        :return: Mittlere und maximale Latenz in Sekunden.
+        """
+        latencies = list(self.dispatch_latencies)
+        if not latencies:
+            return {"avg": 0.0, "max": 0.0}
+        return {"avg": round(sum(latencies) / len(latencies), 4),
+                "max": round(max(latencies), 4)}
+
+    def module_status(self) -> Dict[str, Dict]:
+        """
+        Gibt Warteschlangentiefe und Durchsatz je Modul zurück.
+
+        :return: Gewicht, wartende und laufende Jobs sowie die in der
+        letzten Stunde fertiggestellten Jobs und Audiostunden je Modul.
+        """
+        now = time.monotonic()
+        queued = Counter(module_entry.module.module_uid
+                         for module_entry in self.database.queue.peek(
+                             self.database.queue.qsize()))
+        with self.scheduler:
+            running = Counter(module_entry.module.module_uid
+                              for module_entry in self.running_jobs)
+            completed = {module_uid: [item for item in items
+                                      if now - item[0] <= 3600]
+                         for module_uid, items in self.completed.items()}
+        return {module_uid: {
+            "weight": module.weight,
+            "queued": queued[module_uid],
+            "running": running[module_uid],
+            "jobs_per_hour": len(completed.get(module_uid, [])),
+            "audio_hours_per_hour": round(sum(
+                item[1] for item in completed.get(module_uid, [])) / 3600, 3)
+        } for module_uid, module in self.database.modules.items()}
 
     def ts_api_thread(self) -> None:
         """
         Verarbeitet die Warteschlange und startet neue Jobs, wenn Ressourcen
         verfügbar sind.
 
-        Läuft in einem separaten Thread und verarbeitet die Warteschlange,
-        indem es Jobs je nach Verfügbarkeit ausführt.
+        Läuft in einem separaten Thread und wartet auf neue oder beendete
+        Jobs, statt die Warteschlange regelmäßig abzufragen. Es werden so
+        viele Jobs gestartet, wie Worker-Slots frei sind, in der Reihenfolge
+        der Scheduling-Policy.
         """
         while self.running:
-            parallel_worker = int(os.environ.get("parallel_workers"))
-            if len(self.running_jobs) < parallel_worker:
-                if not self.database.queue.empty():
-                    try:
-                        module_entry: Default.Entry = self.database.queue.get(
-                            timeout=1)[1]
-                        self.running_jobs.append(module_entry)
-                        # Preparing
-                        logging.info(f"Started preparing job with id"
-                                     f" {module_entry.uid}.")
-                        module_entry.preprocessing()
-                        logging.info(f"Finished preparing job with id"
-                                     f" {module_entry.uid}.")
-                        self.database.change_job_entry(module_entry.uid,
-                                                       "status", 1)  # Prepared
-                        # Whispering
-                        trans: Transcriber = self.register_job(module_entry)
-                        trans.start_thread()
-                    except Exception as e:
-                        logging.error(f"Error processing job: {e}")
-                        self.database.change_job_entry(module_entry.uid,
-                                                       "status", 5)  # Canceled
-            time.sleep(5)
+            with self.scheduler:
+                while self.running and (self.free_slots() <= 0
+                                        or not self.ready_entries()):
+                    self.scheduler.wait()
+                if not self.running:
+                    break
+                module_entries: List[Default.Entry] = []
+                now = time.time()
+                while self.free_slots() > 0:
+                    item = self.database.queue.take(
+                        lambda entry: entry.status == 7,  # Ready
+                        key=lambda entry: self.scheduling_policy.key(entry,
+                                                                     now),
+                        fair=True)
+                    if item is None:
+                        break
+                    module_entry: Default.Entry = item[1]
+                    self.running_jobs.append(module_entry)
+                    module_entries.append(module_entry)
+                    ready_time = max(self.ready_times.pop(
+                        module_entry.uid, self.slot_freed_time),
+                        self.slot_freed_time)
+                    self.dispatch_latencies.append(
+                        time.monotonic() - ready_time)
+            for module_entry in module_entries:
+                self.start_job(module_entry)
+
+    def dispatch_order(self, predicate: Callable[[Default.Entry], bool],
+                       n: int) -> List[Default.Entry]:
+        """
+        Gibt wartende Jobs in der Reihenfolge zurück, in der sie gestartet
+        werden, ohne sie aus der Warteschlange zu nehmen.
+
+        Die Reihenfolge folgt der Scheduling-Policy und dem Fair Queuing.
+        Für Jobs, deren Dauer noch unbekannt ist, wird die mittlere Dauer
+        der letzten Jobs angenommen.
+
+        :param predicate: Funktion, die entscheidet, ob ein Job infrage
+        kommt.
+        :param n: Die maximale Anzahl der Jobs.
+        :return: Die Einträge der Jobs.
+        """
+        now = time.time()
+        return self.database.queue.order(
+            predicate, n,
+            key=lambda entry: self.scheduling_policy.key(entry, now),
+            fair=True,
+            default_duration=self.estimator.duration)
+
+    def ready_entries(self) -> bool:
+        """
+        Prüft, ob heruntergeladene Jobs auf einen Worker warten.
+
+        :return: `True`, wenn mindestens ein Job bereit ist.
+        """
+        return any(module_entry.status == 7  # Ready
+                   for module_entry in self.database.queue.peek(
+                       self.database.queue.qsize()))
+
+    def start_job(self, module_entry: Default.Entry) -> None:
+        """
+        Startet den Transcriber eines heruntergeladenen Jobs.
+
+        :param module_entry: Der Eintrag des zu startenden Jobs.
+        """
+        if not self.database.exists_job(module_entry.uid):
+            # Gelöscht, nachdem er aus der Warteschlange genommen wurde
+            self.unregister_job(module_entry)
+            audio.remove_files(module_entry.uid)
+            return
+        try:
+            module_entry.mark("dispatched")
+            self.database.change_job_entry(module_entry.uid,
+                                           "status", 1)  # Prepared
+            # Whispering
+            trans: Transcriber = self.register_job(module_entry)
+            trans.start_thread()
+        except Exception as e:
+            logging.error(f"Error processing job: {e}")
+            self.database.change_job_entry(module_entry.uid,
+                                           "status", 5)  # Canceled
+            self.unregister_job(module_entry)
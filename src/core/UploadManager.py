@@ -0,0 +1,214 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, IO, Tuple
+
+from utils import util
+
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, offset: int):
+        """
+        Raised when a chunk does not start at the end of the upload
+        :param offset: The bytes received so far
+        """
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset: int = offset
+
+
+class UploadNotFound(Exception):
+    def __init__(self, uid: str):
+        """
+        Raised when an upload no longer exists
+        :param uid: The uid of the upload
+        """
+        super().__init__(f"Upload with id {uid} not found")
+        self.uid: str = uid
+
+
+class Upload:
+    def __init__(self, uid: str, metadata: Dict, length: int | None):
+        """
+        Creates the state of an unfinished upload
+        :param uid: The uid of the upload and of the job created from it
+        :param metadata: The parameters of the job
+        :param length: The announced size in bytes or None if unknown
+        """
+        self.uid: str = uid
+        self.metadata: Dict = metadata
+        self.length: int | None = length
+        self.offset: int = 0
+        self.digest = hashlib.sha256()
+        self.lock = threading.Lock()
+
+
+class UploadManager:
+    def __init__(self, upload_dir: str = "./data/uploads",
+                 audio_dir: str = "./data/audioInput",
+                 max_size: int = 0, chunk_size: int = 1024 * 1024):
+        """
+        Creates the store of resumable uploads. Chunks are written directly
+        into the upload file and hashed on the fly, a finished upload is
+        moved into the audio spool without copying
+        :param upload_dir: The directory of the unfinished uploads
+        :param audio_dir: The audio spool of the jobs
+        :param max_size: The maximum size of an upload in bytes, 0 for no
+        limit
+        :param chunk_size: The bytes read from a request at once
+        """
+        self.upload_dir: str = upload_dir
+        self.audio_dir: str = audio_dir
+        self.max_size: int = max_size
+        self.chunk_size: int = chunk_size
+        self.lock = threading.Lock()
+        self.uploads: Dict[str, Upload] = {}
+        os.makedirs(upload_dir, exist_ok=True)
+
+    def path(self, uid: str) -> str:
+        """
+        Returns the path of the data of an upload
+        :param uid: The uid of the upload
+        :return: The path
+        """
+        return os.path.join(self.upload_dir, uid)
+
+    def create(self, uid: str, metadata: Dict,
+               length: int | None = None) -> Upload:
+        """
+        Starts an empty upload
+        :param uid: The uid of the upload and of the job created from it
+        :param metadata: The parameters of the job
+        :param length: The announced size in bytes or None if unknown
+        :return: The upload
+        :raises ValueError: If the announced size exceeds the maximum size
+        """
+        if length is not None and 0 < self.max_size < length:
+            raise ValueError(f"Upload larger than {self.max_size} bytes")
+        upload = Upload(uid, metadata, length)
+        with open(self.path(uid) + ".json", "w", encoding="utf-8") as file:
+            json.dump({"metadata": metadata, "length": length}, file)
+        open(self.path(uid), "wb").close()
+        with self.lock:
+            self.uploads[uid] = upload
+        return upload
+
+    def get(self, uid: str) -> Upload | None:
+        """
+        Returns an unfinished upload. Uploads of a previous run are restored
+        from the disk, their data is hashed again
+        :param uid: The uid of the upload
+        :return: The upload or None if it does not exist
+        """
+        with self.lock:
+            upload = self.uploads.get(uid)
+            if upload is not None:
+                return upload
+            path = self.path(uid)
+            if (os.path.basename(uid) != uid
+                    or not os.path.exists(path + ".json")
+                    or not os.path.exists(path)):
+                return None
+            with open(path + ".json", "r", encoding="utf-8") as file:
+                data = json.load(file)
+            upload = Upload(uid, data["metadata"], data["length"])
+            upload.digest = util.hash_file(path)
+            upload.offset = os.path.getsize(path)
+            self.uploads[uid] = upload
+            return upload
+
+    def append(self, upload: Upload, offset: int, stream: IO[bytes]) -> int:
+        """
+        Writes a chunk to the end of an upload. The bytes received before a
+        dropped connection are kept, so the client can resume after them
+        :param upload: The upload
+        :param offset: The offset of the chunk given by the client
+        :param stream: The chunk
+        :return: The bytes received so far
+        :raises UploadOffsetMismatch: If the chunk does not start at the end
+        of the upload or another chunk is written at the same time
+        :raises ValueError: If the upload grows beyond its size
+        """
+        if not upload.lock.acquire(blocking=False):
+            raise UploadOffsetMismatch(upload.offset)
+        try:
+            if offset != upload.offset:
+                raise UploadOffsetMismatch(upload.offset)
+            limit = upload.length
+            if self.max_size > 0:
+                limit = min(limit or self.max_size, self.max_size)
+            with open(self.path(upload.uid), "ab") as file:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    if (limit is not None
+                            and upload.offset + len(chunk) > limit):
+                        raise ValueError(f"Upload larger than {limit} bytes")
+                    file.write(chunk)
+                    upload.digest.update(chunk)
+                    upload.offset = upload.offset + len(chunk)
+            return upload.offset
+        finally:
+            upload.lock.release()
+
+    def finish(self, upload: Upload) -> Tuple[Dict, str]:
+        """
+        Moves a complete upload into the audio spool as the media of its job
+        :param upload: The upload
+        :return: The parameters of the job and the SHA-256 of the media
+        :raises ValueError: If less than the announced size was received
+        :raises UploadNotFound: If the upload was already finished or aborted
+        """
+        with upload.lock:
+            if upload.length is not None and upload.offset != upload.length:
+                raise ValueError(f"Upload incomplete: {upload.offset} of "
+                                 f"{upload.length} bytes")
+            with self.lock:
+                # Another request may have finished or aborted it meanwhile
+                if self.uploads.get(upload.uid) is not upload:
+                    raise UploadNotFound(upload.uid)
+                os.replace(self.path(upload.uid),
+                           os.path.join(self.audio_dir, upload.uid))
+                os.remove(self.path(upload.uid) + ".json")
+                self.uploads.pop(upload.uid)
+            return upload.metadata, upload.digest.hexdigest()
+
+    def abort(self, upload: Upload) -> None:
+        """
+        Deletes an unfinished upload
+        :param upload: The upload
+        :return: Nothing
+        """
+        with self.lock:
+            self.uploads.pop(upload.uid, None)
+        for path in (self.path(upload.uid), self.path(upload.uid) + ".json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def expire(self, max_age: float, now: float | None = None) -> int:
+        """
+        Deletes uploads that received no data for a while
+        :param max_age: Seconds without data after which an upload expires
+        :param now: The current time, for tests
+        :return: The number of deleted uploads
+        """
+        now = now if now is not None else time.time()
+        removed = 0
+        for file_name in os.listdir(self.upload_dir):
+            if not file_name.endswith(".json"):
+                continue
+            uid = file_name.removesuffix(".json")
+            path = self.path(uid)
+            try:
+                modified = os.path.getmtime(path if os.path.exists(path)
+                                            else path + ".json")
+            except OSError:
+                continue
+            if now - modified > max_age:
+                logging.info(f"Removing expired upload with id {uid}.")
+                self.abort(Upload(uid, {}, None))
+                removed = removed + 1
+        return removed
@@ -0,0 +1,323 @@
+import logging
+import multiprocessing
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+import psutil
+
+from core.ModelPool import ModelPool
+from core.Transcriber import Transcriber
+
+
+class WorkerLimitExceeded(Exception):
+    pass
+
+
+class WorkerTranscriber(Transcriber):
+    def __init__(self, connection, model_pool: ModelPool, job: Dict):
+        """
+        Creates the transcriber of a job inside a worker process. Values of
+        the job are sent to the supervisor instead of the database
+        :param connection: The pipe to the supervisor
+        :param model_pool: The model pool of the worker process
+        :param job: The uid and the initial prompt of the job
+        """
+        super().__init__(None, SimpleNamespace(
+            uid=job["uid"], initial_prompt=job["initial_prompt"]))
+        self.connection = connection
+        self.model_pool = model_pool
+
+    def set_entry(self, entry: str, value):
+        """
+        Sends a value of the job to the supervisor
+        :param entry: The name of the value
+        :param value: The value
+        :return: Nothing
+        """
+        self.connection.send(("set", entry, value))
+
+    def mark(self, stage: str) -> None:
+        """
+        Sends the stage the job reached to the supervisor
+        :param stage: The name of the stage
+        :return: Nothing
+        """
+        self.connection.send(("mark", stage))
+
+    def publish(self, t0: float, t1: float, text: str,
+                progress: float) -> None:
+        """
+        Sends a new segment to the supervisor
+        :param t0: The start of the segment in seconds
+        :param t1: The end of the segment in seconds
+        :param text: The text of the segment
+        :param progress: The transcribed part of the audio in percent
+        :return: Nothing
+        """
+        self.connection.send(("segment", t0, t1, text, progress))
+
+
+def worker_main(connection, models_dir: str, n_threads: int,
+                preload: str | None) -> None:
+    """
+    The main loop of a worker process. The model stays loaded between jobs
+    :param connection: The pipe to the supervisor
+    :param models_dir: The directory of the Whisper models
+    :param n_threads: The number of threads per model
+    :param preload: The name of the model to load at start or None
+    :return: Nothing
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s')
+    model_pool = ModelPool(models_dir=models_dir, n_threads=n_threads,
+                           max_instances=1, max_ram_usage=100)
+    if preload:
+        try:
+            model_pool.preload(preload)
+        except Exception as e:
+            logging.error(f"Error preloading Whisper model {preload}: {e}")
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        try:
+            transcriber = WorkerTranscriber(connection, model_pool, job)
+            with model_pool.checkout(job["model"]) as model:
+                transcriber.whisper(model, job["model"])
+            connection.send(("done",))
+        except Exception as e:
+            connection.send(("error", str(e)))
+
+
+class Worker:
+    def __init__(self, context, models_dir: str, n_threads: int,
+                 preload: str | None):
+        """
+        Starts a worker process
+        :param context: The multiprocessing context
+        :param models_dir: The directory of the Whisper models
+        :param n_threads: The number of threads per model
+        :param preload: The name of the model to load at start or None
+        """
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=worker_main,
+            args=(child_connection, models_dir, n_threads, preload),
+            daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.uid: str | None = None
+        self.started: float | None = None
+
+    def stop(self) -> None:
+        """
+        Kills the worker process
+        :return: Nothing
+        """
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class WorkerPool:
+    def __init__(self, size: int, models_dir: str = "./data/models",
+                 n_threads: int = 4, preload: str | None = None,
+                 max_runtime: float = 0, max_memory: float = 0,
+                 poll_interval: float = 1):
+        """
+        Creates the supervisor of the worker processes. Each worker keeps its
+        own model loaded, so a crash of whisper.cpp only fails the job of
+        that worker
+        :param size: The number of worker processes
+        :param models_dir: The directory of the Whisper models
+        :param n_threads: The number of threads per model
+        :param preload: The name of the model to load at start or None
+        :param max_runtime: Seconds after which a job is killed, 0 for no
+        limit
+        :param max_memory: Memory of a worker in MB above which its job is
+        killed, 0 for no limit
+        :param poll_interval: Seconds between two checks of the limits
+        """
+        self.size: int = size
+        self.models_dir: str = models_dir
+        self.n_threads: int = n_threads
+        self.preload: str | None = preload
+        self.max_runtime: float = max_runtime
+        self.max_memory: float = max_memory
+        self.poll_interval: float = poll_interval
+        # Forking a process with running threads is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        self.condition = threading.Condition()
+        self.workers: List[Worker] = []
+        self.idle: List[Worker] = []
+        self.restarts: int = 0
+
+    def start(self) -> None:
+        """
+        Starts the worker processes
+        :return: Nothing
+        """
+        with self.condition:
+            while len(self.workers) < self.size:
+                worker = self._new_worker()
+                self.workers.append(worker)
+                self.idle.append(worker)
+            self.condition.notify_all()
+
+    def stop(self) -> None:
+        """
+        Kills all worker processes
+        :return: Nothing
+        """
+        with self.condition:
+            for worker in self.workers:
+                worker.stop()
+            self.workers.clear()
+            self.idle.clear()
+
+    def _new_worker(self) -> Worker:
+        return Worker(self.context, self.models_dir, self.n_threads,
+                      self.preload)
+
+    def restart(self, worker: Worker) -> Worker:
+        """
+        Replaces a worker by a new process
+        :param worker: The crashed or killed worker
+        :return: The new worker
+        """
+        logging.warning(f"Restarting worker process {worker.process.pid}.")
+        worker.stop()
+        new_worker = self._new_worker()
+        with self.condition:
+            self.restarts = self.restarts + 1
+            if worker in self.workers:
+                self.workers[self.workers.index(worker)] = new_worker
+        return new_worker
+
+    def acquire(self) -> Worker:
+        """
+        Waits for an idle worker. Workers that died while idle are restarted
+        :return: The worker
+        """
+        with self.condition:
+            while not self.idle:
+                self.condition.wait()
+            worker = self.idle.pop()
+        if not worker.process.is_alive():
+            worker = self.restart(worker)
+        return worker
+
+    def release(self, worker: Worker) -> None:
+        """
+        Returns a worker to the idle workers
+        :param worker: The worker
+        :return: Nothing
+        """
+        with self.condition:
+            worker.uid = None
+            worker.started = None
+            if worker in self.workers:
+                self.idle.append(worker)
+            self.condition.notify()
+
+    def run(self, transcriber: Transcriber, model_size: str) -> None:
+        """
+        Whispers a job on a worker process. Values and new segments of the
+        job are passed to the transcriber as the worker sends them
+        :param transcriber: The transcriber of the job
+        :param model_size: The name of the Whisper model
+        :return: Nothing
+        :raises Exception: If the job fails, crashes the worker or exceeds a
+        limit
+        """
+        worker = self.acquire()
+        uid = transcriber.module_entry.uid
+        try:
+            worker.uid = uid
+            worker.started = time.monotonic()
+            worker.connection.send({
+                "uid": uid,
+                "initial_prompt": getattr(transcriber.module_entry,
+                                          "initial_prompt", None),
+                "model": model_size,
+            })
+            checked = time.monotonic()
+            while True:
+                if worker.connection.poll(self.poll_interval):
+                    message = worker.connection.recv()
+                    if message[0] == "set":
+                        transcriber.set_entry(message[1], message[2])
+                    elif message[0] == "mark":
+                        transcriber.mark(message[1])
+                    elif message[0] == "segment":
+                        transcriber.publish(*message[1:])
+                    elif message[0] == "done":
+                        return
+                    else:
+                        raise Exception(message[1])
+                elif not worker.process.is_alive():
+                    raise EOFError()
+                # Also checked while the job keeps sending messages
+                if time.monotonic() - checked >= self.poll_interval:
+                    self.check_limits(worker)
+                    checked = time.monotonic()
+        except (EOFError, OSError):
+            worker = self.restart(worker)
+            raise Exception(f"Worker process crashed during job with id "
+                            f"{uid}")
+        except WorkerLimitExceeded as e:
+            worker = self.restart(worker)
+            raise Exception(f"Job with id {uid} killed: {e}")
+        finally:
+            self.release(worker)
+
+    def check_limits(self, worker: Worker) -> None:
+        """
+        Checks the runtime and memory limits of the job of a worker
+        :param worker: The worker
+        :return: Nothing
+        :raises WorkerLimitExceeded: If a limit is exceeded
+        """
+        if (self.max_runtime
+                and time.monotonic() - worker.started > self.max_runtime):
+            raise WorkerLimitExceeded(
+                f"runtime exceeded {self.max_runtime} s")
+        if self.max_memory and self.memory(worker) > self.max_memory:
+            raise WorkerLimitExceeded(
+                f"memory exceeded {self.max_memory} MB")
+
+    @staticmethod
+    def memory(worker: Worker) -> float:
+        """
+        Returns the resident memory of a worker process
+        :param worker: The worker
+        :return: The memory in MB or 0 if the process is gone
+        """
+        try:
+            return (psutil.Process(worker.process.pid).memory_info().rss
+                    / 1000000)
+        except psutil.Error:
+            return 0
+
+    def status(self) -> List[Dict]:
+        """
+        Returns the supervisor's view of the worker processes
+        :return: The pid, state, job and usage per worker
+        """
+        with self.condition:
+            workers = list(self.workers)
+        now = time.monotonic()
+        return [{
+            "pid": worker.process.pid,
+            "alive": worker.process.is_alive(),
+            "job": worker.uid,
+            "runtime": round(now - worker.started, 1) if worker.started
+            else 0,
+            "memory": round(self.memory(worker), 1),
+        } for worker in workers]
@@ -1,5 +1,7 @@
-import time
+import threading
 import uuid
+from typing import Dict
+from time import time as current_time
 
 from abc import ABC, abstractmethod
 
@@ -11,18 +13,71 @@ class Default(ABC):
 
     :var module_uid: Eindeutige ID des Moduls.
     :var queued_or_active: Anzahl der aktiven oder gequeten Einträge
+    :var weight: Anteil des Moduls an den Workern bei fairer Verteilung.
+    :var retention_ttl: Aufbewahrungsdauer abgeschlossener Jobs in Sekunden.
+    :var queuing_locks: Sperren für die Zählung der Einträge je Modul (nicht
+    persistiert).
     """
 
+    queuing_locks: Dict[str, threading.Lock] = {}
+    queuing_locks_lock = threading.Lock()
+
     @abstractmethod
-    def __init__(self, module_type: str, module_uid:
-                 str = str(uuid.uuid4()), queued_or_active=0) -> None:
+    def __init__(self, module_type: str, module_uid: str | None = None,
+                 queued_or_active=0, weight: float = 1,
+                 retention_ttl: float | None = None) -> None:
         """
         Initialisiert ein Default-Modul mit einer eindeutigen ID und einem
         leeren Dictionary für Einträge.
+
+        :param module_uid: Die ID des Moduls, standardmäßig eine neue UUID.
+        :param weight: Das Gewicht des Moduls bei der fairen Verteilung.
+        :param retention_ttl: Die Aufbewahrungsdauer abgeschlossener Jobs in
+        Sekunden, standardmäßig die des Status (0 für unbegrenzt).
         """
         self.module_type: str = module_type
-        self.module_uid: str = module_uid
+        self.module_uid: str = (module_uid if module_uid is not None
+                                else str(uuid.uuid4()))
         self.queued_or_active: int = queued_or_active
+        self.weight: float = float(weight)
+        self.retention_ttl: float | None = (
+            float(retention_ttl) if retention_ttl is not None else None)
+
+    def get_queuing_lock(self) -> threading.Lock:
+        """
+        Gibt die Sperre zurück, unter der die Einträge des Moduls gezählt
+        werden.
+
+        :return: Die Sperre des Moduls.
+        """
+        with Default.queuing_locks_lock:
+            if self.module_uid not in Default.queuing_locks:
+                Default.queuing_locks[self.module_uid] = threading.Lock()
+            return Default.queuing_locks[self.module_uid]
+
+    def reserve_slots(self, count: int = 1,
+                      limit: int | None = None) -> bool:
+        """
+        Zählt neue Einträge des Moduls, falls sie das Limit nicht
+        überschreiten.
+
+        :param count: Die Anzahl der Einträge.
+        :param limit: Die maximale Anzahl der Einträge oder None für
+        unbegrenzt.
+        :return: `True`, wenn die Plätze reserviert wurden.
+        """
+        with self.get_queuing_lock():
+            if limit is not None and self.queued_or_active + count > limit:
+                return False
+            self.queued_or_active = self.queued_or_active + count
+            return True
+
+    def release_slot(self) -> None:
+        """
+        Gibt den Platz eines abgeschlossenen oder gelöschten Eintrags frei.
+        """
+        with self.get_queuing_lock():
+            self.queued_or_active = self.queued_or_active - 1
 
     # noinspection PyMethodOverriding
     class Entry(ABC):
@@ -30,6 +85,11 @@ class Default(ABC):
         Abstrakte Basisklasse für Moduleinträge.
 
         :var time: Die Erstellung Zeit
+        :var duration: Die Audiodauer in Sekunden
+        :var media_hash: Der SHA-256 der Mediendatei
+        :var callback_url: URL für die Benachrichtigung bei Abschluss
+        :var finished: Die Zeit des Abschlusses
+        :var timings: Die Zeitpunkte, zu denen der Job seine Phasen erreicht
         :var module: Die zugehörige Modulinstanz.
         :var uid: Die eindeutige ID des Eintrags.
         """
@@ -39,20 +99,31 @@ class Default(ABC):
                      module,
                      uid: str,
                      priority: int,
-                     time: float = time.time(),
+                     time: float | None = None,
                      status: int | None = None,
                      initial_prompt: str | None = None,
                      whisper_result: str | None = None,
                      whisper_language: str | None = None,
-                     whisper_model: str | None = None) -> None:
+                     whisper_model: str | None = None,
+                     duration: float | None = None,
+                     media_hash: str | None = None,
+                     callback_url: str | None = None,
+                     finished: float | None = None,
+                     timings: Dict[str, float] | None = None) -> None:
             """
             Initialisiert einen neuen Moduleintrag und
             verknüpft ihn mit dem Modul.
 
             :param uid: Die eindeutige ID des Eintrags.
+            :param time: Die Erstellungszeit, standardmäßig jetzt.
+            :param duration: Die Audiodauer in Sekunden, sobald bekannt.
+            :param media_hash: Der SHA-256 der Mediendatei, sobald bekannt.
+            :param callback_url: Die URL, an die der Endstatus gesendet wird.
+            :param finished: Die Zeit des Abschlusses, sobald abgeschlossen.
+            :param timings: Die Zeitpunkte der erreichten Phasen.
             """
             self.priority: int = priority
-            self.time: float = time
+            self.time: float = time if time is not None else current_time()
             self.module: Default = module
             self.uid: str = uid
             self.status: int | None = status
@@ -60,6 +131,20 @@ class Default(ABC):
             self.whisper_result: int | None = whisper_result
             self.whisper_language: str | None = whisper_language
             self.whisper_model: str | None = whisper_model
+            self.duration: float | None = duration
+            self.media_hash: str | None = media_hash
+            self.callback_url: str | None = callback_url
+            self.finished: float | None = finished
+            self.timings: Dict[str, float] = (dict(timings)
+                                              if timings is not None else {})
+
+        def mark(self, stage: str) -> None:
+            """
+            Merkt sich, dass der Job jetzt eine Phase erreicht hat.
+
+            :param stage: Der Name der Phase, z.B. "enqueued".
+            """
+            self.timings[stage] = current_time()
 
         def __lt__(self, other) -> bool:
             return self.time < other.time
@@ -77,7 +162,20 @@ class Default(ABC):
             Kann von Unterklassen implementiert werden.
             :param ts_api: Die aktuelle TsAPI Instanz.
             """
-            self.module.queued_or_active = self.module.queued_or_active + 1
+            self.module.reserve_slots()
+            return self.enqueue(ts_api)
+
+        def enqueue(self, ts_api) -> bool:
+            """
+            Fügt einen bereits gezählten Eintrag zur Warteschlange hinzu.
+
+            :param ts_api: Die aktuelle TsAPI Instanz.
+            :return: True, wenn der Job hinzugefügt wurde.
+            """
+            if (self.media_hash is not None
+                    and ts_api.deduplicator.resolve(self)):
+                # Gleiche Datei bereits transkribiert oder in Arbeit
+                return True
             ts_api.add_to_queue(self.priority, self)
             return True
 
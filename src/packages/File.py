@@ -41,15 +41,19 @@ class File(Default):
             super().__init__(module, uid, priority, **kwargs)
             logging.debug(f"Created File Module entry with id {self.uid}.")
 
-        def queuing(self, ts_api, file: FileStorage) -> bool:
+        def queuing(self, ts_api, file: FileStorage | None = None) -> bool:
             """
             Speichert die Datei und fügt einen Job zur Warteschlange hinzu.
 
             :param ts_api: Die aktuelle TsAPI Instanz.
-            :param file: Die Datei, die gespeichert werden soll.
+            :param file: Die Datei, die gespeichert werden soll. None, wenn
+                die Datei bereits als Upload im Spool liegt und media_hash
+                gesetzt ist.
             :return: True, wenn der Job erfolgreich hinzugefügt wurde.
             """
-            if utils.util.save_file(file, self.uid):
+            if file is not None:
+                self.media_hash = utils.util.save_file(file, self.uid)
+            if self.media_hash:
                 super().queuing(ts_api)
                 logging.debug(f"Queued File Module entry with id {self.uid}.")
                 return True
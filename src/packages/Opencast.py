@@ -1,11 +1,9 @@
 import logging
-import io
-
-from werkzeug.datastructures import FileStorage
+import threading
+from typing import Dict, List
 
 import utils
 import requests
-from requests import request
 
 from core.TsApi import TsApi
 from packages.Default import Default
@@ -19,21 +17,65 @@ class Opencast(Default):
     :var module_uid: Eindeutige ID des Moduls.
     :var queued_or_active: Anzahl der aktiven oder gequeten Einträge
     :var max_queue_length: Maximale Anzahl von Einträgen in der Warteschlange.
+    :var callback_url: Standard-URL für Benachrichtigungen bei Abschluss.
+    :var sessions: Wiederverwendete HTTP-Sessions je Modul (nicht
+    persistiert).
     """
 
+    sessions: Dict[str, requests.Session] = {}
+    sessions_lock = threading.Lock()
+
     def __init__(self, module_type="Opencast.Opencast", max_queue_length:
-                 int = 10, **kwargs) -> None:
+                 int = 10, callback_url: str | None = None,
+                 **kwargs) -> None:
         """
         Initialisiert ein Opencast-Modul mit einer maximalen
         Warteschlangenlänge.
 
         :param max_queue_length: Die maximale Anzahl an Jobs,
         die verarbeitet werden können.
+        :param callback_url: Die Standard-URL, an die der Endstatus der
+        Jobs gesendet wird.
         """
         super().__init__(module_type, **kwargs)
         self.max_queue_length: int = int(max_queue_length)
+        self.callback_url: str | None = callback_url
         logging.debug(f"Created Opencast Module with id {self.module_uid}.")
 
+    def get_session(self) -> requests.Session:
+        """
+        Gibt die HTTP-Session des Moduls zurück, damit Verbindungen zum
+        Opencast-Server zwischen Jobs wiederverwendet werden.
+
+        :return: Die Session des Moduls.
+        """
+        with Opencast.sessions_lock:
+            if self.module_uid not in Opencast.sessions:
+                Opencast.sessions[self.module_uid] = requests.Session()
+            return Opencast.sessions[self.module_uid]
+
+    def queuing_batch(self, ts_api: TsApi,
+                      module_entries: List["Opencast.Entry"]) -> bool:
+        """
+        Fügt mehrere Jobs gemeinsam zur Warteschlange hinzu, aber nur,
+        wenn für alle Platz vorhanden ist.
+
+        :param ts_api: Die aktuelle TsAPI Instanz.
+        :param module_entries: Die Einträge des Moduls.
+        :return: `True`, wenn die Jobs hinzugefügt wurden, `False`,
+        wenn sie die Warteschlange überfüllen würden.
+        """
+        if not self.reserve_slots(len(module_entries),
+                                  self.max_queue_length):
+            logging.debug(f"Refused to queue {len(module_entries)} "
+                          f"Opencast Module entries because of max "
+                          f"queue length.")
+            return False
+        ts_api.add_batch_to_queue(module_entries)
+        logging.debug(f"Queued {len(module_entries)} Opencast Module "
+                      f"entries.")
+        return True
+
     # noinspection PyMethodOverriding
     class Entry(Default.Entry):
         """
@@ -74,33 +116,28 @@ class Opencast(Default):
             :return: `True`, wenn der Job hinzugefügt wurde, `False`,
             wenn die Warteschlange voll ist.
             """
-            if self.module.queued_or_active < self.module.max_queue_length:
-                super().queuing(ts_api)
-                logging.debug(f"Queued Opencast Module entry with id"
-                              f" {self.uid}.")
-                return True
-            logging.debug(f"Refused to queue Opencast Module entry with id"
-                          f" {self.uid} because of max queue length.")
-            return False
+            # Nur die Reservierung des Platzes ist gesperrt, das Schreiben
+            # in das Journal läuft danach
+            if not self.module.reserve_slots(
+                    limit=self.module.max_queue_length):
+                logging.debug(f"Refused to queue Opencast Module entry with "
+                              f"id {self.uid} because of max queue length.")
+                return False
+            self.enqueue(ts_api)
+            logging.debug(f"Queued Opencast Module entry with id"
+                          f" {self.uid}.")
+            return True
 
         def preprocessing(self) -> None:
             """
-            Lädt die Datei von der angegebenen URL herunter und speichert
-            sie lokal.
+            Lädt die Datei von der angegebenen URL in Blöcken herunter und
+            speichert sie lokal. Abgebrochene Downloads werden fortgesetzt.
+            Der Hash der Datei wird beim Herunterladen berechnet.
             Falls der Download fehlschlägt, wird eine Exception ausgelöst.
 
             :raises Exception: Falls der Download fehlschlägt.
             """
             logging.debug(f"Downloading file for job id {self.uid}...")
-            session: request = requests.Session()
-            response = session.get(self.link)
-            if response.status_code != 200:
-                raise Exception("Failed to download file.")
-            file = FileStorage(
-                stream=io.BytesIO(response.content),
-                filename=self.uid,
-                content_length=response.headers.get("Content-Length"),
-                content_type=response.headers.get("Content-Type")
-            )
-            utils.util.save_file(file, self.uid)
+            self.media_hash = utils.util.download_file(
+                self.module.get_session(), self.link, self.uid)
             logging.debug(f"Downloaded file for job id {self.uid}.")
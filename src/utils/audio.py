@@ -0,0 +1,197 @@
+import bisect
+import os
+import subprocess
+from typing import List, Tuple
+
+import numpy as np
+
+# Whisper expects 16 kHz mono audio
+SAMPLE_RATE = 16000
+# Energy is measured in frames of 30 ms
+FRAME_LENGTH = 480
+
+
+def pcm_path(uid: str) -> str:
+    """
+    Returns the path of the decoded audio of a job
+    :param uid: The uid of the job
+    :return: The path of the raw PCM file
+    """
+    return os.path.join(".", "data", "audioInput", uid + ".pcm")
+
+
+def remove_files(uid: str) -> None:
+    """
+    Deletes the media and the decoded audio of a job, if they exist
+    :param uid: The uid of the job
+    :return: Nothing
+    """
+    for path in (os.path.join(".", "data", "audioInput", uid),
+                 pcm_path(uid)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def extract_audio(input_path: str, output_path: str) -> None:
+    """
+    Extracts the audio track of a media file as raw 16 kHz mono signed
+    16 bit PCM
+    :param input_path: The path of the media file
+    :param output_path: The path of the PCM file to create
+    :return: Nothing
+    :raises Exception: If ffmpeg fails
+    """
+    tmp_path = output_path + ".tmp"
+    result = subprocess.run(["ffmpeg", "-nostdin", "-y", "-i", input_path,
+                             "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE),
+                             "-f", "s16le", "-acodec", "pcm_s16le",
+                             tmp_path],
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise Exception("Failed to extract audio: "
+                        + result.stderr.decode(errors="replace")[-500:])
+    os.replace(tmp_path, output_path)
+
+
+def load_audio(path: str) -> np.ndarray:
+    """
+    Loads a PCM file created by extract_audio as float32 samples in the
+    range [-1, 1] as expected by whisper.cpp
+    :param path: The path of the PCM file
+    :return: The samples
+    """
+    samples = np.memmap(path, dtype=np.int16, mode="r")
+    # Scaled in place, so only one float32 copy exists at a time
+    output = samples.astype(np.float32)
+    output /= 32768.0
+    return output
+
+
+def duration(path: str) -> float:
+    """
+    Returns the duration of a PCM file created by extract_audio
+    :param path: The path of the PCM file
+    :return: The duration in seconds
+    """
+    return os.path.getsize(path) / 2 / SAMPLE_RATE
+
+
+def frame_energy(samples: np.ndarray) -> np.ndarray:
+    """
+    Computes the RMS energy of consecutive frames of FRAME_LENGTH samples
+    :param samples: The samples
+    :return: The energy per frame
+    """
+    n_frames = len(samples) // FRAME_LENGTH
+    frames = samples[:n_frames * FRAME_LENGTH].reshape(n_frames,
+                                                       FRAME_LENGTH)
+    return np.sqrt(np.einsum("ij,ij->i", frames, frames) / FRAME_LENGTH)
+
+
+def split_points(samples: np.ndarray, chunk_length: float,
+                 search_length: float = 30) -> List[int]:
+    """
+    Splits audio into chunks of about chunk_length seconds. Each cut is
+    placed at the quietest frame within search_length seconds around the
+    target position, so words are not cut in half
+    :param samples: The samples
+    :param chunk_length: The target length of a chunk in seconds
+    :param search_length: The distance to search for silence in seconds
+    :return: The sample indices of the chunk boundaries including the
+    start and the end of the audio
+    """
+    energy = frame_energy(samples)
+    chunk_frames = int(chunk_length * SAMPLE_RATE / FRAME_LENGTH)
+    search_frames = int(search_length * SAMPLE_RATE / FRAME_LENGTH)
+    points = [0]
+    while len(energy) - points[-1] // FRAME_LENGTH > 1.5 * chunk_frames:
+        start = points[-1] // FRAME_LENGTH
+        low = max(start + chunk_frames - search_frames, start + 1)
+        high = min(start + chunk_frames + search_frames, len(energy))
+        frame = low + int(np.argmin(energy[low:high]))
+        points.append(frame * FRAME_LENGTH)
+    points.append(len(samples))
+    return points
+
+
+def speech_regions(samples: np.ndarray, min_silence: float = 2.0,
+                   padding: float = 0.3, min_speech: float = 0.25
+                   ) -> List[Tuple[int, int]]:
+    """
+    Detects regions with speech by the energy of the audio. Frames louder
+    than three times the noise floor count as speech, pauses shorter than
+    min_silence are bridged
+    :param samples: The samples
+    :param min_silence: The minimum length of a skipped pause in seconds
+    :param padding: Audio kept before and after each region in seconds
+    :param min_speech: The minimum length of a region in seconds
+    :return: The (start, end) sample indices of the regions
+    """
+    energy = frame_energy(samples)
+    if len(energy) == 0:
+        return []
+    noise_floor = float(np.percentile(energy, 10))
+    threshold = max(3 * noise_floor, 0.005)
+    speech = np.flatnonzero(energy > threshold)
+    if len(speech) == 0:
+        return []
+    frame_rate = SAMPLE_RATE / FRAME_LENGTH
+    # Split where the gap between speech frames is long enough
+    gaps = np.flatnonzero(np.diff(speech) > min_silence * frame_rate)
+    starts = np.concatenate(([speech[0]], speech[gaps + 1]))
+    ends = np.concatenate((speech[gaps], [speech[-1]])) + 1
+    pad = int(padding * SAMPLE_RATE)
+    regions = []
+    for start, end in zip(starts * FRAME_LENGTH, ends * FRAME_LENGTH):
+        if end - start < min_speech * SAMPLE_RATE:
+            continue
+        start = max(int(start) - pad, 0)
+        end = min(int(end) + pad, len(samples))
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def compact(samples: np.ndarray, regions: List[Tuple[int, int]]
+            ) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """
+    Joins the regions of the audio into one buffer
+    :param samples: The samples
+    :param regions: The (start, end) sample indices to keep
+    :return: The joined samples and the time map as (position in the
+    joined samples, position in the original samples) per region
+    """
+    time_map = []
+    position = 0
+    for start, end in regions:
+        time_map.append((position, start))
+        position = position + end - start
+    if not regions:
+        return np.zeros(0, dtype=samples.dtype), time_map
+    return np.concatenate([samples[start:end]
+                           for start, end in regions]), time_map
+
+
+def remap(segments: List, time_map: List[Tuple[int, int]]) -> List:
+    """
+    Shifts segment timestamps of joined audio back onto the original
+    timeline
+    :param segments: The segments with timestamps in 10 ms steps
+    :param time_map: The time map returned by compact
+    :return: The segments
+    """
+    positions = [position * 100 // SAMPLE_RATE for position, _ in time_map]
+    offsets = [(original - position) * 100 // SAMPLE_RATE
+               for position, original in time_map]
+    for segment in segments:
+        start_index = max(bisect.bisect_right(positions, segment.t0) - 1, 0)
+        # Segments ending exactly at a cut belong to the earlier region
+        end_index = max(bisect.bisect_left(positions, segment.t1) - 1, 0)
+        segment.t0 = segment.t0 + offsets[start_index]
+        segment.t1 = segment.t1 + offsets[end_index]
+    return segments
@@ -0,0 +1,157 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from pywhispercpp.utils import to_timestamp
+
+MIMETYPES: Dict[str, str] = {
+    "vtt": "text/vtt",
+    "srt": "application/x-subrip",
+    "txt": "text/plain",
+    "csv": "text/csv",
+}
+
+
+def render(segments: List, output_format: str) -> str:
+    """
+    Renders segments in memory, with the same output as the writers of
+    pywhispercpp.utils
+    :param segments: The segments with timestamps in 10 ms steps
+    :param output_format: vtt, srt, txt or csv
+    :return: The captions
+    :raises ValueError: If the format is not supported
+    """
+    if output_format == "vtt":
+        return "WEBVTT\n\n" + "".join(
+            f"{to_timestamp(seg.t0, separator='.')} --> "
+            f"{to_timestamp(seg.t1, separator='.')}\n{seg.text}\n\n"
+            for seg in segments)
+    if output_format == "srt":
+        return "".join(
+            f"{index + 1}\n{to_timestamp(seg.t0, separator=',')} --> "
+            f"{to_timestamp(seg.t1, separator=',')}\n{seg.text}\n\n"
+            for index, seg in enumerate(segments))
+    if output_format == "txt":
+        return "".join(f"{seg.text}\n" for seg in segments)
+    if output_format == "csv":
+        return "".join(f"{10 * seg.t0}, {10 * seg.t1}, \"{seg.text}\"\n"
+                       for seg in segments)
+    raise ValueError(f"Output format {output_format} not supported")
+
+
+class Caption:
+    def __init__(self, key: Tuple[str, str], body: bytes):
+        """
+        Creates a rendered caption file
+        :param key: The uid of the job and the format
+        :param body: The encoded captions
+        """
+        self.key: Tuple[str, str] = key
+        self.body: bytes = body
+        self.etag: str = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.gzip_body: bytes | None = None
+
+    def size(self) -> int:
+        """
+        Returns the memory used by the caption file
+        :return: The size in bytes
+        """
+        return len(self.body) + len(self.gzip_body or b"")
+
+    def compressed(self) -> bytes:
+        """
+        Returns the gzip compressed captions, compressed on first use
+        :return: The compressed captions
+        """
+        if self.gzip_body is None:
+            self.gzip_body = gzip.compress(self.body, compresslevel=6)
+        return self.gzip_body
+
+
+class CaptionCache:
+    def __init__(self, max_bytes: int = 64000000):
+        """
+        Creates the LRU cache of rendered captions per job and format
+        :param max_bytes: The maximum size of all cached captions
+        """
+        self.max_bytes: int = max_bytes
+        self.lock = threading.Lock()
+        self.captions: OrderedDict[Tuple[str, str], Caption] = OrderedDict()
+        self.bytes: int = 0
+        # Changes on every invalidation, so renders of an old result are
+        # not cached
+        self.generation: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, uid: str, output_format: str, database) -> Caption | None:
+        """
+        Returns the captions of a job, rendered on a cache miss
+        :param uid: The uid of the job
+        :param output_format: vtt, srt, txt or csv
+        :param database: The database to load the result from
+        :return: The captions or None if the job has no result
+        """
+        key = (uid, output_format)
+        with self.lock:
+            caption = self.captions.get(key)
+            if caption is not None:
+                self.captions.move_to_end(key)
+                self.hits = self.hits + 1
+                return caption
+            self.misses = self.misses + 1
+            generation = self.generation
+        whisper_result = database.load_result(uid)
+        if whisper_result is None:
+            return None
+        caption = Caption(key, render(whisper_result,
+                                      output_format).encode("utf-8"))
+        if caption.size() <= self.max_bytes:
+            with self.lock:
+                if generation == self.generation:
+                    self._put(key, caption)
+        return caption
+
+    def compressed(self, caption: Caption) -> bytes:
+        """
+        Returns the gzip compressed captions and accounts their size
+        :param caption: The captions
+        :return: The compressed captions
+        """
+        with self.lock:
+            if caption.gzip_body is not None:
+                return caption.gzip_body
+            size = caption.size()
+            body = caption.compressed()
+            if self.captions.get(caption.key) is caption:
+                self.bytes = self.bytes + caption.size() - size
+                self._evict()
+            return body
+
+    def invalidate(self, uid: str) -> None:
+        """
+        Removes the cached captions of a job
+        :param uid: The uid of the job
+        :return: Nothing
+        """
+        with self.lock:
+            self.generation = self.generation + 1
+            for output_format in MIMETYPES:
+                caption = self.captions.pop((uid, output_format), None)
+                if caption is not None:
+                    self.bytes = self.bytes - caption.size()
+
+    def _put(self, key: Tuple[str, str], caption: Caption) -> None:
+        old = self.captions.pop(key, None)
+        if old is not None:
+            self.bytes = self.bytes - old.size()
+        self.captions[key] = caption
+        self.bytes = self.bytes + caption.size()
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.bytes > self.max_bytes and self.captions:
+            _, caption = self.captions.popitem(last=False)
+            self.bytes = self.bytes - caption.size()
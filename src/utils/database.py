@@ -1,149 +1,334 @@
 import json
 import logging
 import os
+import sqlite3
+import threading
+import time
 import numpy as np
 
 from pydoc import locate
 
-from queue import PriorityQueue
-from typing import Dict
+from typing import Callable, Dict, List, Set, Tuple
+
+from pywhispercpp.model import Segment
 
 from packages.Default import Default
+from utils.job_queue import FairShare, JobQueue
+from utils.journal import Journal
+from utils.transcript import Transcript
+
+DATABASE_PATH = "./data/database.sqlite"
+JOURNAL_PATH = "./data/journal.log"
+# Finished, failed and canceled jobs are not kept in memory
+FINAL_STATUS = (3, 4, 5)
+# Interrupted jobs are queued again on startup
+INTERRUPTED_STATUS = (1, 2, 6)
+
+
+def safe_serialize(o):
+    if isinstance(o, Transcript):
+        return o.to_dict()
+    elif hasattr(o, '__dict__'):
+        return o.__dict__
+    elif isinstance(o, (np.float32, np.float64)):
+        return float(o)
+    elif isinstance(o, (np.int32, np.int64)):
+        return int(o)
+    elif isinstance(o, np.ndarray):
+        return o.tolist()
+    else:
+        return str(o)
 
 
 class Database:
     modules: [str, Default] = {}
     module_entrys: [str, Default.Entry] = {}
-    queue: PriorityQueue[(int, Default.Entry)] = PriorityQueue()
+    queue: JobQueue = JobQueue()
 
-    def __init__(self):
+    def __init__(self, path: str = DATABASE_PATH,
+                 journal_path: str = JOURNAL_PATH):
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS modules ("
+                "uid TEXT PRIMARY KEY, module_type TEXT NOT NULL, "
+                "data TEXT NOT NULL)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "uid TEXT PRIMARY KEY, module_uid TEXT NOT NULL, "
+                "module_type TEXT NOT NULL, status INTEGER, "
+                "priority INTEGER, time REAL, data TEXT NOT NULL, "
+                "whisper_result TEXT)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_status "
+                                    "ON jobs (status)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_module "
+                                    "ON jobs (module_uid)")
+            # Finished job by hash of media, model and prompt
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, uid TEXT NOT NULL)")
+        # Changes since the last compaction, by uid
+        self.pending_modules: Dict[str, List] = {}
+        self.pending_jobs: Dict[str, List] = {}
+        self.pending_results: Dict[str, str] = {}
+        self.pending_deletes: Set[str] = set()
+        self.pending_index: Dict[str, str] = {}
+        # Called with the uid when the result of a job changes
+        self.result_listeners: List[Callable[[str], None]] = []
+        # Last read of the result by uid, for the retention (not persisted)
+        self.result_access: Dict[str, float] = {}
+        # Replay changes that did not reach the snapshot before a crash
+        records = Journal.read(journal_path)
+        for record in records:
+            self.track(record)
+        self.journal: Journal = Journal(
+            journal_path,
+            flush_interval=float(os.environ.get("journal_flush_interval",
+                                                50)) / 1000,
+            compact_size=int(os.environ.get("journal_compact_size",
+                                            4000000)),
+            compact_interval=float(os.environ.get(
+                "journal_compact_interval", 60)),
+            on_compact=self.compact)
+        if records:
+            logging.info(f"Replayed {len(records)} journal records.")
+        self.compact()
+        self.import_json_database()
         # Load Modules
         logging.debug("Loading Modules from database.")
         modules: Dict[str, Default] = {}
+        for module_type_name, data in self.execute(
+                "SELECT module_type, data FROM modules").fetchall():
+            module_type: object = locate("packages." + module_type_name)
+            module: module_type = module_type(**json.loads(data))
+            module.queued_or_active = 0
+            modules[module.module_uid] = module
+        self.modules = modules
+        # Load unfinished module entrys and rebuild queue
+        logging.debug("Loading queue from database.")
+        self.module_entrys: Dict[str, Default.Entry] = {}
+        fair_share: FairShare | None = None
+        if os.environ.get("fair_queuing", "true").lower() == "true":
+            fair_share = FairShare(
+                quantum=float(os.environ.get("fair_quantum", 600)))
+        self.queue: JobQueue = JobQueue(fair_share=fair_share)
+        for row in self.execute(
+                "SELECT uid, module_uid, module_type, data FROM jobs "
+                "WHERE status IS NULL OR status NOT IN (?, ?, ?)",
+                FINAL_STATUS).fetchall():
+            module_entry = self.build_job(*row)
+            if module_entry is None:
+                continue
+            if module_entry.status in INTERRUPTED_STATUS:
+                module_entry.status = 0  # Queued
+                self.save_job(module_entry)
+            module_entry.module.reserve_slots()
+            self.module_entrys[module_entry.uid] = module_entry
+            self.queue.put((module_entry.priority, module_entry))
+
+    def execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        """
+        Executes a statement in its own transaction
+        :param sql: The statement
+        :param parameters: The parameters of the statement
+        :return: The cursor
+        """
+        with self.lock, self.connection:
+            return self.connection.execute(sql, parameters)
+
+    def build_job(self, uid: str, module_uid: str, module_type: str,
+                  data: str) -> Default.Entry | None:
+        """
+        Rebuilds a module entry from a database row without its result
+        :param uid: The uid of the job
+        :param module_uid: The uid of the module of the job
+        :param module_type: The type of the module of the job
+        :param data: The serialized attributes of the job
+        :return: The module entry or None if the module does not exist
+        """
+        module: Default = self.modules.get(module_uid)
+        if module is None:
+            logging.error(f"Module {module_uid} of job with id {uid} "
+                          f"not found.")
+            return None
+        module_entry_type: object = locate("packages." + module_type
+                                           + ".Entry")
+        module_entry_data_raw = json.loads(data)
+        module_entry_data_raw["module"] = module
+        return module_entry_type(**module_entry_data_raw)
+
+    def import_json_database(self) -> None:
+        """
+        Imports and removes the JSON files of older versions
+        :return: Nothing
+        """
         for file_name in os.listdir("./data/moduleDatabase"):
             if file_name.endswith(".json"):
                 file_path = os.path.join("./data/moduleDatabase", file_name)
                 with open(file_path, "r", encoding="utf-8") as file:
                     module_data_raw = json.load(file)
-                    module_type: object = locate("packages." + module_data_raw[
-                        "module_type"])
-                    module: module_type = module_type(**module_data_raw)
-                    modules[module.module_uid] = module
-        self.modules = modules
-        # Load Module Entrys
-        module_entrys: Dict[str, Default.Entry] = {}
+                module_type: object = locate("packages." + module_data_raw[
+                    "module_type"])
+                self.add_module(module_type(**module_data_raw))
+                os.remove(file_path)
         for file_name in os.listdir("./data/jobDatabase"):
             if file_name.endswith(".json"):
                 file_path = os.path.join("./data/jobDatabase", file_name)
                 with open(file_path, "r", encoding="utf-8") as file:
-                    # Rebuild module_entry
                     module_entry_data_raw = json.load(file)
-                    module_entry_type: object = locate("packages."
-                                                       + module_entry_data_raw[
-                                                           "module"][
-                                                           "module_type"]
-                                                       + ".Entry")
-                    # Find module and insert link
-                    module_type: object = locate("packages."
-                                                 + module_entry_data_raw[
-                                                     "module"]["module_type"])
-                    module: module_type = self.modules.get(
-                        module_entry_data_raw["module"]["module_uid"])
-                    module_entry_data_raw["module"] = module
-                    # Insert module_entry
-                    module_entry: module_entry_type = module_entry_type(
-                        **module_entry_data_raw)
-                    module_entrys[module_entry.uid] = module_entry
-        self.module_entrys = module_entrys
-        # Load Queue
-        logging.debug("Loading queue from database.")
-        queue: PriorityQueue[(int, Default.Entry)] = PriorityQueue()
+                module = module_entry_data_raw.pop("module")
+                whisper_result = module_entry_data_raw.pop("whisper_result",
+                                                           None)
+                self.write({"op": "job",
+                            "row": [module_entry_data_raw["uid"],
+                                    module["module_uid"],
+                                    module["module_type"],
+                                    module_entry_data_raw.get("status"),
+                                    module_entry_data_raw.get("priority"),
+                                    module_entry_data_raw.get("time"),
+                                    json.dumps(module_entry_data_raw)],
+                            "result": json.dumps(whisper_result)},
+                           wait=True)
+                os.remove(file_path)
         if os.path.exists("./data/queue.json"):
-            with (open("./data/queue.json", "r") as file):
-                queue_data = json.load(file)
-                while len(queue_data) > 0:
-                    priority, module_entry_data_raw = queue_data.pop()
-                    # Find module_entry and insert
-                    module_entry_type: object = locate("packages."
-                                                       + module_entry_data_raw[
-                                                           "module"][
-                                                           "module_type"]
-                                                       + ".Entry")
-                    module_entry: module_entry_type = self.module_entrys.get(
-                        module_entry_data_raw["uid"])
-                    # Rebuild queue
-                    queue.put((priority, module_entry))
-        self.queue = queue
+            os.remove("./data/queue.json")
+        self.compact()
 
     def save_database(self) -> bool:
         """
-        Saves the given database to the storage
+        Saves the modules and unfinished jobs to the storage
         :return: Nothing
         """
-
-        def safe_serialize(o):
-            if hasattr(o, '__dict__'):
-                return o.__dict__
-            elif isinstance(o, (np.float32, np.float64)):
-                return float(o)
-            elif isinstance(o, (np.int32, np.int64)):
-                return int(o)
-            elif isinstance(o, np.ndarray):
-                return o.tolist()
-            else:
-                return str(o)
-
-        # Safe Modules
         try:
             logging.debug("Saving modules to database.")
-            for uid, module in self.modules.items():
-                if module.queued_or_active == 0:
-                    if os.path.exists("./data/moduleDatabase/"
-                                      + uid + ".json"):
-                        os.remove("./data/moduleDatabase/" + uid + ".json")
-                    continue
-                with open("./data/moduleDatabase/" + uid + ".json",
-                          "w+") as file:
-                    file.seek(0)
-                    file.write(
-                        json.dumps(module, default=lambda o: o.__dict__))
-                    file.truncate()
-        except Exception as e:
-            logging.error(e)
-            return False
-        # Safe module_entrys
-        try:
+            for module in list(self.modules.values()):
+                self.add_module(module)
             logging.debug("Saving module entrys to database.")
-
-            delete_able_files = [f for f in os.listdir(
-                "./data/jobDatabase/") if f.endswith(".json")
-                and (f.split(".")[0] not in
-                     self.module_entrys.keys())]
-            for delete_able_file in delete_able_files:
-                os.remove("./data/jobDatabase/" + delete_able_file)
-
-            for uid, module in self.module_entrys.items():
-                with open("./data/jobDatabase/" + uid + ".json",
-                          "w+") as file:
-                    file.seek(0)
-                    file.write(
-                        json.dumps(module, default=safe_serialize))
-                    file.truncate()
-        except Exception as e:
-            logging.error(e)
-            return False
-        # Safe queue
-        try:
-            logging.debug("Saving queue to database.")
-            with open("./data/queue.json", "w+") as file:
-                file.seek(0)
-                file.write(json.dumps(
-                    self.queue.queue, default=lambda o: o.__dict__))
-                file.truncate()
+            for module_entry in list(self.module_entrys.values()):
+                self.save_job(module_entry)
+            self.compact()
+            return True
         except Exception as e:
             logging.error(e)
             return False
 
+    def save_job(self, module_entry: Default.Entry,
+                 save_result: bool = False, wait: bool | None = None) -> int:
+        """
+        Writes a job to the storage
+        :param module_entry: The module entry to write
+        :param save_result: Also write the whisper result
+        :param wait: Wait until the change is durable, by default when the
+        whisper result is written
+        :return: The sequence number of the change in the journal
+        """
+        data = {key: value for key, value in module_entry.__dict__.items()
+                if key not in ("module", "whisper_result")}
+        record = {"op": "job",
+                  "row": [module_entry.uid, module_entry.module.module_uid,
+                          module_entry.module.module_type,
+                          module_entry.status, module_entry.priority,
+                          module_entry.time,
+                          json.dumps(data, default=safe_serialize)]}
+        if save_result:
+            record["result"] = json.dumps(module_entry.whisper_result,
+                                          default=safe_serialize)
+        return self.write(record,
+                          wait=save_result if wait is None else wait)
+
+    def write(self, record: Dict, wait: bool = False) -> int:
+        """
+        Journals a change. It reaches the snapshot with the next compaction
+        :param record: The change
+        :param wait: Wait until the change is durable
+        :return: The sequence number of the change in the journal
+        """
+        with self.lock:
+            sequence = self.journal.append(record)
+            self.track(record)
+        if wait:
+            self.journal.wait(sequence)
+        return sequence
+
+    def track(self, record: Dict) -> None:
+        """
+        Remembers a journaled change until the next compaction
+        :param record: The change
+        :return: Nothing
+        """
+        with self.lock:
+            if record["op"] == "module":
+                self.pending_modules[record["row"][0]] = record["row"]
+            elif record["op"] == "job":
+                uid = record["row"][0]
+                self.pending_deletes.discard(uid)
+                self.pending_jobs[uid] = record["row"]
+                if "result" in record:
+                    self.pending_results[uid] = record["result"]
+            elif record["op"] == "delete":
+                self.pending_jobs.pop(record["uid"], None)
+                self.pending_results.pop(record["uid"], None)
+                self.pending_deletes.add(record["uid"])
+            elif record["op"] == "index":
+                self.pending_index[record["key"]] = record["uid"]
+
+    def compact(self) -> None:
+        """
+        Writes all journaled changes into the snapshot in one transaction
+        and truncates the journal
+        :return: Nothing
+        """
+        with self.lock:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO modules VALUES (?, ?, ?)",
+                    self.pending_modules.values())
+                self.connection.executemany(
+                    "DELETE FROM jobs WHERE uid = ?",
+                    [(uid,) for uid in self.pending_deletes])
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?)",
+                    self.pending_index.items())
+                self.connection.executemany(
+                    "DELETE FROM results WHERE uid = ?",
+                    [(uid,) for uid in self.pending_deletes])
+                self.connection.executemany(
+                    "INSERT INTO jobs (uid, module_uid, module_type, "
+                    "status, priority, time, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (uid) DO UPDATE SET "
+                    "module_uid = excluded.module_uid, "
+                    "module_type = excluded.module_type, "
+                    "status = excluded.status, "
+                    "priority = excluded.priority, "
+                    "time = excluded.time, data = excluded.data",
+                    self.pending_jobs.values())
+                self.connection.executemany(
+                    "UPDATE jobs SET whisper_result = ? WHERE uid = ?",
+                    [(result, uid)
+                     for uid, result in self.pending_results.items()])
+            self.journal.truncate()
+            self.pending_modules.clear()
+            self.pending_jobs.clear()
+            self.pending_results.clear()
+            self.pending_deletes.clear()
+            self.pending_index.clear()
+
+    def close(self) -> None:
+        """
+        Writes the journaled changes into the snapshot, stops the flush
+        thread of the journal and closes the storage
+        :return: Nothing
+        """
+        if not self.journal.running:
+            return
+        self.compact()
+        self.journal.close()
+        with self.lock:
+            self.connection.close()
+
     def add_module(self, module: Default) -> bool:
         """
         Adds a job to the Database
@@ -154,6 +339,11 @@ class Database:
             logging.debug("Adding job with id " + module.module_uid
                           + " to database.")
             self.modules[module.module_uid] = module
+            self.write({"op": "module",
+                        "row": [module.module_uid, module.module_type,
+                                json.dumps(module,
+                                           default=lambda o: o.__dict__)]},
+                       wait=True)
             return True
         except Exception as e:
             logging.error(e)
@@ -168,7 +358,29 @@ class Database:
         try:
             logging.debug("Adding job with id " + module_entry.uid
                           + " to database.")
-            self.module_entrys[module_entry.uid] = module_entry
+            with self.lock:
+                self.module_entrys[module_entry.uid] = module_entry
+            self.save_job(module_entry, save_result=True)
+            return True
+        except Exception as e:
+            logging.error(e)
+            return False
+
+    def add_jobs(self, module_entries: List[Default.Entry]) -> bool:
+        """
+        Adds several jobs to the Database. The jobs share one wait for the
+        journal instead of one per job
+        :param module_entries: The corresponding module entries
+        :return: Nothing
+        """
+        try:
+            sequence = 0
+            for module_entry in module_entries:
+                with self.lock:
+                    self.module_entrys[module_entry.uid] = module_entry
+                sequence = self.save_job(module_entry, save_result=True,
+                                         wait=False)
+            self.journal.wait(sequence)
             return True
         except Exception as e:
             logging.error(e)
@@ -176,12 +388,105 @@ class Database:
 
     def load_job(self, uid: str) -> Default.Entry:
         """
-        Loads a job for a given uid
+        Loads a job for a given uid. Finished jobs are loaded from the
+        storage without their whisper result (see load_result)
         :param uid: The uid from the job to load
         :return: The job data as a json object
         """
         logging.debug("Loading job with id " + uid + " from database.")
-        return self.module_entrys[uid]
+        module_entry = self.module_entrys.get(uid)
+        if module_entry is not None:
+            return module_entry
+        with self.lock:
+            row = self.pending_jobs.get(uid)
+            if row is not None:
+                return self.build_job(*row[:3], row[6])
+            if uid not in self.pending_deletes:
+                row = self.execute("SELECT uid, module_uid, module_type, "
+                                   "data FROM jobs WHERE uid = ?",
+                                   (uid,)).fetchone()
+        if row is None:
+            raise KeyError(uid)
+        return self.build_job(*row)
+
+    def load_result(self, uid: str) -> Transcript | None:
+        """
+        Loads the whisper result of a job
+        :param uid: The uid from the job
+        :return: The whisper result
+        """
+        self.touch(uid)
+        module_entry = self.module_entrys.get(uid)
+        if module_entry is not None and module_entry.whisper_result:
+            return module_entry.whisper_result
+        with self.lock:
+            if uid in self.pending_deletes:
+                return None
+            whisper_result = self.pending_results.get(uid)
+            if whisper_result is None:
+                row = self.execute("SELECT whisper_result FROM jobs "
+                                   "WHERE uid = ?", (uid,)).fetchone()
+                whisper_result = row[0] if row else None
+        if whisper_result is None:
+            return None
+        whisper_result = json.loads(whisper_result)
+        if isinstance(whisper_result, dict):
+            return Transcript.from_dict(whisper_result)
+        if isinstance(whisper_result, list):
+            # Stored by older versions as one object per segment
+            return Transcript.from_segments(Segment(**segment)
+                                            for segment in whisper_result)
+        return whisper_result
+
+    def touch(self, uid: str) -> None:
+        """
+        Remembers that the result of a job was read
+        :param uid: The uid from the job
+        :return: Nothing
+        """
+        self.result_access[uid] = time.time()
+
+    def finished_jobs(self) -> List[Tuple[str, str, int, float, float, int]]:
+        """
+        Lists the finished jobs. Journaled changes are compacted first, so
+        the snapshot is complete
+        :return: The uid, module uid, status, finish time, last access and
+        result size in bytes of each finished job
+        """
+        self.compact()
+        rows = self.execute(
+            "SELECT uid, module_uid, status, "
+            "COALESCE(json_extract(data, '$.finished'), time, 0), "
+            "COALESCE(length(CAST(whisper_result AS BLOB)), 0) "
+            "FROM jobs WHERE status IN (?, ?, ?)", FINAL_STATUS).fetchall()
+        return [(uid, module_uid, status, finished,
+                 max(finished, self.result_access.get(uid, 0)), size)
+                for uid, module_uid, status, finished, size in rows]
+
+    def add_result_index(self, key: str, uid: str) -> None:
+        """
+        Remembers the finished job for a hash of media, model and prompt
+        :param key: The hash
+        :param uid: The uid of the finished job
+        :return: Nothing
+        """
+        self.write({"op": "index", "key": key, "uid": uid})
+
+    def find_result_index(self, key: str) -> str | None:
+        """
+        Looks up the finished job for a hash of media, model and prompt
+        :param key: The hash
+        :return: The uid of the job or None if there is none
+        """
+        with self.lock:
+            uid = self.pending_index.get(key)
+            if uid is None:
+                row = self.execute("SELECT uid FROM results WHERE key = ?",
+                                   (key,)).fetchone()
+                uid = row[0] if row else None
+            if uid is None or uid in self.pending_deletes:
+                return None
+            return uid
 
     def delete_job(self, uid: str) -> bool:
         """
@@ -191,12 +496,50 @@ class Database:
         """
         try:
             logging.debug("Deleting job with id " + uid + " from database.")
-            self.module_entrys.pop(uid)
-            return True
+            exists = self.exists_job(uid)
+            with self.lock:
+                self.module_entrys.pop(uid, None)
+            self.result_access.pop(uid, None)
+            self.write({"op": "delete", "uid": uid})
+            self.result_changed(uid)
+            return exists
         except Exception as e:
             logging.error(e)
             return False
 
+    def result_changed(self, uid: str) -> None:
+        """
+        Informs the listeners that the result of a job changed
+        :param uid: The uid of the job
+        :return: Nothing
+        """
+        for listener in self.result_listeners:
+            listener(uid)
+
+    def job_statuses(self, uids: List[str]) -> Dict[str, int | None]:
+        """
+        Looks up the status of several jobs with one query per 500 jobs
+        :param uids: The uids from the jobs
+        :return: The status by uid of the jobs that exist
+        """
+        statuses: Dict[str, int | None] = {}
+        missing: List[str] = []
+        with self.lock:
+            for uid in dict.fromkeys(uids):
+                module_entry = self.module_entrys.get(uid)
+                if module_entry is not None:
+                    statuses[uid] = module_entry.status
+                elif uid in self.pending_jobs:
+                    statuses[uid] = self.pending_jobs[uid][3]
+                elif uid not in self.pending_deletes:
+                    missing.append(uid)
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                statuses.update(self.execute(
+                    "SELECT uid, status FROM jobs WHERE uid IN ("
+                    + ", ".join("?" * len(chunk)) + ")", chunk).fetchall())
+        return statuses
+
     def exists_job(self, uid: str) -> bool:
         """
         Checks if a job for a given uid exists
@@ -205,7 +548,15 @@ class Database:
         """
         logging.debug("Checking existence of job with id " + uid + " in "
                                                                    "database.")
-        return self.module_entrys.get(uid) is not None
+        if self.module_entrys.get(uid) is not None:
+            return True
+        with self.lock:
+            if uid in self.pending_jobs:
+                return True
+            if uid in self.pending_deletes:
+                return False
+            return self.execute("SELECT 1 FROM jobs WHERE uid = ?",
+                                (uid,)).fetchone() is not None
 
     def change_job_entry(self, uid: str, entry: str, input) -> bool:
         """
@@ -218,8 +569,19 @@ class Database:
         try:
             logging.debug(f"Changing {entry} of job with id "
                           + uid + f" to {input}.")
-            module_entry: Default.Entry = self.module_entrys.get(uid)
+            module_entry: Default.Entry = self.load_job(uid)
+            if entry == "whisper_result" and isinstance(input, list):
+                input = Transcript.from_segments(input)
             setattr(module_entry, entry, input)
+            if entry == "status" and input in FINAL_STATUS:
+                module_entry.finished = time.time()
+            self.save_job(module_entry,
+                          save_result=(entry == "whisper_result"))
+            if entry == "whisper_result":
+                self.result_changed(uid)
+            if entry == "status" and input in FINAL_STATUS:
+                with self.lock:
+                    self.module_entrys.pop(uid, None)
             return True
         except Exception as e:
             logging.error(e)
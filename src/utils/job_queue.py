@@ -0,0 +1,187 @@
+import copy
+import heapq
+
+from queue import PriorityQueue
+from typing import Any, Callable, Dict, List, Tuple
+
+from packages.Default import Default
+
+
+class FairShare:
+    """
+    Deficit round robin over the modules. Each visit credits a module with
+    quantum times its weight seconds of audio, a job is started once the
+    credit covers its duration
+    """
+
+    def __init__(self, quantum: float = 600):
+        """
+        Creates the fair share state
+        :param quantum: Seconds of audio credited per round and weight
+        """
+        self.quantum: float = quantum
+        self.deficits: Dict[str, float] = {}
+        self.order: List[str] = []
+        self.position: int = 0
+        self.credited: bool = False
+
+    def select(self, heads: Dict[str, Tuple[float, float]]) -> str:
+        """
+        Chooses the module whose job is started next
+        :param heads: The weight and the cost of the next job by module uid
+        :return: The uid of the chosen module
+        """
+        # Modules without waiting jobs leave the round and lose their credit
+        for index in reversed(range(len(self.order))):
+            if self.order[index] not in heads:
+                del self.deficits[self.order.pop(index)]
+                if index < self.position:
+                    self.position = self.position - 1
+                elif index == self.position:
+                    self.credited = False
+        for module_uid in heads:
+            if module_uid not in self.deficits:
+                self.deficits[module_uid] = 0
+                self.order.append(module_uid)
+        while True:
+            self.position = self.position % len(self.order)
+            module_uid = self.order[self.position]
+            weight, cost = heads[module_uid]
+            if not self.credited:
+                self.deficits[module_uid] = (self.deficits[module_uid]
+                                             + self.quantum * weight)
+                self.credited = True
+            if self.deficits[module_uid] >= cost:
+                self.deficits[module_uid] = self.deficits[module_uid] - cost
+                return module_uid
+            self.position = self.position + 1
+            self.credited = False
+
+
+class JobQueue(PriorityQueue):
+    """
+    Priority queue of (priority, module_entry) tuples that additionally
+    allows looking at and taking entries which are not at the head. With a
+    fair share, entries are taken from the modules in turn
+    """
+
+    def __init__(self, maxsize: int = 0, fair_share: FairShare | None = None):
+        """
+        Creates the queue
+        :param maxsize: The maximum number of entries, 0 for no limit
+        :param fair_share: The fair share state or None for global order
+        """
+        super().__init__(maxsize)
+        self.fair_share: FairShare | None = fair_share
+
+    def peek(self, n: int) -> List[Default.Entry]:
+        """
+        Returns the next n entries in queue order without removing them
+        :param n: The number of entries to return
+        :return: The entries
+        """
+        with self.mutex:
+            return [item[1] for item in heapq.nsmallest(n, self.queue)]
+
+    def take(self, predicate: Callable[[Default.Entry], bool],
+             key: Callable[[Default.Entry], Any] | None = None,
+             fair: bool = False) -> Tuple[int, Default.Entry] | None:
+        """
+        Removes and returns the first item whose entry matches the predicate
+        :param predicate: Function deciding if an entry may be taken
+        :param key: Function returning the sort key of an entry, queue order
+        if None
+        :param fair: Take the items of the modules in turn if the queue has a
+        fair share
+        :return: The (priority, module_entry) item or None
+        """
+        with self.mutex:
+            candidates = [item for item in self.queue if predicate(item[1])]
+            if not candidates:
+                return None
+            if key is None:
+                item = min(candidates)
+            else:
+                item = min(candidates, key=lambda c: key(c[1]))
+            if fair and self.fair_share is not None:
+                item = self._fair_item(self.fair_share, candidates, item, key)
+            self.queue.remove(item)
+            heapq.heapify(self.queue)
+            self.not_full.notify()
+            return item
+
+    def order(self, predicate: Callable[[Default.Entry], bool], n: int,
+              key: Callable[[Default.Entry], Any] | None = None,
+              fair: bool = False,
+              default_duration: float = 1) -> List[Default.Entry]:
+        """
+        Returns the first n entries matching the predicate in the order take
+        would remove them, without removing them. The fair share is played
+        on a copy, its state is not changed
+        :param predicate: Function deciding if an entry may be taken
+        :param n: The number of entries to return
+        :param key: Function returning the sort key of an entry, queue order
+        if None
+        :param fair: Order the items of the modules in turn if the queue has
+        a fair share
+        :param default_duration: Seconds of audio assumed by the fair share
+        for entries whose duration is not known yet
+        :return: The entries
+        """
+        with self.mutex:
+            candidates = [item for item in self.queue if predicate(item[1])]
+            fair_share = copy.deepcopy(self.fair_share) if fair else None
+        entries = []
+        while candidates and len(entries) < n:
+            if key is None:
+                item = min(candidates)
+            else:
+                item = min(candidates, key=lambda c: key(c[1]))
+            if fair_share is not None:
+                item = self._fair_item(fair_share, candidates, item, key,
+                                       default_duration)
+            candidates.remove(item)
+            entries.append(item[1])
+        return entries
+
+    @staticmethod
+    def _fair_item(fair_share: FairShare,
+                   candidates: List[Tuple[int, Default.Entry]],
+                   item: Tuple[int, Default.Entry],
+                   key: Callable[[Default.Entry], Any] | None,
+                   default_duration: float = 1
+                   ) -> Tuple[int, Default.Entry]:
+        """
+        Chooses the item of the module that is next in turn. Items with a
+        better priority than every other module's items are taken first
+        :param fair_share: The fair share state to use
+        :param candidates: The items that may be taken
+        :param item: The best item in global order
+        :param key: Function returning the sort key of an entry
+        :param default_duration: Seconds of audio assumed for entries whose
+        duration is not known yet
+        :return: The chosen item
+        """
+        heads: Dict[str, Tuple[int, Default.Entry]] = {}
+        for candidate in candidates:
+            if candidate[0] != item[0]:
+                continue
+            module_uid = candidate[1].module.module_uid
+            head = heads.get(module_uid)
+            if head is None or (candidate < head if key is None
+                                else key(candidate[1]) < key(head[1])):
+                heads[module_uid] = candidate
+        module_uid = fair_share.select({
+            module_uid: (max(head[1].module.weight, 0.01),
+                         max(head[1].duration or default_duration, 1))
+            for module_uid, head in heads.items()})
+        return heads[module_uid]
+
+    def remove(self, uid: str) -> bool:
+        """
+        Removes the entry with the given uid from the queue
+        :param uid: The uid of the entry
+        :return: True if an entry was removed
+        """
+        item = self.take(lambda module_entry: module_entry.uid == uid)
+        return item is not None
@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List
+
+
+class Journal:
+    """
+    Append-only journal of database changes. Records are written to the
+    operating system immediately and made durable with one fsync per
+    flush interval, so many changes share a single fsync.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.05,
+                 compact_size: int = 4000000, compact_interval: float = 60,
+                 on_compact: Callable[[], None] | None = None):
+        """
+        Opens the journal for appending and starts the flush thread
+        :param path: The path of the journal file
+        :param flush_interval: Maximum seconds until a record is durable
+        :param compact_size: Journal size in bytes that triggers compaction
+        :param compact_interval: Seconds after which a non empty journal is
+        compacted
+        :param on_compact: Function that writes the journaled changes into
+        the snapshot and truncates the journal
+        """
+        self.path: str = path
+        self.flush_interval: float = flush_interval
+        self.compact_size: int = compact_size
+        self.compact_interval: float = compact_interval
+        self.on_compact: Callable[[], None] | None = on_compact
+        self.file = open(path, "a", encoding="utf-8")
+        self.condition = threading.Condition()
+        self.written: int = 0
+        self.synced: int = 0
+        self.bytes_written: int = 0
+        self.syncs: int = 0
+        self.compacted_time: float = time.monotonic()
+        self.running: bool = True
+        self.thread = threading.Thread(target=self.flush_thread,
+                                       daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def read(path: str) -> List[Dict]:
+        """
+        Reads all complete records of a journal. Reading stops at the first
+        torn or corrupt record, the records after it are lost
+        :param path: The path of the journal file
+        :return: The records in the order they were written
+        """
+        records = []
+        if not os.path.exists(path):
+            return records
+        with open(path, "r", encoding="utf-8", errors="replace") as file:
+            for line in file:
+                if not line.endswith("\n"):
+                    # Record torn by a crash while writing
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError as e:
+                    logging.warning(f"Stopped replaying the journal at "
+                                    f"record {len(records) + 1}: {e}")
+                    break
+        return records
+
+    def append(self, record: Dict) -> int:
+        """
+        Appends a record to the journal. The record survives a crash of the
+        process right away and a crash of the system after the next sync
+        :param record: The JSON serializable record
+        :return: The sequence number of the record
+        """
+        line = json.dumps(record) + "\n"
+        with self.condition:
+            self.file.write(line)
+            self.file.flush()
+            self.written = self.written + 1
+            self.bytes_written = self.bytes_written + len(line)
+            self.condition.notify_all()
+            return self.written
+
+    def wait(self, sequence: int) -> None:
+        """
+        Waits until a record is durable
+        :param sequence: The sequence number of the record
+        :return: Nothing
+        """
+        with self.condition:
+            while not self.file.closed and self.synced < sequence:
+                self.condition.wait()
+
+    def size(self) -> int:
+        """
+        Returns the current size of the journal file
+        :return: The size in bytes
+        """
+        with self.condition:
+            return os.fstat(self.file.fileno()).st_size
+
+    def truncate(self) -> None:
+        """
+        Empties the journal after its records reached the snapshot
+        :return: Nothing
+        """
+        with self.condition:
+            self.file.truncate(0)
+            os.fsync(self.file.fileno())
+            self.synced = self.written
+            self.compacted_time = time.monotonic()
+            self.condition.notify_all()
+
+    def sync(self) -> None:
+        """
+        Makes all written records durable
+        :return: Nothing
+        """
+        with self.condition:
+            sequence = self.written
+            fileno = self.file.fileno()
+        os.fsync(fileno)
+        with self.condition:
+            self.syncs = self.syncs + 1
+            self.synced = max(self.synced, sequence)
+            self.condition.notify_all()
+
+    def flush_thread(self) -> None:
+        """
+        The thread that syncs the journal in batches and triggers the
+        compaction
+        :return: Nothing
+        """
+        while self.running:
+            with self.condition:
+                while self.running and self.synced >= self.written:
+                    self.condition.wait()
+            if not self.running:
+                break
+            time.sleep(self.flush_interval)
+            try:
+                self.sync()
+                if self.on_compact and (
+                        self.size() > self.compact_size
+                        or time.monotonic() - self.compacted_time
+                        > self.compact_interval):
+                    self.on_compact()
+            except Exception as e:
+                logging.error(f"Error syncing journal: {e}")
+
+    def close(self) -> None:
+        """
+        Syncs and closes the journal
+        :return: Nothing
+        """
+        with self.condition:
+            if not self.running:
+                return
+            self.running = False
+            self.condition.notify_all()
+        # The flush thread must not sync the closed file
+        self.thread.join()
+        self.sync()
+        with self.condition:
+            self.file.close()
+            self.condition.notify_all()
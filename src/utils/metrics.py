@@ -0,0 +1,274 @@
+import math
+import os
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+from utils import util
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds of the stages of a job
+STAGE_BUCKETS: Tuple[float, ...] = (1, 5, 15, 30, 60, 120, 300, 600, 900,
+                                    1800, 3600, 7200, 14400)
+# Seconds of transcription per second of audio
+REALTIME_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1,
+                                       1.5, 2, 3, 5)
+# Stage name -> timings of the job at its start and end
+STAGES: Dict[str, Tuple[str, str]] = {
+    "queue": ("enqueued", "dispatched"),
+    "download": ("download_start", "download_end"),
+    "detect": ("detect_start", "detected"),
+    "transcribe": ("transcribe_start", "transcribe_end"),
+    "total": ("enqueued", "finished"),
+}
+
+
+def format_value(value: float) -> str:
+    """
+    Formats a sample value for the Prometheus text format
+    :param value: The value
+    :return: The formatted value
+    """
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    """
+    Formats labels for the Prometheus text format
+    :param labels: The names and values of the labels
+    :return: The formatted labels, empty without labels
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        name + '="' + str(value).replace("\\", "\\\\").replace(
+            '"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels) + "}"
+
+
+class Metric:
+    def __init__(self, name: str, documentation: str, metric_type: str,
+                 label_names: Sequence[str] = ()):
+        """
+        Creates a family of samples with the same name and label names
+        :param name: The name of the metric
+        :param documentation: The help text
+        :param metric_type: counter, gauge or histogram
+        :param label_names: The names of the labels
+        """
+        self.name: str = name
+        self.documentation: str = documentation
+        self.metric_type: str = metric_type
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """
+        Returns the label values in the order of the label names
+        :param labels: The labels of a sample
+        :return: The label values
+        :raises ValueError: If the labels do not match the label names
+        """
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Labels {sorted(labels)} do not match "
+                             f"{list(self.label_names)} of {self.name}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[Tuple[str, Sequence[Tuple[str, str]], float]]:
+        """
+        Returns the samples of the metric
+        :return: The name, labels and value of each sample
+        """
+        with self.lock:
+            return [(self.name, list(zip(self.label_names, key)), value)
+                    for key, value in sorted(self.values.items())]
+
+    def render(self) -> str:
+        """
+        Renders the metric in the Prometheus text format
+        :return: The help, type and sample lines
+        """
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(name + format_labels(labels) + " " + format_value(value)
+                     for name, labels, value in self.samples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str] = ()):
+        """
+        Creates a counter that only increases
+        :param name: The name of the metric, ending with _total
+        :param documentation: The help text
+        :param label_names: The names of the labels
+        """
+        super().__init__(name, documentation, "counter", label_names)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        Increases the counter
+        :param amount: The non-negative increase
+        :param labels: The labels of the sample
+        :return: Nothing
+        """
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str] = ()):
+        """
+        Creates a gauge that holds the current value
+        :param name: The name of the metric
+        :param documentation: The help text
+        :param label_names: The names of the labels
+        """
+        super().__init__(name, documentation, "gauge", label_names)
+
+    def set(self, value: float, **labels: str) -> None:
+        """
+        Sets the gauge
+        :param value: The current value
+        :param labels: The labels of the sample
+        :return: Nothing
+        """
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        """
+        Creates a histogram with cumulative buckets
+        :param name: The name of the metric
+        :param documentation: The help text
+        :param label_names: The names of the labels
+        :param buckets: The upper bounds of the buckets, +Inf is added
+        """
+        super().__init__(name, documentation, "histogram", label_names)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets)) + (math.inf,)
+        # Label values -> counts per bucket, sum
+        self.histograms: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Adds an observation
+        :param value: The observed value
+        :param labels: The labels of the sample
+        :return: Nothing
+        """
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.histograms.get(
+                key, ([0] * len(self.buckets), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] = counts[index] + 1
+            self.histograms[key] = (counts, total + value)
+
+    def samples(self) -> List[Tuple[str, Sequence[Tuple[str, str]], float]]:
+        with self.lock:
+            samples = []
+            for key, (counts, total) in sorted(self.histograms.items()):
+                labels = list(zip(self.label_names, key))
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((self.name + "_bucket",
+                                    labels + [("le", format_value(bound))],
+                                    count))
+                samples.append((self.name + "_sum", labels, total))
+                samples.append((self.name + "_count", labels, counts[-1]))
+            return samples
+
+
+class Registry:
+    def __init__(self):
+        """
+        Creates the collection of metrics exported together
+        """
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Adds a metric
+        :param metric: The metric
+        :return: The metric
+        :raises ValueError: If a metric with the name exists
+        """
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Renders all metrics in the Prometheus text format
+        :return: The exposition
+        """
+        return "".join(metric.render() for metric in self.metrics.values())
+
+
+class JobMetrics(Registry):
+    def __init__(self):
+        """
+        Creates the metrics of the finished jobs and of the current state,
+        labeled by module and Whisper model
+        """
+        super().__init__()
+        self.jobs: Counter = self.register(Counter(
+            "tsapi_jobs_total", "Finished jobs by final status",
+            ["module", "model", "status"]))
+        self.audio: Counter = self.register(Counter(
+            "tsapi_audio_seconds_total", "Seconds of transcribed audio",
+            ["module", "model"]))
+        self.stages: Histogram = self.register(Histogram(
+            "tsapi_job_stage_seconds",
+            "Seconds a job spent in a stage: queue (enqueue to dispatch), "
+            "download, detect, transcribe and total (enqueue to finish)",
+            ["module", "model", "stage"], STAGE_BUCKETS))
+        self.realtime: Histogram = self.register(Histogram(
+            "tsapi_realtime_factor",
+            "Seconds of transcription per second of audio",
+            ["module", "model"], REALTIME_BUCKETS))
+        self.gauges: Gauge = self.register(Gauge(
+            "tsapi_state", "Current queued jobs, running jobs and "
+            "downloads", ["state"]))
+
+    def observe(self, module_entry) -> None:
+        """
+        Records a finished job by its timings
+        :param module_entry: The module_entry of the finished job
+        :return: Nothing
+        """
+        module = module_entry.module.module_uid
+        model = (module_entry.whisper_model
+                 or os.environ.get("whisper_model", ""))
+        self.jobs.inc(module=module, model=model,
+                      status=util.get_status(module_entry.status))
+        timings = dict(module_entry.timings or {})
+        if module_entry.finished is not None:
+            timings["finished"] = module_entry.finished
+        for stage, (start, end) in STAGES.items():
+            if start in timings and end in timings:
+                self.stages.observe(max(timings[end] - timings[start], 0),
+                                    module=module, model=model, stage=stage)
+        if module_entry.status == 3 and module_entry.duration:  # Whispered
+            self.audio.inc(module_entry.duration, module=module, model=model)
+            if ("transcribe_start" in timings
+                    and "transcribe_end" in timings):
+                self.realtime.observe(
+                    (timings["transcribe_end"] - timings["transcribe_start"])
+                    / module_entry.duration, module=module, model=model)
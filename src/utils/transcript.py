@@ -0,0 +1,106 @@
+from typing import Dict, Iterable, Iterator
+
+import numpy as np
+
+
+class TranscriptSegment:
+    """
+    A segment of a transcript with timestamps in 10 ms steps, readable like
+    the segments of pywhispercpp
+    """
+    __slots__ = ("t0", "t1", "text")
+
+    def __init__(self, t0: int, t1: int, text: str):
+        self.t0: int = t0
+        self.t1: int = t1
+        self.text: str = text
+
+    def __repr__(self) -> str:
+        return f"t0={self.t0}, t1={self.t1}, text={self.text}"
+
+
+class Transcript:
+    """
+    Compact transcript. The timestamps are kept in two integer arrays and
+    the texts of all segments in one string, instead of one object with a
+    dictionary per segment
+    """
+    __slots__ = ("t0", "t1", "text", "offsets")
+
+    def __init__(self, t0: np.ndarray, t1: np.ndarray, text: str,
+                 offsets: np.ndarray):
+        """
+        Creates a transcript from its columns
+        :param t0: The starts of the segments in 10 ms steps
+        :param t1: The ends of the segments in 10 ms steps
+        :param text: The texts of all segments joined
+        :param offsets: The start of each text in the joined texts and the
+        end of the last one
+        """
+        self.t0: np.ndarray = t0
+        self.t1: np.ndarray = t1
+        self.text: str = text
+        self.offsets: np.ndarray = offsets
+
+    @classmethod
+    def from_segments(cls, segments: Iterable) -> "Transcript":
+        """
+        Creates a transcript from segments
+        :param segments: Objects with t0, t1 and text
+        :return: The transcript
+        """
+        segments = list(segments)
+        texts = [segment.text for segment in segments]
+        offsets = np.zeros(len(texts) + 1, dtype=np.int32)
+        np.cumsum([len(text) for text in texts], out=offsets[1:])
+        return cls(np.array([segment.t0 for segment in segments],
+                            dtype=np.int32),
+                   np.array([segment.t1 for segment in segments],
+                            dtype=np.int32),
+                   "".join(texts), offsets)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Transcript":
+        """
+        Creates a transcript from its serialized form
+        :param data: The dictionary created by to_dict
+        :return: The transcript
+        """
+        offsets = np.zeros(len(data["lengths"]) + 1, dtype=np.int32)
+        np.cumsum(data["lengths"], out=offsets[1:])
+        return cls(np.array(data["t0"], dtype=np.int32),
+                   np.array(data["t1"], dtype=np.int32),
+                   data["text"], offsets)
+
+    def to_dict(self) -> Dict:
+        """
+        Returns the JSON serializable form of the transcript
+        :return: The timestamps, the joined texts and the text lengths
+        """
+        return {"t0": self.t0.tolist(), "t1": self.t1.tolist(),
+                "text": self.text,
+                "lengths": np.diff(self.offsets).tolist()}
+
+    def __len__(self) -> int:
+        return len(self.t0)
+
+    def __getitem__(self, index: int) -> TranscriptSegment:
+        index = range(len(self))[index]
+        return TranscriptSegment(
+            int(self.t0[index]), int(self.t1[index]),
+            self.text[self.offsets[index]:self.offsets[index + 1]])
+
+    def __iter__(self) -> Iterator[TranscriptSegment]:
+        offsets = self.offsets.tolist()
+        for index, (t0, t1) in enumerate(zip(self.t0.tolist(),
+                                             self.t1.tolist())):
+            yield TranscriptSegment(
+                t0, t1, self.text[offsets[index]:offsets[index + 1]])
+
+    def nbytes(self) -> int:
+        """
+        Returns the approximate memory used by the transcript
+        :return: The size in bytes
+        """
+        return (self.t0.nbytes + self.t1.nbytes + self.offsets.nbytes
+                + len(self.text.encode("utf-8")))
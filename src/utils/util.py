@@ -1,6 +1,10 @@
+import hashlib
 import logging
 import os
+import time
+from urllib.parse import urlparse
 
+import requests
 from werkzeug.datastructures import FileStorage
 
 log_level = logging.INFO
@@ -18,23 +22,141 @@ logging.basicConfig(format='%(asctime)s [%(module)s]'
 
 
 # Filesystem
-def save_file(file: FileStorage, uid: str) -> bool:
+def save_file(file: FileStorage, uid: str,
+              chunk_size: int = 1024 * 1024) -> str | None:
     """
-    Saves a file to the audioInput folder
+    Saves a file to the audioInput folder and hashes it while writing
     :param file: The file to save
     :param uid: The uid of the job the file belongs to
-    :return: Nothing
+    :param chunk_size: The number of bytes written at once
+    :return: The SHA-256 of the file or None if saving failed
     """
     try:
         file_path = os.path.join(os.getcwd(), "data", "audioInput", uid)
-        file.save(file_path)
-        return True
+        digest = hashlib.sha256()
+        with open(file_path, "wb") as output:
+            while True:
+                chunk = file.stream.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                output.write(chunk)
+        return digest.hexdigest()
     except Exception as e:
         logging.error(e)
-        return False
+        return None
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024):
+    """
+    Hashes an existing file
+    :param path: The path of the file
+    :param chunk_size: The number of bytes read at once
+    :return: The SHA-256 object, so more data can be added
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return digest
+            digest.update(chunk)
+
+
+def download_file(session: requests.Session, url: str, uid: str,
+                  chunk_size: int = 1024 * 1024, retries: int = 5) -> str:
+    """
+    Streams a file to the audioInput folder and hashes it while writing.
+    Interrupted downloads are resumed with HTTP range requests and the size
+    is verified against the Content-Length of the response. Network errors
+    and server errors (5xx) are retried with a backoff
+    :param session: The session to download with
+    :param url: The url of the file
+    :param uid: The uid of the job the file belongs to
+    :param chunk_size: The number of bytes written at once
+    :param retries: The number of retries after network or server errors
+    :return: The SHA-256 of the file
+    :raises Exception: If the download fails
+    """
+    file_path = os.path.join(os.getcwd(), "data", "audioInput", uid)
+    part_path = file_path + ".part"
+    total_size = None
+    attempt = 0
+    # Part of an earlier run, the resumed download continues its hash
+    digest = (hash_file(part_path) if os.path.exists(part_path)
+              else hashlib.sha256())
+    while True:
+        offset = (os.path.getsize(part_path)
+                  if os.path.exists(part_path) else 0)
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with session.get(url, headers=headers, stream=True,
+                             timeout=60) as response:
+                if response.status_code == 206:
+                    mode = "ab"
+                    content_range = response.headers.get("Content-Range", "")
+                    if not content_range.endswith("/*"):
+                        total_size = int(content_range.split("/")[-1])
+                elif response.status_code == 200:
+                    mode = "wb"
+                    digest = hashlib.sha256()
+                    content_length = response.headers.get("Content-Length")
+                    if content_length:
+                        total_size = int(content_length)
+                elif response.status_code == 416 and offset:
+                    # The part of an earlier run may already be complete
+                    content_range = response.headers.get("Content-Range", "")
+                    size = content_range.split("/")[-1]
+                    if size.isnumeric() and int(size) == offset:
+                        total_size = offset
+                        mode = None
+                    else:
+                        os.remove(part_path)
+                        raise requests.exceptions.HTTPError(
+                            "Range not satisfiable, restarting download.")
+                elif response.status_code >= 500:
+                    raise requests.exceptions.HTTPError(
+                        "HTTP " + str(response.status_code))
+                else:
+                    raise Exception("Failed to download file: HTTP "
+                                    + str(response.status_code))
+                if mode:
+                    with open(part_path, mode) as file:
+                        for chunk in response.iter_content(chunk_size):
+                            digest.update(chunk)
+                            file.write(chunk)
+            size = os.path.getsize(part_path)
+            if total_size is not None and size > total_size:
+                os.remove(part_path)
+                raise Exception("Downloaded file is larger than expected.")
+            if total_size is not None and size < total_size:
+                raise requests.exceptions.ChunkedEncodingError(
+                    f"Download incomplete ({size} of {total_size} bytes).")
+            os.replace(part_path, file_path)
+            return digest.hexdigest()
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.HTTPError) as e:
+            attempt = attempt + 1
+            if attempt > retries:
+                raise Exception("Failed to download file: " + str(e))
+            logging.warning(f"Download of file for job id {uid} interrupted,"
+                            f" resuming ({attempt}/{retries}): {e}")
+            time.sleep(min(2 ** attempt, 30))
 
 
 # Helper
+def is_http_url(url: str) -> bool:
+    """
+    Checks if a url can be requested with HTTP
+    :param url: The url
+    :return: True if the url has an http or https scheme and a host
+    """
+    parsed = urlparse(url)
+    return parsed.scheme in ("http", "https") and bool(parsed.netloc)
+
+
 def get_status(status_id: int):
     """
     Returns the name of the status corresponding to the number
@@ -47,6 +169,8 @@ def get_status(status_id: int):
         2: "Processed",
         3: "Whispered",
         4: "Failed",
-        5: "Canceled"
+        5: "Canceled",
+        6: "Downloading",
+        7: "Ready"
     }
     return status.get(status_id, 'error')
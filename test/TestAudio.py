@@ -0,0 +1,75 @@
+import os.path
+import shutil
+import wave
+
+import numpy as np
+import pytest
+
+from utils import audio
+
+
+class TestAudio:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        yield
+        for path in ["./data/audioInput/UID", "./data/audioInput/UID.wav",
+                     audio.pcm_path("UID")]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_pcm_path(self):
+        assert audio.pcm_path("UID") == "./data/audioInput/UID.pcm"
+
+    def test_load_audio(self):
+        samples = np.array([0, 16384, -32768], dtype=np.int16)
+        samples.tofile(audio.pcm_path("UID"))
+        loaded = audio.load_audio(audio.pcm_path("UID"))
+        assert loaded.dtype == np.float32
+        assert list(loaded) == [0.0, 0.5, -1.0]
+        assert audio.duration(audio.pcm_path("UID")) == 3 / 16000
+
+    def test_split_points(self):
+        samples = np.ones(12 * audio.SAMPLE_RATE, dtype=np.float32)
+        # Silence at 4.5 s and 8 s
+        samples[72000:72480] = 0
+        samples[128160:128640] = 0
+        points = audio.split_points(samples, 4, search_length=1)
+        assert points == [0, 72000, 128160, len(samples)]
+        assert audio.split_points(samples, 12) == [0, len(samples)]
+
+    def test_speech_regions(self):
+        samples = np.zeros(10 * audio.SAMPLE_RATE, dtype=np.float32)
+        # Speech from 1 s to 2 s and from 6 s to 7 s
+        samples[16000:32000] = 0.5
+        samples[96000:112000] = 0.5
+        regions = audio.speech_regions(samples, padding=0)
+        assert regions == [(15840, 32160), (96000, 112320)]
+        assert audio.speech_regions(np.zeros(16000, dtype=np.float32)) == []
+
+    def test_compact_remap(self):
+        samples = np.arange(10 * audio.SAMPLE_RATE, dtype=np.float32)
+        regions = [(16000, 32000), (96000, 112000)]
+        speech, time_map = audio.compact(samples, regions)
+        assert len(speech) == 32000
+        assert speech[16000] == 96000
+        assert time_map == [(0, 16000), (16000, 96000)]
+
+        class Segment:
+            def __init__(self, t0, t1):
+                self.t0 = t0
+                self.t1 = t1
+
+        segments = audio.remap([Segment(0, 100), Segment(50, 150)], time_map)
+        assert [(s.t0, s.t1) for s in segments] == [(100, 200), (150, 650)]
+
+    @pytest.mark.skipif(shutil.which("ffmpeg") is None,
+                        reason="ffmpeg is not installed")
+    def test_extract_audio(self):
+        with wave.open("./data/audioInput/UID.wav", "wb") as file:
+            file.setnchannels(2)
+            file.setsampwidth(2)
+            file.setframerate(48000)
+            file.writeframes(np.zeros(48000 * 2, dtype=np.int16).tobytes())
+        audio.extract_audio("./data/audioInput/UID.wav",
+                            audio.pcm_path("UID"))
+        assert audio.duration(audio.pcm_path("UID")) == 1.0
@@ -0,0 +1,74 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from core.CallbackDispatcher import CallbackDispatcher
+from core.TsApi import TsApi
+from packages.File import File
+from packages.Opencast import Opencast
+
+
+class TestCallbackDispatcher:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        os.environ.setdefault("whisper_model", "small")
+        self.ts_api: TsApi = TsApi()
+        self.posts = []
+        self.responses = []
+
+        def post(url, json, timeout):
+            self.posts.append((url, json))
+            response = self.responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return SimpleNamespace(status_code=response)
+
+        self.dispatcher: CallbackDispatcher = CallbackDispatcher(
+            self.ts_api, workers=1, retries=1)
+        self.dispatcher.session = SimpleNamespace(post=post)
+        yield
+        self.ts_api.database.close()
+
+    def test_notify(self):
+        module: Opencast = Opencast(callback_url="http://module/done")
+        module_entry = Opencast.Entry(module, "UID", "link", status=3,
+                                      whisper_language="de")
+        assert self.dispatcher.notify(module_entry)
+        assert self.dispatcher.pending[0][2] == "http://module/done"
+        assert self.dispatcher.pending[0][3] == {"jobId": "UID",
+                                                 "status": "Whispered",
+                                                 "language": "de"}
+        module_entry.callback_url = "http://job/done"
+        self.dispatcher.notify(module_entry)
+        assert self.dispatcher.pending[1][2] == "http://job/done"
+        # Without any url there is nothing to send
+        assert not self.dispatcher.notify(
+            File.Entry(self.ts_api.file_module, "UID", 1, status=4))
+
+    def test_send(self):
+        payload = {"jobId": "UID", "status": "Failed", "language": None}
+        self.responses = [500, requests.exceptions.ConnectionError("down")]
+        assert not self.dispatcher.send("http://job/done", payload, 0)
+        # Retry with backoff
+        assert len(self.dispatcher.pending) == 1
+        assert self.dispatcher.pending[0][4] == 1
+        assert not self.dispatcher.send("http://job/done", payload, 1)
+        assert len(self.dispatcher.pending) == 1
+        assert self.dispatcher.failed == 1
+        self.responses = [204]
+        assert self.dispatcher.send("http://job/done", payload, 0)
+        assert self.dispatcher.delivered == 1
+        assert len(self.posts) == 3
+
+    def test_callback_thread(self):
+        self.responses = [200]
+        self.dispatcher.start_thread()
+        self.dispatcher.schedule("http://job/done", {"jobId": "UID"}, 0, 0)
+        for _ in range(100):
+            if self.dispatcher.delivered:
+                break
+            time.sleep(0.01)
+        assert self.dispatcher.delivered == 1
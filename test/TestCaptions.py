@@ -0,0 +1,73 @@
+import gzip
+import os
+import tempfile
+
+import pytest
+from pywhispercpp.model import Segment
+from pywhispercpp.utils import output_csv, output_srt, output_txt, output_vtt
+
+from utils import captions
+from utils.captions import CaptionCache
+
+
+class TestCaptions:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.results = {"UID": [Segment(0, 376, " Hello"),
+                                Segment(376, 134400, " World")]}
+        self.loads = 0
+
+        test = self
+
+        class Database:
+            def load_result(self, uid):
+                test.loads = test.loads + 1
+                return test.results.get(uid)
+
+        self.database = Database()
+        yield
+
+    def test_render(self):
+        writers = {"vtt": output_vtt, "srt": output_srt, "txt": output_txt,
+                   "csv": output_csv}
+        with tempfile.TemporaryDirectory() as directory:
+            for output_format, writer in writers.items():
+                path = os.path.join(directory, "UID." + output_format)
+                writer(self.results["UID"], path)
+                with open(path, "r") as file:
+                    assert captions.render(self.results["UID"],
+                                           output_format) == file.read()
+        with pytest.raises(ValueError):
+            captions.render(self.results["UID"], "pdf")
+
+    def test_cache(self):
+        cache: CaptionCache = CaptionCache()
+        caption = cache.get("UID", "vtt", self.database)
+        assert caption.body.startswith(b"WEBVTT")
+        assert cache.get("UID", "vtt", self.database) is caption
+        assert self.loads == 1 and cache.hits == 1
+        assert cache.get("MISSING", "vtt", self.database) is None
+        # Changed results are rendered again
+        self.results["UID"] = [Segment(0, 100, " Changed")]
+        cache.invalidate("UID")
+        changed = cache.get("UID", "vtt", self.database)
+        assert b"Changed" in changed.body
+        assert changed.etag != caption.etag
+        assert cache.bytes == len(changed.body)
+
+    def test_compressed(self):
+        cache: CaptionCache = CaptionCache()
+        caption = cache.get("UID", "srt", self.database)
+        body = cache.compressed(caption)
+        assert gzip.decompress(body) == caption.body
+        assert cache.bytes == len(caption.body) + len(body)
+
+    def test_max_bytes(self):
+        self.results["UID2"] = self.results["UID"]
+        cache: CaptionCache = CaptionCache()
+        size = len(cache.get("UID", "txt", self.database).body)
+        cache.max_bytes = size * 2 - 1
+        cache.get("UID2", "txt", self.database)
+        # The least recently used captions are evicted
+        assert list(cache.captions) == [("UID2", "txt")]
+        assert cache.bytes == size
@@ -0,0 +1,74 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from core.CompletionEstimator import CompletionEstimator
+from core.SchedulingPolicy import FifoPolicy, SjfPolicy
+from packages.File import File
+from utils.job_queue import JobQueue
+
+
+class TestCompletionEstimator:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.module = File()
+        self.ts_api = SimpleNamespace(
+            database=SimpleNamespace(queue=JobQueue()), running_jobs=[],
+            scheduling_policy=FifoPolicy())
+        self.estimator = CompletionEstimator(self.ts_api, workers=2,
+                                             default_speed=1,
+                                             default_duration=100)
+        yield
+
+    def entry(self, uid: str, duration: float | None, priority: int = 1,
+              status: int = 0) -> File.Entry:
+        return File.Entry(self.module, uid, priority, duration=duration,
+                          status=status, time=time.time())
+
+    def test_record(self):
+        module_entry = self.entry("UID", 300, status=3)
+        module_entry.timings["dispatched"] = 1000
+        module_entry.finished = 1030
+        self.estimator.record(module_entry)
+        # The first job replaces the defaults
+        assert self.estimator.speed == 10
+        assert self.estimator.duration == 300
+        assert self.estimator.throughput() == 20
+        module_entry.finished = 1060
+        self.estimator.record(module_entry)
+        assert self.estimator.speed == pytest.approx(9.5)
+
+    def test_eta(self):
+        queue = self.ts_api.database.queue
+        for module_entry in [self.entry("UID1", 200),
+                             self.entry("UID2", None),
+                             self.entry("UID3", 40, priority=0)]:
+            queue.put((module_entry.priority, module_entry))
+        running = self.entry("UID4", 100, status=2)
+        running.timings["dispatched"] = time.time() - 20
+        self.ts_api.running_jobs.append(running)
+        # Unknown durations count with the average duration
+        assert self.estimator.wait() == pytest.approx((200 + 100 + 40 + 80)
+                                                      / 2, abs=0.1)
+        assert self.estimator.eta("UID4") == pytest.approx(80, abs=0.1)
+        assert self.estimator.eta("UID3") == pytest.approx(60, abs=0.1)
+        assert self.estimator.eta("UID1") == pytest.approx(160, abs=0.1)
+        assert self.estimator.eta("UID2") == pytest.approx(210, abs=0.1)
+        assert self.estimator.eta("MISSING") is None
+        assert self.estimator.next_finish() == pytest.approx(80, abs=0.1)
+
+    def test_eta_dispatch_order(self):
+        self.ts_api.scheduling_policy = SjfPolicy()
+        queue = self.ts_api.database.queue
+        for module_entry in [self.entry("UID1", 200, status=7),
+                             self.entry("UID2", 40),
+                             self.entry("UID3", 20),
+                             self.entry("UID4", 10, priority=0)]:
+            queue.put((module_entry.priority, module_entry))
+        # The ready job starts before shorter jobs that are not downloaded
+        assert self.estimator.eta("UID1") == pytest.approx(100, abs=0.1)
+        assert self.estimator.eta("UID3") == pytest.approx(115, abs=0.1)
+        assert self.estimator.eta("UID2") == pytest.approx(135, abs=0.1)
+        # A better priority is prepared and started first
+        assert self.estimator.eta("UID4") == pytest.approx(5, abs=0.1)
@@ -1,5 +1,7 @@
 import os.path
 import pytest
+from pywhispercpp.model import Segment
+
 from packages.File import File
 from utils.database import Database
 
@@ -17,8 +19,8 @@ class TestDatabase:
             os.remove("./data/queue.json")
         if os.path.exists("./data/audioInput/UID"):
             os.remove("./data/audioInput/UID")
-        if os.path.exists("./data/jobDatabase/UID"):
-            os.remove("./data/jobDatabase/UID")
+        self.database.delete_job("UID")
+        self.database.close()
 
     def test_add_job(self):
         self.database.add_job(self.module_entry)
@@ -47,3 +49,34 @@ class TestDatabase:
                                        "whisper_language", "Klingonisch")
         assert self.database.load_job(
             self.module_entry.uid).whisper_language == "Klingonisch"
+
+    def test_persistence(self):
+        self.database.change_job_entry(self.module_entry.uid, "status", 6)
+        database: Database = Database()
+        assert database.exists_job("UID")
+        assert database.load_job("UID").status == 0
+        assert "UID" in [entry.uid for entry in database.queue.peek(
+            database.queue.qsize())]
+        database.close()
+
+    def test_finished_job(self):
+        self.database.change_job_entry(self.module_entry.uid, "whisper_result",
+                                       [Segment(0, 100, "Subtitle")])
+        self.database.change_job_entry(self.module_entry.uid, "status", 3)
+        assert "UID" not in self.database.module_entrys
+        assert self.database.exists_job("UID")
+        assert self.database.load_job("UID").whisper_result is None
+        assert self.database.load_result("UID")[0].text == "Subtitle"
+        database: Database = Database()
+        assert database.load_result("UID")[0].t1 == 100
+        database.close()
+
+    def test_job_statuses(self):
+        self.database.change_job_entry(self.module_entry.uid, "status", 4)
+        assert self.database.job_statuses(["UID", "MISSING"]) == {"UID": 4}
+        self.database.compact()
+        assert self.database.job_statuses(["UID", "UID"]) == {"UID": 4}
+
+    def test_delete_job(self):
+        assert self.database.delete_job("UID")
+        assert not self.database.exists_job("UID")
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+from pywhispercpp.model import Segment
+
+from core.TsApi import TsApi
+from packages.File import File
+
+
+class TestDeduplicator:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        os.environ.setdefault("whisper_model", "small")
+        self.ts_api: TsApi = TsApi()
+        self.uids = ["UID1", "UID2", "UID3"]
+        yield
+        for uid in self.uids:
+            self.ts_api.database.delete_job(uid)
+            self.ts_api.database.queue.remove(uid)
+        self.ts_api.database.close()
+
+    def entry(self, uid: str) -> File.Entry:
+        return File.Entry(self.ts_api.file_module, uid, 1,
+                          initial_prompt="Title", media_hash="HASH")
+
+    def test_deduplicate(self):
+        deduplicator = self.ts_api.deduplicator
+        leader = self.entry("UID1")
+        self.ts_api.database.add_job(leader)
+        assert not deduplicator.resolve(leader)
+        # A duplicate of a running job waits for it
+        follower = self.entry("UID2")
+        assert deduplicator.resolve(follower)
+        assert self.ts_api.database.load_job("UID2").status == 0
+        self.ts_api.database.change_job_entry("UID1", "whisper_result",
+                                              [Segment(0, 100, "Test")])
+        self.ts_api.database.change_job_entry("UID1", "status", 3)
+        deduplicator.finish(leader)
+        assert self.ts_api.database.load_job("UID2").status == 3
+        assert self.ts_api.database.load_result("UID2")[0].text == "Test"
+        # A duplicate of a finished job gets the result right away
+        duplicate = self.entry("UID3")
+        assert deduplicator.resolve(duplicate)
+        assert self.ts_api.database.load_job("UID3").status == 3
+        assert deduplicator.hits == 2
+        # Another prompt is other work
+        other = self.entry("UID3")
+        other.initial_prompt = "Other"
+        assert not deduplicator.resolve(other)
+
+    def test_failed_leader(self):
+        deduplicator = self.ts_api.deduplicator
+        leader = self.entry("UID1")
+        self.ts_api.database.add_job(leader)
+        assert not deduplicator.resolve(leader)
+        assert deduplicator.resolve(self.entry("UID2"))
+        self.ts_api.database.change_job_entry("UID1", "status", 4)
+        deduplicator.finish(leader)
+        # The duplicate is queued again
+        assert "UID2" in [module_entry.uid for module_entry in
+                          self.ts_api.database.queue.peek(
+                              self.ts_api.database.queue.qsize())]
+
+    def test_deleted_leader(self):
+        deduplicator = self.ts_api.deduplicator
+        module = self.ts_api.file_module
+        active = module.queued_or_active
+        module.queued_or_active = module.queued_or_active + 3
+        leader = self.entry("UID1")
+        self.ts_api.add_to_queue(1, leader)
+        assert not deduplicator.resolve(leader)
+        assert deduplicator.resolve(self.entry("UID2"))
+        assert deduplicator.resolve(self.entry("UID3"))
+        # A deleted duplicate stops waiting
+        assert self.ts_api.delete_job("UID3")
+        assert [follower.uid for follower in deduplicator.followers["UID1"]
+                ] == ["UID2"]
+        # The duplicates of a deleted job are queued again
+        assert self.ts_api.delete_job("UID1")
+        assert "UID1" not in deduplicator.keys
+        assert [module_entry.uid for module_entry in
+                self.ts_api.database.queue.peek(
+                    self.ts_api.database.queue.qsize())
+                if module_entry.uid in self.uids] == ["UID2"]
+        assert not deduplicator.resolve(self.entry("UID2"))
+        assert module.queued_or_active == active + 1
+
+    def test_deleted_while_downloading(self):
+        deduplicator = self.ts_api.deduplicator
+        self.ts_api.file_module.queued_or_active = (
+            self.ts_api.file_module.queued_or_active + 1)
+        leader = self.entry("UID1")
+        self.ts_api.add_to_queue(1, leader)
+        self.ts_api.prefetcher.downloading.append(leader)
+        # Deleted before its media is known, so before it claims the key
+        leader.preprocessing = lambda: self.ts_api.delete_job("UID1")
+        self.ts_api.prefetcher.ingest = lambda module_entry: None
+        self.ts_api.prefetcher.download(leader)
+        assert "UID1" not in deduplicator.keys
+        assert deduplicator.in_flight == {}
+        assert not deduplicator.resolve(self.entry("UID2"))
@@ -0,0 +1,75 @@
+import pytest
+
+from packages.File import File
+from utils.job_queue import FairShare, JobQueue
+
+
+class TestJobQueue:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.queue: JobQueue = JobQueue()
+        self.module: File = File()
+        for priority, uid in [(2, "UID1"), (1, "UID2"), (3, "UID3")]:
+            self.queue.put((priority, File.Entry(self.module, uid, priority,
+                                                 time=priority)))
+        yield
+
+    def test_peek(self):
+        assert [entry.uid for entry in self.queue.peek(2)] == ["UID2",
+                                                               "UID1"]
+        assert self.queue.qsize() == 3
+
+    def test_take(self):
+        priority, entry = self.queue.take(lambda e: e.uid != "UID2")
+        assert priority == 2 and entry.uid == "UID1"
+        assert self.queue.take(lambda e: False) is None
+        assert self.queue.get_nowait()[1].uid == "UID2"
+
+    def test_remove(self):
+        assert self.queue.remove("UID3")
+        assert not self.queue.remove("UID3")
+        assert self.queue.qsize() == 2
+
+    def test_take_key(self):
+        priority, entry = self.queue.take(lambda e: True,
+                                          key=lambda e: -e.priority)
+        assert entry.uid == "UID3"
+
+    def test_fair_share(self):
+        fair_share = FairShare(quantum=100)
+        heads = {"A": (2, 100), "B": (1, 100)}
+        selected = [fair_share.select(heads) for _ in range(6)]
+        # A gets two jobs per round because of its weight
+        assert selected.count("A") == 4 and selected.count("B") == 2
+        # A long job waits for enough credit
+        assert [fair_share.select({"A": (1, 250), "B": (1, 100)})
+                for _ in range(3)].count("A") <= 1
+
+    def test_take_fair(self):
+        other: File = File()
+        queue: JobQueue = JobQueue(fair_share=FairShare(quantum=100))
+        for index in range(4):
+            queue.put((1, File.Entry(self.module, f"A{index}", 1,
+                                     time=index, duration=100)))
+        queue.put((1, File.Entry(other, "B0", 1, time=10, duration=100)))
+        taken = [queue.take(lambda e: True, fair=True)[1].uid
+                 for _ in range(3)]
+        assert "B0" in taken[:2]
+        # Without fair, the queue order is kept
+        assert queue.take(lambda e: True)[1].uid == "A2"
+
+    def test_order(self):
+        other: File = File()
+        queue: JobQueue = JobQueue(fair_share=FairShare(quantum=100))
+        for index in range(4):
+            queue.put((1, File.Entry(self.module, f"A{index}", 1,
+                                     time=index)))
+        queue.put((1, File.Entry(other, "B0", 1, time=10)))
+        order = [entry.uid
+                 for entry in queue.order(lambda e: True, 3, fair=True,
+                                          default_duration=100)]
+        assert "B0" in order[:2]
+        # The queue and the fair share are not changed
+        assert queue.qsize() == 5 and queue.fair_share.deficits == {}
+        assert [entry.uid for entry in queue.order(lambda e: True, 2)] == [
+            "A0", "A1"]
@@ -0,0 +1,58 @@
+import os.path
+import time
+
+import pytest
+
+from utils.journal import Journal
+
+
+class TestJournal:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.compactions = 0
+
+        def on_compact():
+            self.compactions = self.compactions + 1
+            self.journal.truncate()
+
+        self.journal: Journal = Journal("./data/test_journal.log",
+                                        flush_interval=0.01,
+                                        compact_size=100,
+                                        on_compact=on_compact)
+        yield
+        self.journal.close()
+        if os.path.exists("./data/test_journal.log"):
+            os.remove("./data/test_journal.log")
+
+    def test_append_read(self):
+        self.journal.append({"op": "delete", "uid": "UID1"})
+        self.journal.append({"op": "delete", "uid": "UID2"})
+        records = Journal.read("./data/test_journal.log")
+        assert [record["uid"] for record in records] == ["UID1", "UID2"]
+
+    def test_torn_record(self):
+        self.journal.append({"op": "delete", "uid": "UID1"})
+        self.journal.file.write("{\"op\": \"del")
+        self.journal.file.flush()
+        assert len(Journal.read("./data/test_journal.log")) == 1
+
+    def test_corrupt_record(self):
+        self.journal.append({"op": "delete", "uid": "UID1"})
+        self.journal.file.write("{\"op\": \"del\n")
+        self.journal.append({"op": "delete", "uid": "UID2"})
+        assert len(Journal.read("./data/test_journal.log")) == 1
+        self.journal.close()
+        self.journal.close()
+        assert not self.journal.running
+
+    def test_wait_and_compact(self):
+        sequence = self.journal.append({"op": "delete", "uid": "UID" * 50})
+        self.journal.wait(sequence)
+        assert self.journal.synced >= sequence
+        assert self.journal.syncs >= 1
+        for _ in range(100):
+            if self.compactions:
+                break
+            time.sleep(0.01)
+        assert self.compactions == 1
+        assert self.journal.size() == 0
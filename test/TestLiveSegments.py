@@ -0,0 +1,71 @@
+import os
+import threading
+
+import pytest
+from pywhispercpp.model import Segment
+
+from core.LiveSegments import LiveSegments
+from core.TsApi import TsApi
+from packages.File import File
+
+
+class TestLiveSegments:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        os.environ.setdefault("whisper_model", "small")
+        self.ts_api: TsApi = TsApi()
+        self.live_segments: LiveSegments = LiveSegments(
+            self.ts_api.database, heartbeat=0.05)
+        self.module_entry: File.Entry = File.Entry(self.ts_api.file_module,
+                                                   "UID", 1, status=1)
+        self.ts_api.database.add_job(self.module_entry)
+        yield
+        self.ts_api.database.delete_job("UID")
+        self.ts_api.database.close()
+
+    def test_stream(self):
+        self.live_segments.open("UID")
+        self.live_segments.publish("UID", 0, 1.5, "First", 10)
+        received = []
+
+        def follow():
+            for event in self.live_segments.events("UID"):
+                if event is not None:
+                    received.append(event)
+
+        thread = threading.Thread(target=follow)
+        thread.start()
+        self.live_segments.publish("UID", 1.5, 3, "Second", 20)
+        self.live_segments.close("UID", 3)
+        thread.join(timeout=2)
+        assert not thread.is_alive()
+        assert [event[1]["text"] for event in received[:-1]] == [
+            "First", "Second"]
+        assert received[0][1]["start"] == 0 and received[0][1]["end"] == 1.5
+        assert received[-1] == ("done", {"status": "Whispered"})
+
+    def test_finished_job(self):
+        self.ts_api.database.change_job_entry("UID", "whisper_result",
+                                              [Segment(0, 150, "Test")])
+        self.ts_api.database.change_job_entry("UID", "status", 3)
+        events = list(self.live_segments.events("UID"))
+        assert events == [("segment", {"start": 0, "end": 1.5,
+                                       "text": "Test", "progress": 100}),
+                          ("done", {"status": "Whispered"})]
+
+    def test_heartbeat(self):
+        events = self.live_segments.events("UID")
+        # The job has not started yet
+        assert next(events) is None
+        self.live_segments.open("UID")
+        self.ts_api.database.change_job_entry("UID", "status", 4)
+        self.live_segments.close("UID", 4)
+        assert list(events)[-1] == ("done", {"status": "Failed"})
+
+    def test_deleted_job(self):
+        events = self.live_segments.events("UID")
+        assert next(events) is None
+        # Deleted before it started
+        self.ts_api.database.delete_job("UID")
+        assert list(events) == [("done", {"status": "error",
+                                          "error": "Job not found"})]
@@ -0,0 +1,64 @@
+import pytest
+
+from packages.File import File
+from utils.metrics import Counter, Histogram, JobMetrics, Registry
+
+
+class TestMetrics:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.registry = Registry()
+        yield
+
+    def test_counter(self):
+        counter = self.registry.register(Counter(
+            "test_total", "Test counter", ["module"]))
+        counter.inc(module='a"b\\c')
+        counter.inc(2, module='a"b\\c')
+        assert self.registry.render() == (
+            "# HELP test_total Test counter\n"
+            "# TYPE test_total counter\n"
+            'test_total{module="a\\"b\\\\c"} 3\n')
+        with pytest.raises(ValueError):
+            counter.inc(model="small")
+        with pytest.raises(ValueError):
+            counter.inc(-1, module="a")
+        with pytest.raises(ValueError):
+            self.registry.register(Counter("test_total", "Duplicate"))
+
+    def test_histogram(self):
+        histogram = self.registry.register(Histogram(
+            "test_seconds", "Test histogram", buckets=(1, 2.5)))
+        histogram.observe(0.5)
+        histogram.observe(2)
+        histogram.observe(10)
+        assert self.registry.render().splitlines()[2:] == [
+            'test_seconds_bucket{le="1"} 1',
+            'test_seconds_bucket{le="2.5"} 2',
+            'test_seconds_bucket{le="+Inf"} 3',
+            "test_seconds_sum 12.5",
+            "test_seconds_count 3"]
+
+    def test_job_metrics(self):
+        job_metrics = JobMetrics()
+        module = File(module_uid="Module")
+        module_entry = File.Entry(module, "UID", 1, status=3,
+                                  whisper_model="small", duration=100,
+                                  finished=1070,
+                                  timings={"enqueued": 1000,
+                                           "dispatched": 1010,
+                                           "transcribe_start": 1020,
+                                           "transcribe_end": 1070})
+        job_metrics.observe(module_entry)
+        text = job_metrics.render()
+        assert ('tsapi_jobs_total{module="Module",model="small",'
+                'status="Whispered"} 1') in text
+        assert ('tsapi_audio_seconds_total{module="Module",model="small"} '
+                '100') in text
+        assert ('tsapi_job_stage_seconds_sum{module="Module",model="small",'
+                'stage="queue"} 10') in text
+        assert ('tsapi_job_stage_seconds_sum{module="Module",model="small",'
+                'stage="total"} 70') in text
+        assert 'stage="download"' not in text
+        assert ('tsapi_realtime_factor_sum{module="Module",model="small"} '
+                '0.5') in text
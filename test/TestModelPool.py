@@ -0,0 +1,49 @@
+import pytest
+
+from core.ModelPool import ModelPool
+
+
+class TestModelPool:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.loaded = []
+
+        def loader(model_name: str) -> object:
+            model = object()
+            self.loaded.append((model_name, model))
+            return model
+
+        self.model_pool: ModelPool = ModelPool(max_instances=1,
+                                               max_ram_usage=100,
+                                               loader=loader)
+        yield
+
+    def test_reuse_model(self):
+        with self.model_pool.checkout("small") as model:
+            first = model
+        with self.model_pool.checkout("small") as model:
+            assert model is first
+        assert len(self.loaded) == 1
+
+    def test_max_instances(self):
+        model = self.model_pool.acquire("small")
+        assert self.model_pool.acquire("small", blocking=False) is None
+        self.model_pool.release("small", model)
+        assert self.model_pool.acquire("small", blocking=False) is model
+
+    def test_evict(self):
+        self.model_pool.preload("small")
+        self.model_pool.preload("medium")
+        assert self.model_pool.evict(force=True) == 2
+        assert self.model_pool.instances("small") == 0
+        self.model_pool.preload("small")
+        assert len(self.loaded) == 3
+
+    def test_load_model_path(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr("core.ModelPool.Model",
+                            lambda *args, **kwargs: calls.append(args))
+        model_pool = ModelPool(models_dir="./models")
+        model_pool.preload("large-v3-turbo-q5_0")
+        # The verified file is loaded, no download by name
+        assert calls == [("./models/ggml-large-v3-turbo-q5_0.bin",)]
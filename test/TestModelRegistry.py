@@ -0,0 +1,52 @@
+import hashlib
+import os
+import tempfile
+
+import pytest
+
+from core.ModelRegistry import ModelRegistry
+
+
+class TestModelRegistry:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.models_dir = self.directory.name
+        for name, data in [("tiny", b"tiny"), ("large-v3-turbo-q5_0", b"q5")]:
+            with open(os.path.join(self.models_dir, f"ggml-{name}.bin"),
+                      "wb") as file:
+                file.write(data)
+        open(os.path.join(self.models_dir, "other.bin"), "wb").close()
+        self.registry = ModelRegistry(self.models_dir)
+        yield
+        self.directory.cleanup()
+
+    def test_scan(self):
+        models = self.registry.scan()
+        assert sorted(models) == ["large-v3-turbo-q5_0", "tiny"]
+        assert models["tiny"].sha256 == hashlib.sha256(b"tiny").hexdigest()
+        assert models["tiny"].quantization == "f16"
+        assert models["large-v3-turbo-q5_0"].quantization == "q5_0"
+        assert models["tiny"].verified is None
+        # Without hashing, files missing in the cache have no checksum
+        open(os.path.join(self.models_dir, "ggml-base.bin"), "wb").close()
+        models = self.registry.scan(hashing=False)
+        assert models["base"].sha256 is None
+        assert (self.registry.ensure("base").sha256
+                == hashlib.sha256(b"").hexdigest())
+        # A new instance takes the checksums from the cache
+        registry = ModelRegistry(self.models_dir)
+        models = registry.scan(hashing=False)
+        assert models["tiny"].sha256 == hashlib.sha256(b"tiny").hexdigest()
+
+    def test_ensure(self):
+        with open(os.path.join(self.models_dir, "SHA256SUMS"), "w") as file:
+            file.write(f"{hashlib.sha256(b'tiny').hexdigest()}  "
+                       f"ggml-tiny.bin\n"
+                       f"{hashlib.sha256(b'other').hexdigest()}  "
+                       f"ggml-large-v3-turbo-q5_0.bin\n")
+        assert self.registry.ensure("tiny").verified is True
+        with pytest.raises(ValueError):
+            self.registry.ensure("large-v3-turbo-q5_0")
+        with pytest.raises(ValueError):
+            self.registry.ensure("unknown")
@@ -0,0 +1,54 @@
+import pytest
+
+from core.ModelRouter import create_router
+from packages.File import File
+
+
+class TestModelRouter:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.module = File()
+        self.router = create_router(
+            "small",
+            rules="priority<=1:large-v3, duration>=7200:large-v3-turbo-q5_0",
+            allowed="medium")
+        yield
+
+    def entry(self, priority: int, duration: float | None = None,
+              whisper_model: str | None = None) -> File.Entry:
+        return File.Entry(self.module, "UID", priority, duration=duration,
+                          whisper_model=whisper_model)
+
+    def test_route(self):
+        assert self.router.route(self.entry(1, 8000)) == "large-v3"
+        assert (self.router.route(self.entry(2, 8000))
+                == "large-v3-turbo-q5_0")
+        assert self.router.route(self.entry(2, 60)) == "small"
+        assert self.router.route(self.entry(2)) == "small"
+        # A requested model takes precedence
+        assert self.router.route(self.entry(1, 8000, "medium")) == "medium"
+        assert self.router.allowed == {"small", "medium", "large-v3",
+                                       "large-v3-turbo-q5_0"}
+
+    def test_signature(self):
+        assert (self.router.signature(self.entry(2))
+                == self.router.signature(self.entry(2, 8000)))
+        assert (self.router.signature(self.entry(1))
+                != self.router.signature(self.entry(2)))
+        assert self.router.signature(self.entry(1, None, "medium")) == "medium"
+        assert self.router.signature(self.entry(2)).startswith("small#")
+        assert self.router.signature(self.entry(1)).startswith("large-v3#")
+        # The same model picked by rules at different positions differs
+        router = create_router(
+            "small",
+            rules="priority<=1:large-v3, duration>=7200:medium, "
+                  "priority<=3:large-v3")
+        assert (router.signature(self.entry(1))
+                != router.signature(self.entry(3)))
+        # Another configuration changes the signature
+        assert (create_router("small").signature(self.entry(1))
+                != create_router("medium").signature(self.entry(1)))
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            create_router("small", rules="size>1:large-v3")
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from core.ResourceMonitor import ResourceMonitor
+from core.TsApi import TsApi
+
+
+class TestResourceMonitor:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        os.environ.setdefault("whisper_model", "small")
+        self.ts_api: TsApi = TsApi()
+        yield
+        self.ts_api.database.close()
+
+    def test_sample(self):
+        monitor: ResourceMonitor = ResourceMonitor(self.ts_api, window=2)
+        for _ in range(3):
+            monitor.samples.append(monitor.sample())
+        assert len(monitor.samples) == 2
+        assert 0 <= monitor.average("ram_usage") <= 100
+        assert monitor.snapshot["queue_length"] >= 0
+
+    def test_admission(self):
+        monitor: ResourceMonitor = ResourceMonitor(
+            self.ts_api, max_storage_usage=100, max_ram_usage=100,
+            max_cpu_usage=400, max_queue_length=10000)
+        assert monitor.admission() is None
+        monitor.max_wait = 1
+        self.ts_api.estimator.wait = lambda: 10
+        assert monitor.admission() == "The predicted wait is too long"
+        assert monitor.retry_after() >= 9
+        monitor.max_queue_length = -1
+        assert monitor.admission() == "The queue is full"
+        monitor.max_ram_usage = -1
+        assert monitor.admission() == "Not enough ram"
+        monitor.max_storage_usage = -1
+        assert monitor.admission() == "Not enough storage"
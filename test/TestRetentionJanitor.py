@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+
+import pytest
+from pywhispercpp.model import Segment
+
+from core.RetentionJanitor import RetentionJanitor
+from core.TsApi import TsApi
+from packages.File import File
+
+
+class TestRetentionJanitor:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        os.environ.setdefault("whisper_model", "small")
+        self.ts_api: TsApi = TsApi()
+        self.database = self.ts_api.database
+        self.uids = ["UID1", "UID2", "UID3"]
+        for uid, status in zip(self.uids, (3, 3, 4)):
+            self.database.add_job(File.Entry(self.ts_api.file_module, uid, 1))
+            if status == 3:
+                self.database.change_job_entry(uid, "whisper_result",
+                                               [Segment(0, 100, "Test")])
+            self.database.change_job_entry(uid, "status", status)
+        self.directory = tempfile.TemporaryDirectory()
+        self.janitor = RetentionJanitor(self.ts_api, ttl={3: 100, 4: 0},
+                                        audio_dir=self.directory.name)
+        yield
+        self.ts_api.file_module.retention_ttl = None
+        self.directory.cleanup()
+        for uid in self.uids:
+            self.database.delete_job(uid)
+        self.database.close()
+
+    def test_expire(self):
+        now = time.time()
+        self.janitor.sweep(now + 50)
+        assert all(self.database.exists_job(uid) for uid in self.uids)
+        self.janitor.sweep(now + 200)
+        assert not self.database.exists_job("UID1")
+        assert not self.database.exists_job("UID2")
+        # Failed jobs are kept forever
+        assert self.database.exists_job("UID3")
+        # The TTL of the module takes precedence
+        self.ts_api.file_module.retention_ttl = 10
+        self.janitor.sweep(now + 20)
+        assert not self.database.exists_job("UID3")
+        assert self.janitor.expired >= 3
+
+    def test_evict(self):
+        self.database.load_result("UID1")
+        jobs = [job for job in self.database.finished_jobs()
+                if job[0] in self.uids]
+        assert len(jobs) == 3
+        size = max(job[5] for job in jobs)
+        self.janitor.max_bytes = size + 10
+        # The least recently read job is removed first
+        assert self.janitor.evict(jobs) == ["UID2"]
+        assert self.database.exists_job("UID1")
+
+    def test_orphans(self):
+        self.database.add_job(File.Entry(self.ts_api.file_module, "UID4", 1))
+        self.uids.append("UID4")
+        now = time.time()
+        old = ("UID4.part", "UID4.pcm", "UID4.pcm.tmp", "UID1", "UID1.part")
+        for file_name in old + ("NEW",):
+            with open(os.path.join(self.directory.name, file_name), "w"):
+                pass
+        for file_name in old:
+            os.utime(os.path.join(self.directory.name, file_name),
+                     (now - 7200, now - 7200))
+        assert self.janitor.sweep_orphans(now) == 2
+        assert sorted(os.listdir(self.directory.name)) == [
+            "NEW", "UID4.part", "UID4.pcm", "UID4.pcm.tmp"]
@@ -0,0 +1,47 @@
+import pytest
+
+from core.SchedulingPolicy import FifoPolicy, SjfPolicy, create_policy
+from packages.File import File
+
+
+class TestSchedulingPolicy:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.module: File = File()
+        yield
+
+    def entry(self, uid: str, priority: int, time: float,
+              duration: float) -> File.Entry:
+        return File.Entry(self.module, uid, priority, time=time,
+                          duration=duration)
+
+    def order(self, policy, entries, now: float):
+        return [entry.uid for entry in sorted(
+            entries, key=lambda entry: policy.key(entry, now))]
+
+    def test_fifo(self):
+        entries = [self.entry("LONG", 1, 0, 10800),
+                   self.entry("SHORT", 1, 10, 300)]
+        assert self.order(FifoPolicy(), entries, 20) == ["LONG", "SHORT"]
+
+    def test_sjf(self):
+        entries = [self.entry("LONG", 1, 0, 10800),
+                   self.entry("SHORT", 1, 10, 300),
+                   self.entry("URGENT", 0, 20, 7200)]
+        assert self.order(SjfPolicy(), entries, 20) == ["URGENT", "SHORT",
+                                                        "LONG"]
+
+    def test_aging(self):
+        long_entry = self.entry("LONG", 1, 0, 10800)
+        # A long job overtakes new short jobs after waiting long enough
+        short_entry = self.entry("SHORT", 1, 11000, 300)
+        assert self.order(SjfPolicy(aging=1), [long_entry, short_entry],
+                          11000) == ["LONG", "SHORT"]
+        assert self.order(SjfPolicy(aging=0), [long_entry, short_entry],
+                          11000) == ["SHORT", "LONG"]
+
+    def test_create_policy(self):
+        assert isinstance(create_policy("fifo"), FifoPolicy)
+        assert create_policy("sjf", aging=0.5).aging == 0.5
+        with pytest.raises(ValueError):
+            create_policy("lifo")
@@ -1,34 +1,26 @@
 import os
-import json
 
+import numpy as np
 import pytest
 
 from packages.File import File
 from core.Transcriber import Transcriber
 from core.TsApi import TsApi
+from utils import audio
 
 
 class TestTranscriber:
     @pytest.fixture(autouse=True)
     def set_up_tear_down(self):
-        if os.path.exists("./data/jobDatabase/UID.json"):
-            os.remove("./data/jobDatabase/UID.json")
         os.environ.setdefault("whisper_model", "small")
         self.ts_api: TsApi = TsApi()
         self.module: File = File()
         self.ts_api.database.add_module(self.module)
         self.module_entry: File.Entry = File.Entry(self.module, "UID", 1)
         self.ts_api.database.add_job(self.module_entry)
-        job_data: str = json.dumps(self.module_entry, default=lambda o:
-                                   o.__dict__)
-        with open("./data/jobDatabase/" + self.module_entry.uid + ".json",
-                  "x") as file:
-            file.write(job_data)
-            file.close()
         yield
-        pass
-        if os.path.exists("./data/jobDatabase/UID.json"):
-            os.remove("./data/jobDatabase/UID.json")
+        self.ts_api.database.delete_job(self.module_entry.uid)
+        self.ts_api.database.close()
 
     def test_init(self):
         os.environ.setdefault("whisper_model", "small")
@@ -38,3 +30,40 @@ class TestTranscriber:
         assert trans.whisper_result is None
         assert trans.whisper_language is None
         assert trans.ts_api == self.ts_api
+
+    def test_chunked_transcribe(self, monkeypatch):
+        class Segment:
+            def __init__(self, t0, t1, text):
+                self.t0 = t0
+                self.t1 = t1
+                self.text = text
+
+        class Model:
+            def transcribe(self, samples, new_segment_callback, **kwargs):
+                segment = Segment(0, len(samples) * 100 // audio.SAMPLE_RATE,
+                                  kwargs["initial_prompt"])
+                new_segment_callback(Segment(segment.t0, segment.t1,
+                                             segment.text))
+                return [segment]
+
+        monkeypatch.setenv("chunked_transcription", "true")
+        monkeypatch.setenv("chunk_length", "2")
+        self.ts_api.model_pool.loader = lambda model_name: Model()
+        self.ts_api.model_pool.max_instances = 2
+        trans: Transcriber = Transcriber(self.ts_api, self.module_entry)
+        samples = np.ones(5 * audio.SAMPLE_RATE, dtype=np.float32)
+        # Silence in the frame starting at 2.01 s
+        samples[32160:32640] = 0
+        self.ts_api.live_segments.open("UID")
+        with self.ts_api.model_pool.checkout("small") as model:
+            result = trans.transcribe(model, "small", samples,
+                                      initial_prompt="Test")
+        assert [(s.t0, s.t1) for s in result] == [(0, 201), (201, 500)]
+        assert [s.text for s in result] == ["Test", "Test"]
+        assert self.ts_api.model_pool.instances("small") == 2
+        # Segments are published on the timeline of the whole audio
+        stream = self.ts_api.live_segments.streams["UID"]
+        assert sorted(stream.segments) == [(0, 2.01, "Test"),
+                                           (2.01, 5, "Test")]
+        assert stream.progress == 100
+        self.ts_api.live_segments.close("UID", 3)
@@ -0,0 +1,48 @@
+import json
+import pickle
+
+import pytest
+from pywhispercpp.model import Segment
+
+from utils import captions
+from utils.database import safe_serialize
+from utils.transcript import Transcript
+
+
+class TestTranscript:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.segments = [Segment(0, 376, " Hello"),
+                         Segment(376, 900, ""),
+                         Segment(900, 134400, " Wörld")]
+        self.transcript = Transcript.from_segments(self.segments)
+        yield
+
+    def test_segments(self):
+        assert len(self.transcript) == 3
+        for segment, original in zip(self.transcript, self.segments):
+            assert (segment.t0, segment.t1, segment.text) == (
+                original.t0, original.t1, original.text)
+        assert self.transcript[-1].text == " Wörld"
+        assert self.transcript[1].text == ""
+        with pytest.raises(IndexError):
+            self.transcript[3]
+        assert len(Transcript.from_segments([])) == 0
+
+    def test_serialize(self):
+        data = json.dumps(self.transcript, default=safe_serialize)
+        restored = Transcript.from_dict(json.loads(data))
+        assert [(s.t0, s.t1, s.text) for s in restored] == [
+            (s.t0, s.t1, s.text) for s in self.transcript]
+        restored = pickle.loads(pickle.dumps(self.transcript))
+        assert restored[2].t1 == 134400
+        # Smaller than one object per segment
+        segments = [Segment(0, 100, " Word") for _ in range(1000)]
+        assert len(json.dumps(Transcript.from_segments(segments),
+                              default=safe_serialize)) < len(
+            json.dumps(segments, default=safe_serialize)) / 2
+
+    def test_render(self):
+        for output_format in captions.MIMETYPES:
+            assert captions.render(self.transcript, output_format) == \
+                captions.render(self.segments, output_format)
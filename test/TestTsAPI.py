@@ -1,13 +1,127 @@
 import os
+import threading
+
+import pytest
 
 from core.TsApi import TsApi
+from packages.File import File
+from utils import audio
 
 
 class TestTsAPI:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        os.environ.setdefault("whisper_model", "small")
+        self.uids = ["UID1", "UID2", "UID3"]
+        yield
+        for uid in self.uids:
+            if os.path.exists(audio.pcm_path(uid)):
+                os.remove(audio.pcm_path(uid))
+            self.ts_api.database.delete_job(uid)
+        self.ts_api.running = False
+        with self.ts_api.scheduler:
+            self.ts_api.scheduler.notify_all()
+        self.ts_api.database.close()
 
     def test_init(self):
-        os.environ.setdefault("whisper_model", "small")
-        ts_api: TsApi = TsApi()
-        assert ts_api.running
-        assert len(ts_api.running_jobs) == 0
-        assert ts_api.file_module is not None
+        self.ts_api: TsApi = TsApi()
+        assert self.ts_api.running
+        assert len(self.ts_api.running_jobs) == 0
+        assert self.ts_api.file_module is not None
+
+    def test_dispatch(self, monkeypatch):
+        monkeypatch.setenv("parallel_workers", "2")
+        self.ts_api: TsApi = TsApi()
+        started = []
+        dispatched = threading.Event()
+
+        def start_job(module_entry):
+            started.append(module_entry)
+            if len(started) == 2:
+                dispatched.set()
+
+        self.ts_api.start_job = start_job
+        thread = threading.Thread(target=self.ts_api.ts_api_thread,
+                                  daemon=True)
+        thread.start()
+        self.ts_api.prefetcher.start_thread()
+        queued = self.ts_api.database.queue.qsize()
+        for uid in self.uids:
+            # Already decoded audio skips the ingestion
+            open(audio.pcm_path(uid), "wb").close()
+            self.ts_api.add_to_queue(1, File.Entry(self.ts_api.file_module,
+                                                   uid, 1))
+        assert dispatched.wait(timeout=2)
+        assert len(self.ts_api.running_jobs) == 2
+        assert self.ts_api.database.queue.qsize() == queued + 1
+        assert all(entry.status == 7 for entry in self.ts_api.running_jobs)
+        assert all(entry.duration == 0 for entry in self.ts_api.running_jobs)
+        assert self.ts_api.dispatch_latency()["max"] < 2
+
+    def test_fair_prefetch(self):
+        self.ts_api: TsApi = TsApi()
+        other = File(module_uid="OtherFileModule")
+        self.uids = [f"A{index}" for index in range(10)] + [
+            f"B{index}" for index in range(3)]
+        for uid in self.uids:
+            module = self.ts_api.file_module if uid[0] == "A" else other
+            self.ts_api.add_to_queue(1, File.Entry(module, uid, 1))
+        # Jobs of B queued behind more than prefetch_depth jobs of A
+        started = []
+        while len(started) < len(self.uids):
+            for module_entry in self.ts_api.prefetcher.next_entries():
+                module_entry.duration = (3600 if module_entry.uid[0] == "A"
+                                         else 60)
+                module_entry.status = 7  # Ready
+            item = self.ts_api.database.queue.take(
+                lambda entry: entry.status == 7, fair=True)
+            started.append(item[1].uid)
+        assert all(uid in started[:6] for uid in ["B0", "B1", "B2"])
+
+    def test_policy_prefetch(self):
+        self.ts_api: TsApi = TsApi()
+        # Durations known from an earlier run, e.g. after a requeue
+        for uid, duration in zip(self.uids, [3600, 1800, 60]):
+            self.ts_api.add_to_queue(1, File.Entry(
+                self.ts_api.file_module, uid, 1, duration=duration))
+        self.ts_api.prefetcher.prefetch_depth = 1
+        assert [module_entry.uid for module_entry in
+                self.ts_api.prefetcher.next_entries()] == ["UID3"]
+
+    def test_module_status(self):
+        self.ts_api: TsApi = TsApi()
+        module_entry = File.Entry(self.ts_api.file_module, "UID1", 1,
+                                  status=3, duration=1800)
+        self.ts_api.running_jobs.append(module_entry)
+        module_status = self.ts_api.module_status()["DefaultFileModule"]
+        assert module_status["running"] == 1
+        self.ts_api.unregister_job(module_entry)
+        module_status = self.ts_api.module_status()["DefaultFileModule"]
+        assert module_status["running"] == 0
+        assert module_status["jobs_per_hour"] == 1
+        assert module_status["audio_hours_per_hour"] == 0.5
+        assert module_status["weight"] == 1
+
+    def test_delete_job(self):
+        self.ts_api: TsApi = TsApi()
+        module = self.ts_api.file_module
+        active = module.queued_or_active
+        queued = self.ts_api.database.queue.qsize()
+        open(audio.pcm_path("UID1"), "wb").close()
+        module_entry = File.Entry(module, "UID1", 1)
+        module.queued_or_active = module.queued_or_active + 1
+        self.ts_api.add_to_queue(1, module_entry)
+        assert self.ts_api.delete_job("UID1")
+        assert self.ts_api.database.queue.qsize() == queued
+        assert module.queued_or_active == active
+        assert not os.path.exists(audio.pcm_path("UID1"))
+        # A job deleted after it was taken out of the queue is not started
+        module_entry = File.Entry(module, "UID2", 1)
+        module.queued_or_active = module.queued_or_active + 1
+        self.ts_api.add_to_queue(1, module_entry)
+        self.ts_api.database.queue.remove("UID2")
+        self.ts_api.running_jobs.append(module_entry)
+        assert self.ts_api.delete_job("UID2")
+        self.ts_api.start_job(module_entry)
+        assert module_entry not in self.ts_api.running_jobs
+        assert module.queued_or_active == active
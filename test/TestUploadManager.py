@@ -0,0 +1,81 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+
+import pytest
+
+from core.UploadManager import (UploadManager, UploadNotFound,
+                                UploadOffsetMismatch)
+
+
+class TestUploadManager:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.upload_dir = os.path.join(self.directory.name, "uploads")
+        self.audio_dir = os.path.join(self.directory.name, "audioInput")
+        os.makedirs(self.audio_dir)
+        self.manager = UploadManager(self.upload_dir, self.audio_dir,
+                                     max_size=100, chunk_size=4)
+        self.metadata = {"priority": 1, "title": None, "callback_url": None}
+        yield
+        self.directory.cleanup()
+
+    def test_upload(self):
+        data = b"0123456789" * 3
+        upload = self.manager.create("UID", self.metadata, len(data))
+        assert self.manager.append(upload, 0, io.BytesIO(data[:10])) == 10
+        # A chunk that does not start at the end is rejected
+        with pytest.raises(UploadOffsetMismatch) as e:
+            self.manager.append(upload, 5, io.BytesIO(data[5:]))
+        assert e.value.offset == 10
+        # The upload is incomplete
+        with pytest.raises(ValueError):
+            self.manager.finish(upload)
+        assert self.manager.append(upload, 10, io.BytesIO(data[10:])) == 30
+        metadata, media_hash = self.manager.finish(upload)
+        assert metadata == self.metadata
+        assert media_hash == hashlib.sha256(data).hexdigest()
+        with open(os.path.join(self.audio_dir, "UID"), "rb") as file:
+            assert file.read() == data
+        assert self.manager.get("UID") is None
+        assert os.listdir(self.upload_dir) == []
+        # A second finalize of the same upload is rejected
+        with pytest.raises(UploadNotFound):
+            self.manager.finish(upload)
+        with open(os.path.join(self.audio_dir, "UID"), "rb") as file:
+            assert file.read() == data
+
+    def test_resume(self):
+        data = b"0123456789" * 3
+        upload = self.manager.create("UID", self.metadata)
+        self.manager.append(upload, 0, io.BytesIO(data[:12]))
+        # A new instance after a restart continues with the received bytes
+        manager = UploadManager(self.upload_dir, self.audio_dir)
+        upload = manager.get("UID")
+        assert upload.offset == 12 and upload.metadata == self.metadata
+        manager.append(upload, 12, io.BytesIO(data[12:]))
+        _, media_hash = manager.finish(upload)
+        assert media_hash == hashlib.sha256(data).hexdigest()
+        assert manager.get("../UID") is None
+
+    def test_max_size(self):
+        with pytest.raises(ValueError):
+            self.manager.create("UID1", self.metadata, 101)
+        upload = self.manager.create("UID2", self.metadata)
+        with pytest.raises(ValueError):
+            self.manager.append(upload, 0, io.BytesIO(b"x" * 101))
+        # The bytes up to the limit are kept
+        assert upload.offset == 100
+
+    def test_expire(self):
+        self.manager.create("UID1", self.metadata)
+        upload = self.manager.create("UID2", self.metadata)
+        now = time.time()
+        assert self.manager.expire(60, now + 30) == 0
+        self.manager.abort(upload)
+        assert self.manager.expire(60, now + 90) == 1
+        assert os.listdir(self.upload_dir) == []
+        assert self.manager.get("UID1") is None
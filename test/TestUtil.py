@@ -1,28 +1,101 @@
+import hashlib
 import io
 import os.path
 import pytest
+import requests
 
 from werkzeug.datastructures import FileStorage
 from utils import util
 
 
+class Response:
+    def __init__(self, status_code, headers, chunks):
+        self.status_code = status_code
+        self.headers = headers
+        self.chunks = chunks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            if chunk is None:
+                raise requests.exceptions.ChunkedEncodingError()
+            yield chunk
+
+
 class TestUtil:
     @pytest.fixture(autouse=True)
     def set_up_tear_down(self):
         yield
         if os.path.exists("data/audioInput/UID"):
             os.remove("data/audioInput/UID")
+        if os.path.exists("data/audioInput/UID.part"):
+            os.remove("data/audioInput/UID.part")
 
     def test_save_file(self):
         file = FileStorage(
             stream=io.BytesIO(bytes("Test", 'UTF-8')),
             filename="UID"
         )
-        util.save_file(file, "UID")
+        assert util.save_file(file, "UID") == hashlib.sha256(
+            bytes("Test", 'UTF-8')).hexdigest()
         with open("./data/audioInput/UID", "r") as file:
             assert file.read() == "Test"
             file.close()
 
+    def test_download_file(self, monkeypatch):
+        content = bytes("Test download", 'UTF-8')
+
+        class Session:
+            def __init__(self):
+                self.ranges = []
+
+            def get(self, url, headers, stream, timeout):
+                self.ranges.append(headers.get("Range"))
+                if "Range" not in headers:
+                    return Response(200, {"Content-Length": "13"},
+                                    [content[:4], None])
+                return Response(206, {"Content-Range": "bytes 4-12/13"},
+                                [content[4:]])
+
+        session = Session()
+        monkeypatch.setattr(util.time, "sleep", lambda seconds: None)
+        # The hash covers both parts of the resumed download
+        assert util.download_file(session, "link", "UID", retries=1) == (
+            hashlib.sha256(content).hexdigest())
+        assert session.ranges == [None, "bytes=4-"]
+        with open("./data/audioInput/UID", "rb") as file:
+            assert file.read() == content
+        assert not os.path.exists("./data/audioInput/UID.part")
+
+    def test_download_file_retry(self, monkeypatch):
+        content = bytes("Test download", 'UTF-8')
+        with open("./data/audioInput/UID.part", "wb") as file:
+            file.write(content)
+
+        class Session:
+            def __init__(self, responses):
+                self.responses = responses
+
+            def get(self, url, headers, stream, timeout):
+                return self.responses.pop(0)
+
+        monkeypatch.setattr(util.time, "sleep", lambda seconds: None)
+        # A server error is retried, a complete part is kept
+        session = Session([Response(503, {}, []),
+                           Response(416, {"Content-Range": "bytes */13"},
+                                    [])])
+        assert util.download_file(session, "link", "UID", retries=1) == (
+            hashlib.sha256(content).hexdigest())
+        assert session.responses == []
+        with pytest.raises(Exception):
+            util.download_file(Session([Response(503, {}, [])] * 2),
+                               "link", "UID2", retries=1)
+
     def test_get_status(self):
         status = {
             0: "Queued",
@@ -0,0 +1,77 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from core.WorkerPool import WorkerLimitExceeded, WorkerPool
+
+
+class TestWorkerPool:
+    @pytest.fixture(autouse=True)
+    def set_up_tear_down(self):
+        self.entries = []
+        self.transcriber = SimpleNamespace(
+            module_entry=SimpleNamespace(uid="UID_MISSING",
+                                         initial_prompt=None),
+            set_entry=lambda entry, value: self.entries.append(
+                (entry, value)),
+            publish=lambda *segment: None)
+        self.worker_pool: WorkerPool = WorkerPool(size=1, n_threads=1,
+                                                  poll_interval=0.1)
+        self.worker_pool.start()
+        yield
+        self.worker_pool.stop()
+
+    def test_failed_job(self):
+        pid = self.worker_pool.workers[0].process.pid
+        with pytest.raises(Exception, match="No such file"):
+            self.worker_pool.run(self.transcriber, "tiny")
+        assert ("whisper_model", "tiny") in self.entries
+        # The worker survives a failed job
+        assert self.worker_pool.workers[0].process.pid == pid
+        assert self.worker_pool.restarts == 0
+        assert len(self.worker_pool.idle) == 1
+
+    def test_restart_dead_worker(self):
+        worker = self.worker_pool.workers[0]
+        worker.process.kill()
+        worker.process.join()
+        with pytest.raises(Exception, match="No such file"):
+            self.worker_pool.run(self.transcriber, "tiny")
+        assert self.worker_pool.restarts == 1
+        assert self.worker_pool.workers[0] is not worker
+        assert self.worker_pool.workers[0].process.is_alive()
+
+    def test_limits(self):
+        worker = self.worker_pool.workers[0]
+        worker.started = time.monotonic() - 10
+        self.worker_pool.check_limits(worker)
+        self.worker_pool.max_runtime = 1
+        with pytest.raises(WorkerLimitExceeded):
+            self.worker_pool.check_limits(worker)
+        self.worker_pool.max_runtime = 0
+        self.worker_pool.max_memory = 0.001
+        with pytest.raises(WorkerLimitExceeded):
+            self.worker_pool.check_limits(worker)
+
+    def test_limits_while_streaming(self):
+        # A worker that sends segments without pause
+        worker = SimpleNamespace(
+            connection=SimpleNamespace(
+                send=lambda job: None, poll=lambda timeout: True,
+                recv=lambda: ("segment", 0, 1, "Text")),
+            process=SimpleNamespace(is_alive=lambda: True, pid=None),
+            uid=None, started=None)
+        restarted = []
+        self.worker_pool.acquire = lambda: worker
+        self.worker_pool.restart = lambda old: restarted.append(old) or old
+        self.worker_pool.max_runtime = 0.3
+        with pytest.raises(Exception, match="runtime exceeded"):
+            self.worker_pool.run(self.transcriber, "tiny")
+        assert restarted == [worker]
+
+    def test_status(self):
+        status = self.worker_pool.status()
+        assert len(status) == 1
+        assert status[0]["alive"]
+        assert status[0]["job"] is None
@@ -18,8 +18,8 @@ class TestUtil:
             filename="UID"
         )
         yield
-        if os.path.exists("./data/jobDatabase/UID.json"):
-            os.remove("./data/jobDatabase/UID.json")
+        self.ts_api.database.delete_job("UID")
+        self.ts_api.database.close()
 
     def test_module_creation(self):
         module: File = File()
@@ -1,4 +1,6 @@
 import os.path
+import threading
+
 import pytest
 
 from core.TsApi import TsApi
@@ -10,9 +12,12 @@ class TestUtil:
     def set_up_tear_down(self):
         os.environ.setdefault("whisper_model", "small")
         self.ts_api: TsApi = TsApi()
+        self.uids = ["UID"]
         yield
-        if os.path.exists("./data/jobDatabase/UID.json"):
-            os.remove("./data/jobDatabase/UID.json")
+        for uid in self.uids:
+            self.ts_api.database.delete_job(uid)
+            self.ts_api.database.queue.remove(uid)
+        self.ts_api.database.close()
 
     def test_module_creation(self):
         module: Opencast = Opencast(max_queue_length=2)
@@ -31,3 +36,47 @@ class TestUtil:
         assert module_entry.time is not None
         assert module_entry.link is not None
         assert module_entry.initial_prompt is not None
+
+    def test_queuing_batch(self):
+        module: Opencast = Opencast(max_queue_length=2)
+        self.uids.extend(["UID1", "UID2", "UID3"])
+        module_entries = [Opencast.Entry(module=module, uid=uid, link="link")
+                          for uid in self.uids[1:]]
+        # All or nothing
+        assert not module.queuing_batch(self.ts_api, module_entries)
+        assert module.queued_or_active == 0
+        assert not self.ts_api.database.exists_job("UID1")
+        assert module.queuing_batch(self.ts_api, module_entries[:2])
+        assert module.queued_or_active == 2
+        assert self.ts_api.database.job_statuses(
+            ["UID1", "UID2", "UID3"]) == {"UID1": 0, "UID2": 0}
+
+    def test_queuing_limit(self):
+        module: Opencast = Opencast(max_queue_length=1)
+        self.uids.extend(["UID1", "UID2"])
+        assert Opencast.Entry(module=module, uid="UID1",
+                              link="link").queuing(self.ts_api)
+        assert not Opencast.Entry(module=module, uid="UID2",
+                                  link="link").queuing(self.ts_api)
+        assert module.queued_or_active == 1
+        assert not self.ts_api.database.exists_job("UID2")
+        # Each module reserves its places under its own lock
+        assert (module.get_queuing_lock()
+                is not Opencast(max_queue_length=1).get_queuing_lock())
+
+    def test_release_slot(self):
+        module: Opencast = Opencast(max_queue_length=1000)
+
+        def reserve_release():
+            for _ in range(1000):
+                module.reserve_slots(limit=module.max_queue_length)
+                module.release_slot()
+
+        threads = [threading.Thread(target=reserve_release)
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # No update of the counter is lost
+        assert module.queued_or_active == 0